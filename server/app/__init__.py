@@ -18,6 +18,20 @@ def create_app():
     app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_FILE_MB', 10)) * 1024 * 1024
     app.config['STORAGE_ROOT'] = os.getenv('STORAGE_ROOT', './storage')
     app.config['ALLOWED_IMAGE_TYPES'] = os.getenv('ALLOWED_IMAGE_TYPES', 'image/jpeg,image/png,image/webp').split(',')
+    app.config['VALIDATE_BATCH_MAX'] = int(os.getenv('VALIDATE_BATCH_MAX', 32))
+    app.config['VALIDATE_MAX_MODELS'] = int(os.getenv('VALIDATE_MAX_MODELS', 16))
+    # Write-behind de imágenes de validación: 1.0 = todas, 0.0 = desactivado, intermedio = muestreo
+    app.config['VALIDATION_PERSIST_RATE'] = float(os.getenv('VALIDATION_PERSIST_RATE', 1.0))
+    # /validate-stream: frames en cola antes de empezar a descartar los más viejos
+    app.config['STREAM_MAX_PENDING'] = int(os.getenv('STREAM_MAX_PENDING', 2))
+    # mode=detect: lado máximo (px) de la imagen de trabajo para detectMultiScale
+    app.config['DETECT_MAX_SIDE'] = int(os.getenv('DETECT_MAX_SIDE', 1600))
+    # 0 = NMS propio (conserva un acierto aislado); >0 = groupRectangles de OpenCV
+    app.config['DETECT_GROUP_THRESHOLD'] = int(os.getenv('DETECT_GROUP_THRESHOLD', 0))
+    # Featurizar cada sample al subirlo (si no, se hace en el primer /train)
+    app.config['FEATURE_STORE_ON_UPLOAD'] = os.getenv('FEATURE_STORE_ON_UPLOAD', '1').lower() in ('1', 'true', 'yes')
+    # Encolar un /train incremental tras cada sample de un modelo ya entrenado
+    app.config['TRAINING_AUTO_INCREMENTAL'] = os.getenv('TRAINING_AUTO_INCREMENTAL', '0').lower() in ('1', 'true', 'yes')
     
     # Initialize database
     init_db()
@@ -42,4 +56,22 @@ def create_app():
     # Store start time in app config
     app.config['START_TIME'] = app_start_time
     
+    # Estado de BD/storage cacheado para /healthcheck y /readiness
+    from app.api.health import health_monitor
+    health_monitor.start(app.config['STORAGE_ROOT'])
+    
+    # Workers de entrenamiento + recuperación de jobs que quedaron en cola/corriendo
+    from app.services.scheduler import training_scheduler
+    training_scheduler.start()
+    if os.getenv('TRAINING_RECOVER_ON_STARTUP', '1').lower() in ('1', 'true', 'yes'):
+        try:
+            training_scheduler.recover()
+        except Exception as e:
+            print(f"[TRAIN] recovery failed: {e}")
+    
+    # Precalentamiento opcional: carga en paralelo todos los modelos 'ready'
+    if os.getenv('INFERENCE_WARMUP', '0').lower() in ('1', 'true', 'yes'):
+        from app.services.inference import InferenceService
+        InferenceService.start_warmup(int(os.getenv('INFERENCE_WARMUP_WORKERS', 4)))
+    
     return app
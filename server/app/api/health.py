@@ -1,33 +1,114 @@
 import os
 import time
+import threading
 from flask import Blueprint, jsonify, current_app
-from app.db.models import engine
+from sqlalchemy import text
+from app.db import models as db_models
+from app.services.inference import InferenceService
+from app.services.model_cache import model_meta_cache
+from app.services.admission import admission_controller
+from app.services.scheduler import training_scheduler
 
 health_bp = Blueprint('health', __name__)
 
+
+class HealthMonitor:
+    """
+    Estado de BD/storage cacheado. Un hilo de fondo lo refresca cada
+    'interval' segundos, así los probes del balanceador no abren conexiones.
+    """
+
+    def __init__(self, interval: float = 10.0):
+        self.interval = max(1.0, float(interval))
+        self.storage_root = None
+        self.db_healthy = False
+        self.storage_healthy = False
+        self.checked_at = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, storage_root: str):
+        with self._lock:
+            self.storage_root = storage_root
+            if self._thread and self._thread.is_alive():
+                return
+            self.refresh()
+            self._thread = threading.Thread(target=self._run, name='health-monitor', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.refresh()
+
+    def refresh(self):
+        # Check database connection
+        db_healthy = False
+        try:
+            with db_models.engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+            db_healthy = True
+        except Exception:
+            pass
+
+        # Check storage directory
+        storage_root = self.storage_root
+        storage_healthy = bool(storage_root) and os.path.isdir(storage_root)
+
+        self.db_healthy = db_healthy
+        self.storage_healthy = storage_healthy
+        self.checked_at = time.time()
+
+    def snapshot(self) -> dict:
+        return {
+            'db': self.db_healthy,
+            'storage': self.storage_healthy,
+            'checked_at': self.checked_at,
+            'age_seconds': round(time.time() - self.checked_at, 3) if self.checked_at else None,
+        }
+
+
+health_monitor = HealthMonitor(float(os.getenv('HEALTH_CACHE_SECONDS', 10)))
+
+
 @health_bp.route('/healthcheck', methods=['GET'])
 def healthcheck():
-    # Check database connection
-    db_healthy = False
-    try:
-        with engine.connect() as conn:
-            conn.execute('SELECT 1')
-        db_healthy = True
-    except:
-        pass
-    
-    # Check storage directory
-    storage_root = current_app.config['STORAGE_ROOT']
-    storage_healthy = os.path.exists(storage_root) and os.path.isdir(storage_root)
-    
+    status = health_monitor.snapshot()
+
     # Calculate uptime
     start_time = current_app.config.get('START_TIME', time.time())
     uptime_seconds = int(time.time() - start_time)
-    
+
     return jsonify({
-        'status': 'healthy' if (db_healthy) else 'unhealthy',
+        'status': 'healthy' if status['db'] else 'unhealthy',
         'version': '1.0.0',
-        'db': db_healthy,
-        'storage': storage_healthy,
-        'uptime_seconds': uptime_seconds
+        'db': status['db'],
+        'storage': status['storage'],
+        'checked_at': status['checked_at'],
+        'uptime_seconds': uptime_seconds,
+        'model_cache': InferenceService.cache_stats(),
+        'prediction_cache': InferenceService.prediction_cache_stats(),
+        'model_meta_cache': model_meta_cache.stats(),
+        'admission': admission_controller.stats(),
+        'training': training_scheduler.stats()
     }), 200
+
+
+@health_bp.route('/readiness', methods=['GET'])
+def readiness():
+    """
+    200 cuando el proceso puede servir: BD accesible y precalentamiento
+    terminado (o desactivado). 503 mientras carga modelos.
+    """
+    status = health_monitor.snapshot()
+    warmup = InferenceService.warmup_status()
+    warm = warmup['state'] in ('done', 'disabled', 'failed')
+    ready = bool(status['db']) and warm
+
+    return jsonify({
+        'ready': ready,
+        'db': status['db'],
+        'storage': status['storage'],
+        'warmup': warmup,
+        'model_cache': InferenceService.cache_stats()
+    }), 200 if ready else 503
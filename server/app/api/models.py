@@ -1,9 +1,12 @@
+import os
 import uuid
 from flask import Blueprint, request, jsonify, current_app
 from app.db.models import SessionLocal
 from app.db.repositories import ModelRepository, SampleRepository
 from app.utils.errors import APIError
 from app.services.training import TrainingService
+from app.services.scheduler import TrainingQueueFullError
+from app.services.evaluation import EvaluationService
 
 models_bp = Blueprint('models', __name__)
 
@@ -86,6 +89,27 @@ def train_model():
     if not model_uuid:
         raise APIError('UUID is required', 400, {'field': 'uuid'})
     
+    # Proyección PCA opcional (0 = HOG completo; ausente = TRAINING_PCA_DIM)
+    pca_dim = data.get('pca_dim')
+    if pca_dim is not None:
+        try:
+            pca_dim = int(pca_dim)
+        except (TypeError, ValueError):
+            raise APIError('pca_dim must be an integer', 400, {'field': 'pca_dim'})
+        if pca_dim < 0:
+            raise APIError('pca_dim must be >= 0', 400, {'field': 'pca_dim'})
+    
+    # full (default), incremental (actualiza la versión activa con los samples nuevos)
+    # u out_of_core (SGD sobre features en disco, para datasets que no caben en RAM)
+    mode = data.get('mode') or 'full'
+    if mode not in ('full', 'incremental', 'out_of_core'):
+        raise APIError("mode must be 'full', 'incremental' or 'out_of_core'", 400, {'field': 'mode'})
+    
+    # Búsqueda de C / pesos de clase por k-fold CV (ausente = TRAINING_TUNE)
+    tune = data.get('tune')
+    if tune is not None and not isinstance(tune, bool):
+        raise APIError('tune must be a boolean', 400, {'field': 'tune'})
+    
     db = SessionLocal()
     try:
         # Check if model exists
@@ -93,17 +117,123 @@ def train_model():
         if not model:
             raise APIError('Model not found', 404, {'uuid': model_uuid})
         
-        # Start training
-        job_id = TrainingService.start_training(model_uuid)
+        # Encolar (un /train repetido del mismo modelo reutiliza el job en cola)
+        try:
+            job_id, coalesced = TrainingService.start_training(model_uuid, pca_dim=pca_dim, mode=mode, tune=tune)
+        except TrainingQueueFullError as e:
+            raise APIError(str(e), 503, {'uuid': model_uuid}, headers={'Retry-After': '30'})
         
         return jsonify({
             'job_id': job_id,
-            'status': 'queued'
+            'status': 'queued',
+            'coalesced': coalesced
         }), 202
     finally:
         db.close()
 
 
+@models_bp.route('/evaluate', methods=['POST'])
+def evaluate_model():
+    """
+    Encola una evaluación offline de una versión del modelo.
+
+    Expects JSON body: { "uuid": "<model_uuid>", "version": 3, "sources": ["samples", "validations"],
+                         "validations": ["<sha256>.jpg", ...], "labels": {"<sha256>.jpg": "positive"},
+                         "threshold": 0.8, "limit": 100000 }
+    Todo salvo uuid es opcional (por defecto: versión activa, samples + todas las validaciones).
+    """
+    data = request.get_json()
+    if not data:
+        raise APIError('Invalid JSON', 400)
+
+    model_uuid = data.get('uuid')
+    if not model_uuid:
+        raise APIError('UUID is required', 400, {'field': 'uuid'})
+
+    version = data.get('version')
+    if version is not None and (not isinstance(version, int) or version < 1):
+        raise APIError('version must be a positive integer', 400, {'field': 'version'})
+
+    sources = data.get('sources') or list(EvaluationService.SOURCES)
+    if not isinstance(sources, list) or not sources or any(s not in EvaluationService.SOURCES for s in sources):
+        raise APIError("sources must be a list of 'samples' and/or 'validations'", 400, {'field': 'sources'})
+
+    validations = data.get('validations')
+    if validations is not None and (
+        not isinstance(validations, list)
+        or any(not isinstance(v, str) or not v or v != os.path.basename(v) for v in validations)
+    ):
+        raise APIError('validations must be a list of file names', 400, {'field': 'validations'})
+
+    labels = data.get('labels') or {}
+    if not isinstance(labels, dict) or any(v not in ('positive', 'negative') for v in labels.values()):
+        raise APIError('labels must map file names to "positive" or "negative"', 400, {'field': 'labels'})
+
+    threshold = data.get('threshold')
+    if threshold is not None:
+        try:
+            threshold = float(threshold)
+        except (TypeError, ValueError):
+            raise APIError('threshold must be a number', 400, {'field': 'threshold'})
+        if not 0.0 <= threshold <= 1.0:
+            raise APIError('threshold must be between 0 and 1', 400, {'field': 'threshold'})
+
+    limit = data.get('limit')
+    if limit is not None and (not isinstance(limit, int) or limit < 1):
+        raise APIError('limit must be a positive integer', 400, {'field': 'limit'})
+
+    db = SessionLocal()
+    try:
+        model = ModelRepository.get_by_uuid(db, model_uuid)
+        if not model:
+            raise APIError('Model not found', 404, {'uuid': model_uuid})
+        if not model.artifact_path:
+            raise APIError('Model has not been trained', 409, {'uuid': model_uuid})
+        try:
+            EvaluationService.version_artifact(current_app.config['STORAGE_ROOT'], model, version)
+        except FileNotFoundError:
+            raise APIError('Model version not found', 404, {'uuid': model_uuid, 'version': version})
+    finally:
+        db.close()
+
+    evaluation_id = EvaluationService.start_evaluation(
+        model_uuid, version=version, sources=sources, validations=validations,
+        labels=labels, threshold=threshold, limit=limit
+    )
+    return jsonify({
+        'evaluation_id': evaluation_id,
+        'status': 'queued'
+    }), 202
+
+
+@models_bp.route('/evaluate/<model_uuid>/<evaluation_id>', methods=['GET'])
+def get_evaluation(model_uuid, evaluation_id):
+    """
+    Estado / resultado de una evaluación. Los scores por imagen se paginan
+    con ?offset=0&limit=100 (limit=0 los omite).
+    """
+    try:
+        uuid.UUID(model_uuid)
+        uuid.UUID(evaluation_id)
+    except ValueError:
+        raise APIError('Evaluation not found', 404, {'evaluation_id': evaluation_id})
+
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', 100, type=int)
+    if offset < 0 or limit < 0:
+        raise APIError('offset and limit must be >= 0', 400)
+
+    result = EvaluationService.load_result(current_app.config['STORAGE_ROOT'], model_uuid, evaluation_id)
+    if result is None:
+        raise APIError('Evaluation not found', 404, {'evaluation_id': evaluation_id})
+
+    scores = result.pop('scores', None)
+    if scores is not None:
+        result['scores_total'] = len(scores)
+        result['scores'] = scores[offset:offset + limit]
+    return jsonify(result), 200
+
+
 @models_bp.route('/counts', methods=['POST'])
 def get_model_counts():
     """
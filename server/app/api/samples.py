@@ -6,6 +6,9 @@ from app.db.repositories import ModelRepository, SampleRepository
 from app.utils.errors import APIError
 from app.utils.files import validate_image_file
 from app.services.storage import StorageService
+from app.services.training import TrainingService
+from app.services.feature_store import feature_store_enabled, submit_background
+from app.services.scheduler import TrainingQueueFullError
 
 # --- Helpers ---
 def _resolve_storage_path(storage_root: str, path_str: str) -> str:
@@ -104,6 +107,17 @@ def upload_sample():
         # Increment sample count
         ModelRepository.increment_sample_count(db, model_uuid, sample_type)
         
+        # HOG del sample al almacén de features en segundo plano (el /train no lo recalcula)
+        if current_app.config['FEATURE_STORE_ON_UPLOAD'] and feature_store_enabled():
+            submit_background(TrainingService.store_sample_features, storage_root, sha256, file_path)
+        
+        # Actualización incremental del modelo ya entrenado (se coalesce con la que esté en cola)
+        if current_app.config['TRAINING_AUTO_INCREMENTAL'] and model.status == 'ready':
+            try:
+                TrainingService.start_training(model_uuid, mode='incremental')
+            except TrainingQueueFullError:
+                pass
+        
         return jsonify({
             'sample_id': sample.id,
             'path': sample.file_path,
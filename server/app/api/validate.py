@@ -1,12 +1,18 @@
 # app/api/validate.py
+import json
 import uuid as _uuid
-from flask import Blueprint, request, jsonify, current_app
+from contextlib import contextmanager
+from flask import Blueprint, Response, request, jsonify, current_app
+from werkzeug.wsgi import LimitedStream
 from app.db.models import SessionLocal
-from app.db.repositories import ModelRepository, PredictionRepository
+from app.db.repositories import PredictionRepository
 from app.utils.errors import APIError
 from app.utils.files import validate_image_file
 from app.services.storage import StorageService
-from app.services.inference import InferenceService  # deja tu import como lo tienes
+from app.services.inference import InferenceService, ModelNotLinearError  # deja tu import como lo tienes
+from app.services.model_cache import model_meta_cache
+from app.services.streaming import FrameStreamValidator
+from app.services.admission import admission_controller, OverloadedError
 
 validate_bp = Blueprint('validate', __name__)
 
@@ -54,10 +60,189 @@ def _extract_uuid_from_request() -> str:
 
     raise APIError('UUID is required', 400, {'field': 'uuid'})
 
+def _overloaded(retry_after: int, reason: str) -> APIError:
+    return APIError(
+        'Service overloaded, retry later', 503,
+        {'retry_after': retry_after, 'reason': reason},
+        headers={'Retry-After': str(retry_after)}
+    )
+
+def _admission_key(model_uuids: list[str]) -> str:
+    """
+    Clave de la cola justa. Un request de varios modelos se encola bajo la
+    combinación (uuids ordenados), no bajo el primero: tiene su propio turno
+    y no consume el de un modelo ni depende del orden en que vinieron.
+    """
+    if len(model_uuids) == 1:
+        return model_uuids[0]
+    return ','.join(sorted(model_uuids))
+
+@contextmanager
+def _admitted(key: str, cost: int = 1):
+    """
+    Capacidad de inferencia para 'cost' imágenes (cola justa por 'key').
+    Sin capacidad o vencido el plazo en cola se responde 503 + Retry-After.
+    """
+    try:
+        with admission_controller.slot(key, cost):
+            yield
+    except OverloadedError as e:
+        raise _overloaded(e.retry_after, str(e))
+
+def _extract_uuid_list_from_request() -> list[str] | None:
+    """
+    Lista de modelos para validar una misma imagen contra varios.
+    Acepta 'uuids' repetido o separado por comas (form/query) o lista en JSON.
+    Devuelve None si no se envió.
+    """
+    raw = request.form.getlist('uuids') or request.args.getlist('uuids')
+    if not raw and request.is_json:
+        body = request.get_json(silent=True) or {}
+        val = body.get('uuids')
+        raw = val if isinstance(val, list) else ([val] if val else [])
+    if not raw:
+        return None
+
+    uuids = []
+    for item in raw:
+        for val in str(item).split(','):
+            val = val.strip()
+            if not val:
+                continue
+            try:
+                _uuid.UUID(val)
+            except Exception:
+                raise APIError('Invalid UUID format', 422, {'uuid': val})
+            if val not in uuids:
+                uuids.append(val)
+    if not uuids:
+        raise APIError('UUID is required', 400, {'field': 'uuids'})
+    return uuids
+
+def _validate_against_models(model_uuids, threshold, file, mime_type):
+    """Una imagen, varios modelos: un decode + un HOG + un GEMM."""
+    max_models = int(current_app.config.get('VALIDATE_MAX_MODELS', 16))
+    if len(model_uuids) > max_models:
+        raise APIError(
+            f'Too many models. Maximum per request: {max_models}',
+            422,
+            {'field': 'uuids', 'count': len(model_uuids), 'max': max_models}
+        )
+
+    db = SessionLocal()
+    try:
+        models = model_meta_cache.get_many(model_uuids)
+        missing = [u for u in model_uuids if u not in models]
+        if missing:
+            raise APIError('Model not found', 404, {'uuids': missing})
+
+        data, sha256, _size = StorageService.read_upload(file)
+
+        refs = [
+            (u, models[u].version, threshold if threshold is not None else models[u].threshold)
+            for u in model_uuids
+        ]
+        try:
+            # Una imagen: un decode + HOG compartido por todos los modelos
+            with _admitted(_admission_key(model_uuids)):
+                results = InferenceService.predict_models(refs, data, sha256)
+        except ValueError:
+            raise APIError('Image could not be decoded', 422, {'field': 'image'})
+
+        storage_root = current_app.config['STORAGE_ROOT']
+        persist_rate = current_app.config['VALIDATION_PERSIST_RATE']
+        rows = []
+        for r in results:
+            rows.append({
+                'request_id': str(_uuid.uuid4()),
+                'model_uuid': r['uuid'],
+                'source_path': StorageService.persist_validation_image(
+                    storage_root, r['uuid'], data, sha256, mime_type, persist_rate
+                ),
+                'approved': r['approved'],
+                'confidence': r['confidence'],
+                'threshold': r['threshold'],
+            })
+        PredictionRepository.create_many(db, rows)
+
+        return jsonify({
+            'approved': all(row['approved'] for row in rows),
+            'results': [
+                {
+                    'uuid': row['model_uuid'],
+                    'approved': row['approved'],
+                    'confidence': row['confidence'],
+                    'threshold': row['threshold'],
+                    'request_id': row['request_id']
+                }
+                for row in rows
+            ]
+        }), 200
+    finally:
+        db.close()
+
+def _detect_regions(model_uuid, threshold, file, mime_type):
+    """
+    mode=detect: el vector del modelo lineal se usa como detector HOG de
+    OpenCV (detectMultiScale) y se devuelven cajas con score.
+    Form-data opcional: scale (>1, def. 1.05), win_stride (px, def. 8).
+    """
+    scale = request.form.get('scale', 1.05, type=float)
+    win_stride = request.form.get('win_stride', 8, type=int)
+
+    db = SessionLocal()
+    try:
+        model = model_meta_cache.get(model_uuid)
+        if not model:
+            raise APIError('Model not found', 404, {'uuid': model_uuid})
+        if threshold is None:
+            threshold = model.threshold
+
+        data, sha256, _size = StorageService.read_upload(file)
+        try:
+            with _admitted(model_uuid):
+                result = InferenceService.detect(
+                    model_uuid, data, threshold, model.version,
+                    scale=scale, win_stride=win_stride,
+                    max_side=current_app.config['DETECT_MAX_SIDE'],
+                    group_threshold=current_app.config['DETECT_GROUP_THRESHOLD']
+                )
+        except ValueError:
+            raise APIError('Image could not be decoded', 422, {'field': 'image'})
+        except ModelNotLinearError:
+            raise APIError('Detection mode requires a linear model', 422, {'uuid': model_uuid})
+
+        storage_root = current_app.config['STORAGE_ROOT']
+        file_path = StorageService.persist_validation_image(
+            storage_root, model_uuid, data, sha256, mime_type,
+            current_app.config['VALIDATION_PERSIST_RATE']
+        )
+
+        request_id = str(_uuid.uuid4())
+        PredictionRepository.create(
+            db, request_id, model_uuid, file_path,
+            result['approved'], result['confidence'], threshold,
+            refresh=False
+        )
+
+        return jsonify({
+            'mode': 'detect',
+            'approved': result['approved'],
+            'confidence': result['confidence'],
+            'threshold': threshold,
+            'count': len(result['detections']),
+            'detections': result['detections'],
+            'image_size': result['image_size'],
+            'request_id': request_id
+        }), 200
+    finally:
+        db.close()
+
 @validate_bp.route('/validate', methods=['POST'])
 def validate_image():
-    # UUID (robusto)
-    model_uuid = _extract_uuid_from_request()
+    # Varios modelos para la misma imagen (uuids=a,b,c) o uno solo (uuid)
+    model_uuids = _extract_uuid_list_from_request()
+    model_uuid = None if model_uuids else _extract_uuid_from_request()
 
     # threshold (igual que antes: desde form)
     threshold = request.form.get('threshold', type=float)
@@ -72,31 +257,48 @@ def validate_image():
     max_size_mb = int(current_app.config['MAX_CONTENT_LENGTH'] / (1024 * 1024))
     mime_type, size_bytes = validate_image_file(file, allowed_types, max_size_mb)
 
+    if model_uuids:
+        return _validate_against_models(model_uuids, threshold, file, mime_type)
+
+    # Modo detección: ventana deslizante multi-escala sobre la imagen completa
+    if (request.form.get('mode') or request.args.get('mode') or '').lower() == 'detect':
+        return _detect_regions(model_uuid, threshold, file, mime_type)
+
     db = SessionLocal()
     try:
-        # Modelo existente
-        model = ModelRepository.get_by_uuid(db, model_uuid)
+        # Modelo existente (metadatos cacheados: sin lectura a MySQL en un hit;
+        # la sesión solo abre conexión para el INSERT de auditoría)
+        model = model_meta_cache.get(model_uuid)
         if not model:
             raise APIError('Model not found', 404, {'uuid': model_uuid})
 
         # Umbral
         if threshold is None:
-            threshold = float(model.threshold)
+            threshold = model.threshold
+
+        # Imagen en memoria: se decodifica directo del buffer del request
+        data, sha256, _size = StorageService.read_upload(file)
 
-        # Guardar imagen de validación
+        # Inferencia (un sha256 repetido reutiliza la probabilidad cacheada)
+        try:
+            with _admitted(model_uuid):
+                result = InferenceService.predict(model_uuid, data, threshold, model.version, sha256)
+        except ValueError:
+            raise APIError('Image could not be decoded', 422, {'field': 'image'})
+
+        # Persistencia write-behind (opcional / muestreada); no bloquea la respuesta
         storage_root = current_app.config['STORAGE_ROOT']
-        file_path, _size = StorageService.save_validation_image(
-            storage_root, model_uuid, file, mime_type
+        file_path = StorageService.persist_validation_image(
+            storage_root, model_uuid, data, sha256, mime_type,
+            current_app.config['VALIDATION_PERSIST_RATE']
         )
 
-        # Inferencia
-        result = InferenceService.predict(model_uuid, file_path, threshold)
-
         # Auditoría
         request_id = str(_uuid.uuid4())
         PredictionRepository.create(
             db, request_id, model_uuid, file_path,
-            result['approved'], result['confidence'], threshold
+            result['approved'], result['confidence'], threshold,
+            refresh=False
         )
 
         return jsonify({
@@ -107,3 +309,167 @@ def validate_image():
         }), 200
     finally:
         db.close()
+
+@validate_bp.route('/validate-batch', methods=['POST'])
+def validate_batch():
+    """
+    Valida N imágenes contra un mismo modelo en una sola llamada.
+    Form-data: uuid, threshold (opcional), images (repetido; también acepta 'image').
+    """
+    model_uuid = _extract_uuid_from_request()
+    threshold = request.form.get('threshold', type=float)
+
+    files = request.files.getlist('images') or request.files.getlist('image')
+    if not files:
+        raise APIError('No image files provided', 400, {'field': 'images'})
+
+    max_batch = int(current_app.config.get('VALIDATE_BATCH_MAX', 32))
+    if len(files) > max_batch:
+        raise APIError(
+            f'Too many images. Maximum per batch: {max_batch}',
+            422,
+            {'field': 'images', 'count': len(files), 'max': max_batch}
+        )
+
+    allowed_types = current_app.config['ALLOWED_IMAGE_TYPES']
+    max_size_mb = int(current_app.config['MAX_CONTENT_LENGTH'] / (1024 * 1024))
+    mime_types = [validate_image_file(f, allowed_types, max_size_mb)[0] for f in files]
+
+    db = SessionLocal()
+    try:
+        model = model_meta_cache.get(model_uuid)
+        if not model:
+            raise APIError('Model not found', 404, {'uuid': model_uuid})
+
+        if threshold is None:
+            threshold = model.threshold
+
+        uploads = [StorageService.read_upload(f) for f in files]
+
+        # Inferencia vectorizada (una matriz, un producto) sobre los buffers
+        try:
+            # Se cobra por imagen: el lote no cuenta como un solo request
+            with _admitted(model_uuid, cost=len(uploads)):
+                results = InferenceService.predict_batch(
+                    model_uuid, [u[0] for u in uploads], threshold, model.version,
+                    [u[1] for u in uploads]
+                )
+        except ValueError:
+            raise APIError('Image could not be decoded', 422, {'field': 'images'})
+
+        storage_root = current_app.config['STORAGE_ROOT']
+        persist_rate = current_app.config['VALIDATION_PERSIST_RATE']
+        file_paths = [
+            StorageService.persist_validation_image(storage_root, model_uuid, data, sha256, mt, persist_rate)
+            for (data, sha256, _size), mt in zip(uploads, mime_types)
+        ]
+
+        # Auditoría en un solo INSERT
+        rows = [
+            {
+                'request_id': str(_uuid.uuid4()),
+                'model_uuid': model_uuid,
+                'source_path': fp,
+                'approved': r['approved'],
+                'confidence': r['confidence'],
+                'threshold': threshold,
+            }
+            for fp, r in zip(file_paths, results)
+        ]
+        PredictionRepository.create_many(db, rows)
+
+        return jsonify({
+            'threshold': threshold,
+            'count': len(rows),
+            'items': [
+                {
+                    'index': i,
+                    'filename': f.filename,
+                    'approved': row['approved'],
+                    'confidence': row['confidence'],
+                    'request_id': row['request_id']
+                }
+                for i, (f, row) in enumerate(zip(files, rows))
+            ]
+        }), 200
+    finally:
+        db.close()
+
+def _raw_request_stream():
+    """
+    Cuerpo del request sin el límite global MAX_CONTENT_LENGTH (un stream de
+    cámara es indefinido). Con Content-Length se respeta ese largo; con
+    Transfer-Encoding: chunked se requiere un servidor que marque el fin.
+    """
+    environ = request.environ
+    stream = environ['wsgi.input']
+    if request.content_length is not None:
+        return LimitedStream(stream, request.content_length)
+    if environ.get('wsgi.input_terminated'):
+        return stream
+    raise APIError('Streaming requires Content-Length or chunked transfer support', 411)
+
+@validate_bp.route('/validate-stream', methods=['POST'])
+def validate_stream():
+    """
+    Valida un flujo de frames JPEG (MJPEG multipart/x-mixed-replace o JPEGs
+    concatenados, idealmente con Transfer-Encoding: chunked).
+    Query (no form-data): uuid, threshold (opcional), smoothing (0..0.99, EMA; 0 = sin suavizado).
+    Respuesta: NDJSON, una línea por frame + una línea final de resumen.
+    Si al abrir no hay capacidad de inferencia responde 503 + Retry-After;
+    los lotes rechazados a mitad de stream salen como {'error': 'overloaded'}.
+    Solo se escribe UNA fila de auditoría por stream.
+    """
+    # Solo query string: tocar request.form consumiría/limitaría el cuerpo
+    model_uuid = (request.args.get('uuid') or request.args.get('model_uuid') or '').strip()
+    if not model_uuid:
+        raise APIError('UUID is required', 400, {'field': 'uuid'})
+    try:
+        _uuid.UUID(model_uuid)
+    except Exception:
+        raise APIError('Invalid UUID format', 422, {'uuid': model_uuid})
+    threshold = request.args.get('threshold', type=float)
+    smoothing = request.args.get('smoothing', 0.0, type=float)
+
+    model = model_meta_cache.get(model_uuid)
+    if not model:
+        raise APIError('Model not found', 404, {'uuid': model_uuid})
+    if threshold is None:
+        threshold = model.threshold
+
+    # Chequeo sin bloquear ni reservar: con la cola llena 503 + Retry-After
+    # como el resto de rutas; luego cada lote de frames se admite al puntuarse
+    if not admission_controller.has_capacity():
+        raise _overloaded(admission_controller.retry_after(), 'Inference queue is full')
+
+    validator = FrameStreamValidator(
+        model_uuid, model.version, threshold, _raw_request_stream(),
+        smoothing=smoothing,
+        max_pending=current_app.config['STREAM_MAX_PENDING'],
+        max_frame_bytes=current_app.config['MAX_CONTENT_LENGTH'],
+        admission=admission_controller,
+    )
+
+    def generate():
+        yield from validator.events()
+
+        summary = validator.summary()
+        if validator.scored:
+            request_id = str(_uuid.uuid4())
+            db = SessionLocal()
+            try:
+                PredictionRepository.create(
+                    db, request_id, model_uuid, None,
+                    summary['approved'], summary['confidence'], threshold,
+                    refresh=False
+                )
+            finally:
+                db.close()
+            summary['request_id'] = request_id
+        yield json.dumps(summary) + "\n"
+
+    return Response(
+        generate(),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
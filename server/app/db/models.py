@@ -1,6 +1,6 @@
 import os
 from datetime import datetime
-from sqlalchemy import create_engine, Column, String, Integer, BigInteger, Text, DateTime, Enum, DECIMAL, ForeignKey, Index, JSON
+from sqlalchemy import create_engine, Column, String, Integer, BigInteger, Text, DateTime, Enum, DECIMAL, ForeignKey, Index, JSON, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 import pymysql
@@ -61,8 +61,18 @@ class TrainingJob(Base):
     finished_at = Column(DateTime)
     metrics = Column(JSON)
     error_message = Column(Text)
+    # Reparto entre workers: quién lo tiene y hasta cuándo (lease renovado por heartbeat)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    worker_id = Column(String(128))
+    heartbeat_at = Column(DateTime)
+    lease_expires_at = Column(DateTime)
+    attempts = Column(Integer, nullable=False, default=0)
     
     model = relationship('Model', back_populates='training_jobs')
+    
+    __table_args__ = (
+        Index('idx_training_jobs_status', 'status'),
+    )
 
 class Prediction(Base):
     __tablename__ = 'predictions'
@@ -112,10 +122,31 @@ def init_db():
     
     # Create all tables
     Base.metadata.create_all(engine)
+    _migrate_training_jobs(engine)
     
     # Create session factory
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Columnas agregadas a training_jobs después de la versión inicial
+# (create_all no altera tablas existentes)
+_TRAINING_JOB_COLUMNS = (
+    ('created_at', 'created_at DATETIME NULL'),
+    ('worker_id', 'worker_id VARCHAR(128) NULL'),
+    ('heartbeat_at', 'heartbeat_at DATETIME NULL'),
+    ('lease_expires_at', 'lease_expires_at DATETIME NULL'),
+    ('attempts', 'attempts INT NOT NULL DEFAULT 0'),
+)
+
+def _migrate_training_jobs(engine):
+    inspector = inspect(engine)
+    existing = {c['name'] for c in inspector.get_columns('training_jobs')}
+    missing = [ddl for name, ddl in _TRAINING_JOB_COLUMNS if name not in existing]
+    with engine.begin() as conn:
+        for ddl in missing:
+            conn.execute(text(f"ALTER TABLE training_jobs ADD COLUMN {ddl}"))
+        if 'idx_training_jobs_status' not in {i['name'] for i in inspector.get_indexes('training_jobs')}:
+            conn.execute(text("CREATE INDEX idx_training_jobs_status ON training_jobs (status)"))
+
 def get_db():
     db = SessionLocal()
     try:
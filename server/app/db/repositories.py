@@ -1,6 +1,6 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, insert, or_, and_, select
 from app.db.models import Model, Sample, TrainingJob, Prediction
 
 class ModelRepository:
@@ -23,6 +23,13 @@ class ModelRepository:
     def get_by_uuid(db: Session, uuid: str):
         return db.query(Model).filter(Model.uuid == uuid).first()
     
+    @staticmethod
+    def get_many_by_uuid(db: Session, uuids: list[str]):
+        """Return {uuid: Model} for the given uuids in a single query."""
+        if not uuids:
+            return {}
+        return {m.uuid: m for m in db.query(Model).filter(Model.uuid.in_(uuids)).all()}
+    
     @staticmethod
     def get_by_name(db: Session, name: str):
         return db.query(Model).filter(Model.name == name).first()
@@ -34,6 +41,10 @@ class ModelRepository:
         items = query.offset((page - 1) * limit).limit(limit).all()
         return items, total
     
+    @staticmethod
+    def get_all_ready(db: Session):
+        return db.query(Model).filter(Model.status == 'ready').all()
+    
     @staticmethod
     def update_status(db: Session, uuid: str, status: str):
         model = db.query(Model).filter(Model.uuid == uuid).first()
@@ -124,17 +135,173 @@ class SampleRepository:
 
 class TrainingJobRepository:
     @staticmethod
-    def create(db: Session, job_id: str, model_uuid: str):
+    def create(db: Session, job_id: str, model_uuid: str, params: dict | None = None):
         job = TrainingJob(
             id=job_id,
             model_uuid=model_uuid,
-            status='queued'
+            status='queued',
+            # Parámetros del request: sobreviven a un reinicio mientras el job espera
+            metrics={'params': params} if params else None
         )
         db.add(job)
         db.commit()
         db.refresh(job)
         return job
     
+    @staticmethod
+    def get_queued_for_model(db: Session, model_uuid: str):
+        return db.query(TrainingJob).filter(
+            TrainingJob.model_uuid == model_uuid,
+            TrainingJob.status == 'queued'
+        ).first()
+    
+    @staticmethod
+    def count_queued(db: Session) -> int:
+        return db.query(func.count(TrainingJob.id)).filter(TrainingJob.status == 'queued').scalar() or 0
+    
+    @staticmethod
+    def get_unfinished(db: Session):
+        """
+        Jobs 'queued', o 'running' con el lease vencido (huérfanos de un proceso
+        que se cayó). Todo 'running' tiene lease (claim/claim_next lo escriben y
+        su dueño lo renueva), así que los que siguen vivos no se tocan.
+        """
+        return db.query(TrainingJob).filter(
+            or_(
+                TrainingJob.status == 'queued',
+                and_(TrainingJob.status == 'running',
+                     TrainingJob.lease_expires_at.isnot(None),
+                     TrainingJob.lease_expires_at < datetime.utcnow()),
+            )
+        ).order_by(TrainingJob.created_at.asc()).all()
+    
+    @staticmethod
+    def set_params(db: Session, job_id: str, params: dict | None):
+        job = db.query(TrainingJob).filter(TrainingJob.id == job_id).first()
+        if job:
+            job.metrics = {'params': params} if params else None
+            db.commit()
+        return job
+    
+    @staticmethod
+    def claim(db: Session, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """
+        queued -> running de forma atómica (UPDATE condicionado).
+        False si otro proceso ya lo tomó o dejó de estar en cola.
+        Lo ejecuta el propio proceso del API, que renueva el lease con heartbeat().
+        """
+        now = datetime.utcnow()
+        updated = db.query(TrainingJob).filter(
+            TrainingJob.id == job_id,
+            TrainingJob.status == 'queued'
+        ).update(
+            {
+                'status': 'running',
+                'started_at': now,
+                'worker_id': worker_id,
+                'heartbeat_at': now,
+                'lease_expires_at': now + timedelta(seconds=lease_seconds),
+                'attempts': TrainingJob.attempts + 1,
+            },
+            synchronize_session=False
+        )
+        db.commit()
+        return updated == 1
+    
+    @staticmethod
+    def claim_next(db: Session, worker_id: str, lease_seconds: float, max_attempts: int = 3,
+                   batch: int = 8):
+        """
+        Toma el siguiente job para un worker remoto: 'queued', o 'running' con el
+        lease vencido (su worker murió). SELECT ... FOR UPDATE SKIP LOCKED: varios
+        workers compiten sin bloquearse. También se bloquea la fila del modelo
+        para no correr dos jobs del mismo modelo a la vez.
+        Devuelve el TrainingJob reclamado o None.
+        """
+        now = datetime.utcnow()
+        busy_models = select(TrainingJob.model_uuid).where(
+            TrainingJob.status == 'running',
+            or_(TrainingJob.lease_expires_at.is_(None), TrainingJob.lease_expires_at >= now)
+        )
+        candidates = (
+            db.query(TrainingJob)
+            .filter(
+                or_(
+                    TrainingJob.status == 'queued',
+                    and_(TrainingJob.status == 'running',
+                         TrainingJob.lease_expires_at.isnot(None),
+                         TrainingJob.lease_expires_at < now),
+                ),
+                TrainingJob.model_uuid.notin_(busy_models),
+            )
+            .order_by(TrainingJob.created_at.asc())
+            .limit(batch)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        for job in candidates:
+            model = (
+                db.query(Model).filter(Model.uuid == job.model_uuid)
+                .with_for_update(skip_locked=True).first()
+            )
+            if model is None:
+                continue
+            if (job.attempts or 0) >= max_attempts:
+                # Se cayó max_attempts veces con el lease tomado: no reintentar más
+                job.status = 'failed'
+                job.finished_at = now
+                job.error_message = f"Lease expired after {job.attempts} attempt(s)"
+                # Si ya tiene una versión publicada la sigue sirviendo
+                model.status = 'ready' if model.artifact_path else 'failed'
+                continue
+            job.status = 'running'
+            job.started_at = now
+            job.worker_id = worker_id
+            job.heartbeat_at = now
+            job.lease_expires_at = now + timedelta(seconds=lease_seconds)
+            job.attempts = (job.attempts or 0) + 1
+            model.status = 'training'
+            db.commit()
+            return job
+        db.commit()
+        return None
+    
+    @staticmethod
+    def heartbeat(db: Session, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """Renueva el lease. False si el job ya no es de este worker (lo tomó otro)."""
+        now = datetime.utcnow()
+        updated = db.query(TrainingJob).filter(
+            TrainingJob.id == job_id,
+            TrainingJob.worker_id == worker_id,
+            TrainingJob.status == 'running'
+        ).update(
+            {'heartbeat_at': now, 'lease_expires_at': now + timedelta(seconds=lease_seconds)},
+            synchronize_session=False
+        )
+        db.commit()
+        return updated == 1
+    
+    @staticmethod
+    def finish(db: Session, job_id: str, worker_id: str | None, status: str,
+               metrics: dict | None = None, error_message: str | None = None) -> bool:
+        """
+        running -> succeeded/failed solo si el job sigue siendo de 'worker_id'
+        (UPDATE condicionado, como heartbeat). False si el lease lo tomó otro
+        worker: ese resultado ya no se escribe. No hace commit: va en la misma
+        transacción que la publicación de la versión.
+        """
+        values = {'status': status, 'finished_at': datetime.utcnow()}
+        if metrics is not None:
+            values['metrics'] = metrics
+        if error_message:
+            values['error_message'] = error_message
+        updated = db.query(TrainingJob).filter(
+            TrainingJob.id == job_id,
+            TrainingJob.worker_id == worker_id,
+            TrainingJob.status == 'running'
+        ).update(values, synchronize_session=False)
+        return updated == 1
+    
     @staticmethod
     def update_status(db: Session, job_id: str, status: str, error_message: str = None):
         job = db.query(TrainingJob).filter(TrainingJob.id == job_id).first()
@@ -153,7 +320,7 @@ class TrainingJobRepository:
 class PredictionRepository:
     @staticmethod
     def create(db: Session, request_id: str, model_uuid: str, source_path: str,
-               approved: bool, confidence: float, threshold: float):
+               approved: bool, confidence: float, threshold: float, refresh: bool = True):
         prediction = Prediction(
             request_id=request_id,
             model_uuid=model_uuid,
@@ -165,5 +332,50 @@ class PredictionRepository:
         )
         db.add(prediction)
         db.commit()
-        db.refresh(prediction)
+        # refresh=False evita el SELECT posterior cuando el llamador no usa la fila
+        if refresh:
+            db.refresh(prediction)
         return prediction
+
+    @staticmethod
+    def create_many(db: Session, rows: list[dict]):
+        """
+        Inserta varias predicciones en un solo INSERT multi-fila y un solo commit.
+        Cada row: request_id, model_uuid, source_path, approved, confidence, threshold.
+        """
+        if not rows:
+            return 0
+        now = datetime.utcnow()
+        db.execute(
+            insert(Prediction),
+            [
+                {
+                    'request_id': r['request_id'],
+                    'model_uuid': r['model_uuid'],
+                    'source_path': r['source_path'],
+                    'approved': 1 if r['approved'] else 0,
+                    'confidence': r['confidence'],
+                    'threshold': r['threshold'],
+                    'created_at': now,
+                }
+                for r in rows
+            ]
+        )
+        db.commit()
+        return len(rows)
+
+    @staticmethod
+    def latest_approved_by_source(db: Session, model_uuid: str, source_paths: list[str],
+                                  chunk: int = 1000) -> dict[str, int]:
+        """source_path -> approved de la última predicción servida (IN por tandas)."""
+        out: dict[str, tuple] = {}
+        for start in range(0, len(source_paths), chunk):
+            part = source_paths[start:start + chunk]
+            rows = db.execute(
+                select(Prediction.source_path, Prediction.approved, Prediction.id)
+                .where(Prediction.model_uuid == model_uuid, Prediction.source_path.in_(part))
+            ).all()
+            for path, approved, pred_id in rows:
+                if path not in out or pred_id > out[path][1]:
+                    out[path] = (approved, pred_id)
+        return {path: approved for path, (approved, _id) in out.items()}
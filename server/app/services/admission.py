@@ -0,0 +1,203 @@
+# app/services/admission.py
+import os
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+
+class OverloadedError(Exception):
+    """No hay capacidad: el llamador debe responder 503 con Retry-After."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        self.retry_after = max(1, int(retry_after))
+        super().__init__(message)
+
+
+class _Waiter:
+    __slots__ = ("event", "granted", "units", "cost")
+
+    def __init__(self, units: int, cost: int):
+        self.event = threading.Event()
+        self.granted = False
+        self.units = units
+        self.cost = cost
+
+
+class AdmissionController:
+    """
+    Control de admisión para inferencia (CPU: decode + HOG).
+      - como máximo 'max_concurrent' imágenes en proceso a la vez: un request
+        con N imágenes ('cost') ocupa min(N, max_concurrent) unidades
+      - cola acotada ('max_queue' requests); si está llena se rechaza al instante
+      - cada request espera a lo sumo 'deadline_s' en la cola
+      - cola justa por clave (normalmente el model_uuid): al liberar capacidad
+        se atiende a las claves en round-robin, así un modelo con ráfagas no
+        deja sin turno a los demás
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int = 64, deadline_s: float = 2.0):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.deadline_s = max(0.0, float(deadline_s))
+        self._lock = threading.Lock()
+        self._running = 0       # unidades ocupadas
+        self._queued = 0        # requests en cola
+        self._queued_cost = 0   # imágenes en cola (para Retry-After)
+        # clave -> deque[_Waiter]; el orden del dict es el turno round-robin
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_deadline = 0
+        self._service_ewma = 0.05  # segundos por imagen (para Retry-After)
+
+    def _retry_after_locked(self, cost: int = 1) -> int:
+        # Tiempo estimado para drenar la cola actual con la concurrencia disponible
+        backlog = (self._queued_cost + cost) / self.max_concurrent
+        return int(math.ceil(max(1.0, backlog * self._service_ewma)))
+
+    def retry_after(self) -> int:
+        with self._lock:
+            return self._retry_after_locked()
+
+    def has_capacity(self, cost: int = 1) -> bool:
+        """
+        Chequeo sin bloquear ni reservar: False si un request de 'cost'
+        imágenes llegado ahora se rechazaría al instante (cola llena). No
+        toca el turno round-robin ni el promedio de servicio.
+        """
+        units = self._units(cost)
+        with self._lock:
+            if self._queued == 0 and self._running + units <= self.max_concurrent:
+                return True
+            if self._queued < self.max_queue:
+                return True
+            self.rejected_full += 1
+            return False
+
+    def _units(self, cost: int) -> int:
+        return min(max(1, int(cost)), self.max_concurrent)
+
+    def _dispatch_locked(self):
+        """Cede capacidad libre a los que esperan, en round-robin por clave."""
+        while self._queues:
+            key, q = next(iter(self._queues.items()))
+            waiter = q[0]
+            if self._running + waiter.units > self.max_concurrent:
+                # El siguiente en turno no entra aún: no se le adelantan otros
+                return
+            q.popleft()
+            self._queued -= 1
+            self._queued_cost -= waiter.cost
+            if q:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            self._running += waiter.units
+            waiter.granted = True
+            self.admitted += 1
+            waiter.event.set()
+
+    def _acquire(self, key: str, cost: int) -> int:
+        units = self._units(cost)
+        with self._lock:
+            if self._queued == 0 and self._running + units <= self.max_concurrent:
+                self._running += units
+                self.admitted += 1
+                return units
+            if self._queued >= self.max_queue:
+                self.rejected_full += 1
+                raise OverloadedError('Inference queue is full', self._retry_after_locked(cost))
+            waiter = _Waiter(units, max(1, int(cost)))
+            self._queues.setdefault(key, deque()).append(waiter)
+            self._queued += 1
+            self._queued_cost += waiter.cost
+
+        if waiter.event.wait(self.deadline_s):
+            return units
+
+        with self._lock:
+            if waiter.granted:
+                # La capacidad llegó justo al vencer el plazo: se usa
+                return units
+            q = self._queues.get(key)
+            if q is not None:
+                try:
+                    q.remove(waiter)
+                    self._queued -= 1
+                    self._queued_cost -= waiter.cost
+                except ValueError:
+                    pass
+                if not q:
+                    self._queues.pop(key, None)
+            self.rejected_deadline += 1
+            # Si era el primero en turno, los de atrás quizá ya entran
+            self._dispatch_locked()
+            raise OverloadedError('Inference queue deadline exceeded', self._retry_after_locked(cost))
+
+    def _release(self, units: int, cost: int, elapsed_s: float):
+        with self._lock:
+            self._service_ewma = 0.9 * self._service_ewma + 0.1 * (elapsed_s / max(1, cost))
+            self._running -= units
+            self._dispatch_locked()
+
+    @contextmanager
+    def slot(self, key: str, cost: int = 1):
+        """
+        Reserva capacidad para 'cost' imágenes, encolado bajo 'key' (el
+        model_uuid; ver validate.py para requests de varios modelos).
+        """
+        units = self._acquire(key, cost)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(units, cost, time.perf_counter() - t0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'deadline_ms': int(self.deadline_s * 1000),
+                'running': self._running,
+                'queued': self._queued,
+                'queued_images': self._queued_cost,
+                'queued_models': len(self._queues),
+                'admitted': self.admitted,
+                'rejected_full': self.rejected_full,
+                'rejected_deadline': self.rejected_deadline,
+                'avg_service_ms': round(self._service_ewma * 1000.0, 2),
+            }
+
+
+class _NoAdmission:
+    """Sustituto cuando el control de admisión está desactivado."""
+
+    @contextmanager
+    def slot(self, key: str, cost: int = 1):
+        yield
+
+    def has_capacity(self, cost: int = 1) -> bool:
+        return True
+
+    def retry_after(self) -> int:
+        return 1
+
+    def stats(self):
+        return None
+
+
+def _build_controller():
+    max_concurrent = int(os.getenv('INFERENCE_MAX_CONCURRENT', os.cpu_count() or 4))
+    if max_concurrent <= 0:
+        return _NoAdmission()
+    return AdmissionController(
+        max_concurrent,
+        max_queue=int(os.getenv('INFERENCE_MAX_QUEUE', 64)),
+        deadline_s=float(os.getenv('INFERENCE_QUEUE_DEADLINE_MS', 2000)) / 1000.0,
+    )
+
+
+admission_controller = _build_controller()
@@ -0,0 +1,78 @@
+# app/services/artifacts.py
+import json
+
+import numpy as np
+
+from app.services.projection import FeatureProjection
+from app.utils.images import DECODE_FULL
+
+# Artefacto binario compacto de un modelo lineal sobre HOG
+LINEAR_ARTIFACT_FILE = "model.npz"
+LINEAR_ARTIFACT_FORMAT = 1
+# Con proyección (PCA) w vive en el espacio reducido: lectores de formato 1 no deben usarlo
+LINEAR_ARTIFACT_FORMAT_PROJECTED = 2
+
+
+def save_linear_artifact(path: str, w: np.ndarray, b: float, hog: dict,
+                         calibration: dict | None = None, extra: dict | None = None,
+                         projection=None):
+    """
+    Guarda en UN archivo .npz (sin compresión) todo lo necesario para servir:
+      - w: pesos float32 (D,), b: bias  (score = x @ w + b, positivo = clase 1)
+      - hog: win_size, block_size, block_stride, cell_size, bins y decode
+        (cómo se leyeron las imágenes; sin el campo = decode completo)
+      - calibration / decision_threshold opcionales
+      - projection (FeatureProjection) opcional: mean (D,) + components (k, D);
+        en ese caso w es (k,) y puntúa sobre (x - mean) @ components.T
+    Sin pickle: los metadatos van como un string JSON.
+    """
+    info = {
+        "format": LINEAR_ARTIFACT_FORMAT if projection is None else LINEAR_ARTIFACT_FORMAT_PROJECTED,
+        "hog": {
+            "win_size": list(hog["win_size"]),
+            "block_size": list(hog["block_size"]),
+            "block_stride": list(hog["block_stride"]),
+            "cell_size": list(hog["cell_size"]),
+            "bins": int(hog["bins"]),
+            "decode": hog.get("decode") or DECODE_FULL,
+        },
+        "calibration": calibration or {},
+    }
+    if extra:
+        info.update(extra)
+    arrays = {
+        "w": np.ascontiguousarray(w, dtype=np.float32).ravel(),
+        "b": np.array(float(b), dtype=np.float64),
+    }
+    if projection is not None:
+        info["projection"] = projection.info()
+        arrays["proj_mean"] = projection.mean
+        arrays["proj_components"] = projection.components
+    with open(path, "wb") as f:
+        np.savez(f, info=np.array(json.dumps(info)), **arrays)
+
+
+def load_linear_artifact(path: str) -> dict:
+    """
+    Lee un artefacto .npz. Devuelve {'w', 'b', 'hog', 'calibration', ...}.
+    Un vector de ~1764 float32 se lee en microsegundos: sin parser XML ni meta.json.
+    Si el modelo se entrenó con proyección, 'projection' es un FeatureProjection.
+    """
+    with np.load(path, allow_pickle=False) as z:
+        w = np.array(z["w"], dtype=np.float32)
+        b = float(z["b"])
+        info = json.loads(str(z["info"]))
+        if int(info.get("format", 0)) > LINEAR_ARTIFACT_FORMAT_PROJECTED:
+            raise ValueError(f"Unsupported artifact format {info.get('format')} in {path}")
+        projection = None
+        if "proj_components" in z.files:
+            pinfo = info.get("projection") or {}
+            projection = FeatureProjection(
+                z["proj_mean"], z["proj_components"],
+                whiten=pinfo.get("whiten", False),
+                explained_variance=pinfo.get("explained_variance"),
+            )
+    info["w"] = w
+    info["b"] = b
+    info["projection"] = projection
+    return info
@@ -0,0 +1,414 @@
+# app/services/evaluation.py
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.db.models import SessionLocal, Model, Sample
+from app.db.repositories import PredictionRepository
+from app.services.inference import InferenceService, resolve_storage_path
+from app.services.artifacts import LINEAR_ARTIFACT_FILE
+from app.services.feature_store import feature_store_enabled, get_feature_store
+from app.services.featurize import decode_mode, featurize_paths
+
+
+class EvaluationService:
+    """
+    Evaluación offline de una versión de modelo (antes de promoverla o para
+    revisar la activa) sobre sus samples etiquetados y/o las imágenes de
+    storage/validations/<uuid>/.
+      - HOG desde el almacén de features cuando está (samples y validaciones se
+        nombran por sha256); el resto se featuriza en un pool de procesos hacia
+        un memmap temporal
+      - scoring vectorizado por tandas de EVAL_CHUNK_ROWS filas
+      - resultado: matriz de confusión, ROC + AUC, barrido de umbrales,
+        tasa de aprobación / acuerdo con las predicciones servidas y el score
+        de cada imagen; se guarda en models/<uuid>/evaluations/<id>.json
+    """
+    SOURCES = ("samples", "validations")
+    SWEEP_THRESHOLDS = np.round(np.linspace(0.0, 1.0, 21), 2)
+    ROC_MAX_POINTS = 200
+
+    _executor: ThreadPoolExecutor | None = None
+    _executor_lock = threading.Lock()
+
+    # ---------------------- rutas ---------------------- #
+    @staticmethod
+    def _evaluations_dir(storage_root: str, model_uuid: str) -> str:
+        return os.path.normpath(os.path.join(storage_root, "models", model_uuid, "evaluations"))
+
+    @staticmethod
+    def result_path(storage_root: str, model_uuid: str, evaluation_id: str) -> str:
+        return os.path.join(EvaluationService._evaluations_dir(storage_root, model_uuid), f"{evaluation_id}.json")
+
+    @staticmethod
+    def _write_result(path: str, result: dict):
+        # tmp + rename: un GET concurrente nunca lee un JSON a medio escribir
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load_result(storage_root: str, model_uuid: str, evaluation_id: str) -> dict | None:
+        path = EvaluationService.result_path(storage_root, model_uuid, evaluation_id)
+        if not os.path.isfile(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    # ---------------------- encolado ---------------------- #
+    @staticmethod
+    def start_evaluation(model_uuid: str, version: int | None = None, sources: list[str] | None = None,
+                         validations: list[str] | None = None, labels: dict | None = None,
+                         threshold: float | None = None, limit: int | None = None) -> str:
+        """
+        Encola la evaluación (hilo en segundo plano; el HOG va en procesos).
+        Devuelve el id; el estado y el resultado se leen con load_result.
+        """
+        storage_root = os.getenv('STORAGE_ROOT', './storage')
+        evaluation_id = str(uuid.uuid4())
+        request = {
+            "version": version,
+            "sources": list(sources or EvaluationService.SOURCES),
+            "validations": validations,
+            "labels": labels or {},
+            "threshold": threshold,
+            "limit": limit,
+        }
+        os.makedirs(EvaluationService._evaluations_dir(storage_root, model_uuid), exist_ok=True)
+        EvaluationService._write_result(
+            EvaluationService.result_path(storage_root, model_uuid, evaluation_id),
+            {
+                "id": evaluation_id,
+                "model_uuid": model_uuid,
+                "status": "queued",
+                "created_at": datetime.utcnow().isoformat() + "Z",
+                "request": request,
+            },
+        )
+        with EvaluationService._executor_lock:
+            if EvaluationService._executor is None:
+                EvaluationService._executor = ThreadPoolExecutor(
+                    max_workers=max(1, int(os.getenv('EVAL_MAX_CONCURRENT', 1))),
+                    thread_name_prefix="evaluation",
+                )
+        EvaluationService._executor.submit(
+            EvaluationService.run_evaluation, evaluation_id, model_uuid, request, storage_root
+        )
+        return evaluation_id
+
+    @staticmethod
+    def run_evaluation(evaluation_id: str, model_uuid: str, request: dict, storage_root: str) -> bool:
+        """Ejecuta la evaluación y deja el resultado (o el error) en su JSON."""
+        path = EvaluationService.result_path(storage_root, model_uuid, evaluation_id)
+        result = {
+            "id": evaluation_id,
+            "model_uuid": model_uuid,
+            "status": "running",
+            "started_at": datetime.utcnow().isoformat() + "Z",
+            "request": request,
+        }
+        try:
+            previous = EvaluationService.load_result(storage_root, model_uuid, evaluation_id) or {}
+            result["created_at"] = previous.get("created_at")
+            EvaluationService._write_result(path, result)
+            result.update(EvaluationService.evaluate(model_uuid, request, storage_root, evaluation_id))
+            result["status"] = "succeeded"
+            return True
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = str(e)
+            print(f"[EVAL][{evaluation_id}] ERROR: {e}")
+            return False
+        finally:
+            result["finished_at"] = datetime.utcnow().isoformat() + "Z"
+            try:
+                EvaluationService._write_result(path, result)
+            except OSError as e:
+                print(f"[EVAL][{evaluation_id}] result not written: {e}")
+
+    # ---------------------- modelo ---------------------- #
+    @staticmethod
+    def version_artifact(storage_root: str, model: Model, version: int | None = None) -> tuple[str, int]:
+        """(artefacto, versión) de la versión pedida (None = activa). FileNotFoundError si no está."""
+        if version is None or int(version) == int(model.version or 0):
+            return resolve_storage_path(
+                storage_root, model.artifact_path or f"models/{model.uuid}/artifacts/svm_hog.xml"
+            ), int(model.version or 0)
+        version_dir = resolve_storage_path(storage_root, f"models/{model.uuid}/artifacts/v{int(version)}")
+        for name in (LINEAR_ARTIFACT_FILE, "svm_hog.xml"):
+            artifact_abs = os.path.join(version_dir, name)
+            if os.path.isfile(artifact_abs):
+                return artifact_abs, int(version)
+        raise FileNotFoundError(f"Version {version} of model {model.uuid} not found")
+
+    @staticmethod
+    def _load_version(storage_root: str, model: Model, version: int | None):
+        """(scorer, hog_params, calibración, umbral por defecto, versión) de una versión publicada."""
+        artifact_abs, version = EvaluationService.version_artifact(storage_root, model, version)
+        scorer, meta = InferenceService._read_model_files(artifact_abs)
+        meta = meta or {}
+        hog_params = {
+            k: (tuple(int(x) for x in meta.get(k, v)) if isinstance(v, tuple) else int(meta.get(k, v)))
+            for k, v in InferenceService.DEFAULT_HOG.items()
+        }
+        # Mismo decode con que se entrenó la versión (sin el campo: el original)
+        hog_params["decode"] = decode_mode(meta)
+        threshold = meta.get("decision_threshold")
+        if threshold is None:
+            threshold = model.threshold if model.threshold is not None else InferenceService.DEFAULT_DECISION_THRESHOLD
+        calibration = meta.get("calibration") if isinstance(meta.get("calibration"), dict) else {}
+        return scorer, hog_params, calibration, float(threshold), version
+
+    # ---------------------- imágenes ---------------------- #
+    @staticmethod
+    def _collect(db, model_uuid: str, storage_root: str, request: dict):
+        """
+        Lista de imágenes a evaluar: (source, id, path_abs, sha256, label)
+        con label 1/0 o -1 si no se conoce.
+        """
+        items = []
+        limit = int(request.get("limit") or 0)
+        if "samples" in request["sources"]:
+            query = (
+                db.query(Sample.id, Sample.label, Sample.file_path, Sample.sha256)
+                .filter(Sample.model_uuid == model_uuid)
+                .order_by(Sample.id.asc())
+                .yield_per(5000)
+            )
+            for sample_id, label, file_path, sha256 in query:
+                items.append(("sample", int(sample_id), resolve_storage_path(storage_root, file_path),
+                              sha256, 1 if label == 'positive' else 0))
+                if limit and len(items) >= limit:
+                    return items
+
+        if "validations" in request["sources"]:
+            labels = {
+                str(k).lower(): (1 if v == 'positive' else 0)
+                for k, v in (request.get("labels") or {}).items() if v in ('positive', 'negative')
+            }
+            val_dir = os.path.join(storage_root, "validations", model_uuid)
+            wanted = set(request["validations"]) if request.get("validations") else None
+            names = sorted(
+                e.name for e in os.scandir(val_dir)
+                if e.is_file() and not e.name.startswith('.') and (wanted is None or e.name in wanted)
+            ) if os.path.isdir(val_dir) else []
+            for name in names:
+                stem = os.path.splitext(name)[0].lower()
+                # Las validaciones se guardan como <sha256>.<ext>
+                sha256 = stem if len(stem) == 64 and all(c in "0123456789abcdef" for c in stem) else None
+                label = labels.get(name.lower(), labels.get(stem, -1))
+                items.append(("validation", name, os.path.join(val_dir, name), sha256, label))
+                if limit and len(items) >= limit:
+                    break
+        return items
+
+    @staticmethod
+    def _scores(items: list, scorer, hog_params: dict, calibration: dict, storage_root: str,
+                scratch_dir: str, chunk_rows: int, workers: int | None):
+        """
+        P(positiva) de cada imagen. Los HOG presentes en el almacén se leen
+        por tandas; los faltantes se calculan de una vez en el pool de procesos
+        hacia un memmap en scratch_dir. Memoria acotada a una tanda.
+        Devuelve (p_pos, ok, timings).
+        """
+        n = len(items)
+        dim = InferenceService._build_hog(hog_params).getDescriptorSize()
+        p_pos = np.full(n, np.nan, dtype=np.float64)
+        ok = np.zeros(n, dtype=bool)
+        timings = {"store_hits": 0, "featurized": 0}
+
+        store = get_feature_store(storage_root, hog_params, dim) if feature_store_enabled() else None
+        rows = store.lookup([it[3] for it in items]) if store is not None else np.full(n, -1, dtype=np.int64)
+        hits = np.flatnonzero(rows >= 0)
+        missing = np.flatnonzero(rows < 0)
+
+        t0 = time.perf_counter()
+        scratch = None
+        if len(missing):
+            os.makedirs(scratch_dir, exist_ok=True)
+            scratch = np.memmap(os.path.join(scratch_dir, "features.f32"), dtype=np.float32,
+                                mode="w+", shape=(len(missing), dim))
+            ok[missing] = featurize_paths([items[i][2] for i in missing], hog_params, scratch,
+                                          max_workers=workers)
+        timings["featurize_seconds"] = round(time.perf_counter() - t0, 4)
+
+        t0 = time.perf_counter()
+        for start in range(0, len(hits), chunk_rows):
+            part = hits[start:start + chunk_rows]
+            dist = scorer.decision(store.read(rows[part]))
+            p_pos[part] = InferenceService._calibrate(dist, calibration)
+            ok[part] = True
+        for start in range(0, len(missing), chunk_rows):
+            part = missing[start:start + chunk_rows]
+            dist = scorer.decision(np.asarray(scratch[start:start + len(part)]))
+            p_pos[part] = InferenceService._calibrate(dist, calibration)
+        timings["score_seconds"] = round(time.perf_counter() - t0, 4)
+        timings["store_hits"] = int(len(hits))
+        timings["featurized"] = int(len(missing))
+        p_pos[~ok] = np.nan
+        return p_pos, ok, timings
+
+    # ---------------------- métricas ---------------------- #
+    @staticmethod
+    def _confusion(p: np.ndarray, y: np.ndarray, thr: float) -> dict:
+        pred = p >= thr
+        tp = int(np.sum(pred & (y == 1)))
+        tn = int(np.sum(~pred & (y == 0)))
+        fp = int(np.sum(pred & (y == 0)))
+        fn = int(np.sum(~pred & (y == 1)))
+        prec = tp / (tp + fp) if (tp + fp) else 0.0
+        rec = tp / (tp + fn) if (tp + fn) else 0.0
+        f1 = 2 * prec * rec / (prec + rec) if (prec + rec) else 0.0
+        return {
+            "threshold": float(thr),
+            "tp": tp, "tn": tn, "fp": fp, "fn": fn,
+            "accuracy": round((tp + tn) / len(y), 4) if len(y) else None,
+            "precision_pos": round(prec, 4),
+            "recall_pos": round(rec, 4),
+            "f1_pos": round(f1, 4),
+        }
+
+    @staticmethod
+    def _roc(p: np.ndarray, y: np.ndarray) -> dict:
+        """Curva ROC (submuestreada a ROC_MAX_POINTS) y AUC, en O(N log N)."""
+        n_pos = int(np.sum(y == 1))
+        n_neg = int(len(y) - n_pos)
+        if not n_pos or not n_neg:
+            return {"auc": None, "fpr": [], "tpr": [], "thresholds": []}
+        order = np.argsort(-p, kind="stable")
+        p_sorted, y_sorted = p[order], y[order]
+        # Un punto por valor distinto de score
+        last = np.r_[np.flatnonzero(np.diff(p_sorted)), len(p_sorted) - 1]
+        tps = np.cumsum(y_sorted == 1)[last]
+        fps = np.cumsum(y_sorted == 0)[last]
+        tpr = np.r_[0.0, tps / n_pos]
+        fpr = np.r_[0.0, fps / n_neg]
+        thresholds = np.r_[1.0, p_sorted[last]]
+        auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2.0))
+        if len(fpr) > EvaluationService.ROC_MAX_POINTS:
+            keep = np.unique(np.linspace(0, len(fpr) - 1, EvaluationService.ROC_MAX_POINTS).astype(int))
+            fpr, tpr, thresholds = fpr[keep], tpr[keep], thresholds[keep]
+        return {
+            "auc": round(auc, 4),
+            "fpr": [round(float(v), 4) for v in fpr],
+            "tpr": [round(float(v), 4) for v in tpr],
+            "thresholds": [round(float(v), 4) for v in thresholds],
+        }
+
+    @staticmethod
+    def _labeled_metrics(p: np.ndarray, y: np.ndarray, thr: float) -> dict:
+        sweep = [EvaluationService._confusion(p, y, t) for t in EvaluationService.SWEEP_THRESHOLDS]
+        best = max(sweep, key=lambda r: (r["f1_pos"], r["accuracy"] or 0.0))
+        return {
+            "n": int(len(y)),
+            "n_pos": int(np.sum(y == 1)),
+            "n_neg": int(np.sum(y == 0)),
+            "at_threshold": EvaluationService._confusion(p, y, thr),
+            "roc": EvaluationService._roc(p, y),
+            "threshold_sweep": sweep,
+            "best_f1_threshold": best["threshold"],
+        }
+
+    @staticmethod
+    def _agreement(db, model_uuid: str, paths: list[str], approved: np.ndarray) -> dict:
+        """Acuerdo con la última decisión servida (tabla predictions) para esas imágenes."""
+        served = PredictionRepository.latest_approved_by_source(db, model_uuid, paths)
+        matched = [(bool(served[path]), bool(a)) for path, a in zip(paths, approved) if path in served]
+        return {
+            "n_matched": len(matched),
+            "agreement_rate": round(sum(s == a for s, a in matched) / len(matched), 4) if matched else None,
+        }
+
+    # ---------------------- evaluación ---------------------- #
+    @staticmethod
+    def evaluate(model_uuid: str, request: dict, storage_root: str, evaluation_id: str | None = None) -> dict:
+        t_start = time.perf_counter()
+        chunk_rows = max(1, int(os.getenv('EVAL_CHUNK_ROWS', 4096)))
+        workers = int(os.getenv('EVAL_WORKERS', 0)) or None
+        scratch_dir = os.path.join(
+            EvaluationService._evaluations_dir(storage_root, model_uuid), f".scratch-{evaluation_id or uuid.uuid4()}"
+        )
+
+        db = SessionLocal()
+        try:
+            model = db.query(Model).filter(Model.uuid == model_uuid).first()
+            if not model:
+                raise FileNotFoundError(f"Model {model_uuid} not found")
+            scorer, hog_params, calibration, default_thr, version = EvaluationService._load_version(
+                storage_root, model, request.get("version")
+            )
+            thr = float(request["threshold"]) if request.get("threshold") is not None else default_thr
+
+            items = EvaluationService._collect(db, model_uuid, storage_root, request)
+            try:
+                p_pos, ok, timings = EvaluationService._scores(
+                    items, scorer, hog_params, calibration, storage_root, scratch_dir, chunk_rows, workers
+                )
+            finally:
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+
+            sources = np.array([it[0] for it in items])
+            labels = np.array([it[4] for it in items], dtype=np.int32)
+            approved = p_pos >= thr
+
+            labeled = ok & (labels >= 0)
+            val_mask = ok & (sources == "validation")
+            val_idx = np.flatnonzero(val_mask)
+            validations = {
+                "n": int(len(val_idx)),
+                "approval_rate": round(float(approved[val_idx].mean()), 4) if len(val_idx) else None,
+                "histogram": np.histogram(p_pos[val_idx], bins=10, range=(0.0, 1.0))[0].tolist(),
+                "served_agreement": EvaluationService._agreement(
+                    db, model_uuid, [items[i][2] for i in val_idx], approved[val_idx]
+                ),
+            }
+        finally:
+            db.close()
+
+        def _rel(path_abs: str) -> str:
+            try:
+                return os.path.relpath(path_abs, storage_root).replace("\\", "/")
+            except ValueError:
+                return path_abs.replace("\\", "/")
+
+        scores = [
+            {
+                "source": it[0],
+                "id": it[1],
+                "path": _rel(it[2]),
+                "label": None if it[4] < 0 else ("positive" if it[4] == 1 else "negative"),
+                "p_pos": round(float(p_pos[i]), 4) if ok[i] else None,
+                "approved": bool(approved[i]) if ok[i] else None,
+            }
+            for i, it in enumerate(items)
+        ]
+        total_s = time.perf_counter() - t_start
+        return {
+            "version": version,
+            "threshold": thr,
+            "counts": {
+                "total": len(items),
+                "samples": int(np.sum(sources == "sample")) if len(items) else 0,
+                "validations": int(np.sum(sources == "validation")) if len(items) else 0,
+                "unreadable": int(np.sum(~ok)),
+            },
+            "labeled": (
+                EvaluationService._labeled_metrics(p_pos[labeled], labels[labeled], thr)
+                if labeled.any() else None
+            ),
+            "validations": validations,
+            "timings": {
+                **timings,
+                "total_seconds": round(total_s, 4),
+                "images_per_second": round(len(items) / total_s, 1) if total_s > 0 else None,
+            },
+            "scores": scores,
+        }
@@ -0,0 +1,246 @@
+# app/services/feature_store.py
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:  # POSIX
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class _FileLock:
+    """Lock exclusivo entre procesos sobre un archivo (fcntl / msvcrt)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fh = None
+        self._local = threading.Lock()
+
+    def __enter__(self):
+        self._local.acquire()
+        self._fh = open(self.path, "a+b")
+        if fcntl is not None:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
+        else:
+            self._fh.seek(0)
+            msvcrt.locking(self._fh.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+            else:
+                self._fh.seek(0)
+                msvcrt.locking(self._fh.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._fh.close()
+            self._fh = None
+            self._local.release()
+
+
+class FeatureStore:
+    """
+    Almacén persistente de descriptores HOG por contenido (sha256 de la imagen).
+    Uno por configuración HOG, compartido entre modelos: la misma imagen subida
+    a dos modelos ocupa una sola fila.
+
+      <STORAGE_ROOT>/features/hog-<hash>/
+        config.json    parámetros HOG + dtype
+        features.bin   matriz (N, D) append-only, leída con np.memmap
+        index.bin      N sha256 binarios (32 bytes); la posición es la fila
+        .lock          lock entre procesos para las escrituras
+
+    Se escriben primero los datos y luego el índice: un corte a mitad deja
+    filas huérfanas al final que se ignoran (N = mínimo de ambos archivos).
+    """
+
+    SHA_BYTES = 32
+
+    def __init__(self, directory: str, hog_params: dict, dim: int, dtype: str = "float32"):
+        self.directory = directory
+        self.dim = int(dim)
+        self.dtype = np.dtype(dtype)
+        self.row_bytes = self.dim * self.dtype.itemsize
+        os.makedirs(directory, exist_ok=True)
+
+        self._data_path = os.path.join(directory, "features.bin")
+        self._index_path = os.path.join(directory, "index.bin")
+        self._file_lock = _FileLock(os.path.join(directory, ".lock"))
+        self._lock = threading.RLock()
+        self._rows: dict[str, int] = {}
+        self._count = 0
+        self._mmap: np.memmap | None = None
+        self._mmap_rows = 0
+        self.hits = 0
+        self.misses = 0
+        self.appended = 0
+
+        config_path = os.path.join(directory, "config.json")
+        if not os.path.isfile(config_path):
+            tmp_path = f"{config_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"hog": hog_params, "dim": self.dim, "dtype": self.dtype.name}, f, indent=2)
+            os.replace(tmp_path, config_path)
+        self.refresh()
+
+    # ---------------------- índice ---------------------- #
+    def _committed_rows(self) -> int:
+        n_index = os.path.getsize(self._index_path) // self.SHA_BYTES if os.path.isfile(self._index_path) else 0
+        n_data = os.path.getsize(self._data_path) // self.row_bytes if os.path.isfile(self._data_path) else 0
+        return min(n_index, n_data)
+
+    def refresh(self):
+        """Incorpora filas añadidas por otros procesos desde la última lectura."""
+        with self._lock:
+            n = self._committed_rows()
+            if n <= self._count:
+                return
+            with open(self._index_path, "rb") as f:
+                f.seek(self._count * self.SHA_BYTES)
+                raw = f.read((n - self._count) * self.SHA_BYTES)
+            for i in range(len(raw) // self.SHA_BYTES):
+                sha = raw[i * self.SHA_BYTES:(i + 1) * self.SHA_BYTES].hex()
+                self._rows.setdefault(sha, self._count + i)
+            self._count = n
+
+    def lookup(self, sha256s: list[str | None]) -> np.ndarray:
+        """Fila de cada sha256 (-1 si no está). Refresca una vez ante fallos."""
+        with self._lock:
+            rows = np.array([self._rows.get(s, -1) if s else -1 for s in sha256s], dtype=np.int64)
+            if (rows < 0).any():
+                self.refresh()
+                rows = np.array([self._rows.get(s, -1) if s else -1 for s in sha256s], dtype=np.int64)
+            found = int((rows >= 0).sum())
+            self.hits += found
+            self.misses += len(rows) - found
+            return rows
+
+    def __len__(self) -> int:
+        return self._count
+
+    # ---------------------- lectura ---------------------- #
+    def matrix(self) -> np.ndarray:
+        """Vista memmap (N, D) de solo lectura sobre todas las filas confirmadas."""
+        with self._lock:
+            if self._mmap is None or self._mmap_rows != self._count:
+                self._mmap = (
+                    np.memmap(self._data_path, dtype=self.dtype, mode="r", shape=(self._count, self.dim))
+                    if self._count else np.empty((0, self.dim), dtype=self.dtype)
+                )
+                self._mmap_rows = self._count
+            return self._mmap
+
+    def read(self, rows: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+        """Copia las filas pedidas a 'out' (o a una matriz float32 nueva)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if out is None:
+            out = np.empty((len(rows), self.dim), dtype=np.float32)
+        if len(rows):
+            # Acceso ordenado sobre el memmap: lecturas secuenciales en disco
+            order = np.argsort(rows, kind="stable")
+            out[order] = self.matrix()[rows[order]]
+        return out
+
+    # ---------------------- escritura ---------------------- #
+    def append(self, sha256s: list[str], feats: np.ndarray) -> np.ndarray:
+        """
+        Agrega filas nuevas (las ya presentes se omiten). Devuelve la fila de
+        cada sha256 de entrada.
+        """
+        feats = np.asarray(feats, dtype=np.float32).reshape(len(sha256s), self.dim)
+        with self._lock, self._file_lock:
+            self.refresh()
+            # Recorta restos de una escritura interrumpida antes de anexar
+            n = self._count
+            for path, unit in ((self._data_path, self.row_bytes), (self._index_path, self.SHA_BYTES)):
+                if os.path.isfile(path) and os.path.getsize(path) != n * unit:
+                    with open(path, "r+b") as f:
+                        f.truncate(n * unit)
+
+            new_rows, new_shas, pending = [], [], {}
+            for i, sha in enumerate(sha256s):
+                if sha in self._rows or sha in pending:
+                    continue
+                pending[sha] = n + len(new_shas)
+                new_shas.append(sha)
+                new_rows.append(i)
+
+            if new_shas:
+                with open(self._data_path, "ab") as f:
+                    f.write(np.ascontiguousarray(feats[new_rows], dtype=self.dtype).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                with open(self._index_path, "ab") as f:
+                    f.write(b"".join(bytes.fromhex(s) for s in new_shas))
+                    f.flush()
+                self._rows.update(pending)
+                self._count = n + len(new_shas)
+                self.appended += len(new_shas)
+
+            return np.array([self._rows[s] for s in sha256s], dtype=np.int64)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'rows': self._count,
+                'dim': self.dim,
+                'dtype': self.dtype.name,
+                'bytes': self._count * self.row_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'appended': self.appended,
+            }
+
+
+def hog_config_key(hog_params: dict, dtype: str) -> str:
+    canon = json.dumps(
+        {k: list(v) if isinstance(v, (tuple, list)) else v for k, v in sorted(hog_params.items())}
+        | {"dtype": np.dtype(dtype).name},
+        sort_keys=True,
+    )
+    return "hog-" + hashlib.sha1(canon.encode("utf-8")).hexdigest()[:12]
+
+
+_stores: dict[tuple[str, str], FeatureStore] = {}
+_stores_lock = threading.Lock()
+
+
+def feature_store_enabled() -> bool:
+    return os.getenv('FEATURE_STORE', '1').lower() in ('1', 'true', 'yes')
+
+
+def get_feature_store(storage_root: str, hog_params: dict, dim: int) -> FeatureStore:
+    """Instancia (una por proceso) del almacén para esa configuración HOG."""
+    dtype = os.getenv('FEATURE_STORE_DTYPE', 'float32')
+    key = hog_config_key(hog_params, dtype)
+    root = os.path.normpath(os.path.abspath(storage_root))
+    with _stores_lock:
+        store = _stores.get((root, key))
+        if store is None:
+            store = FeatureStore(os.path.join(root, "features", key), hog_params, dim, dtype)
+            _stores[(root, key)] = store
+        return store
+
+
+# Relleno en el upload: un solo hilo para no competir con los requests
+_upload_executor: ThreadPoolExecutor | None = None
+_upload_executor_lock = threading.Lock()
+
+
+def submit_background(fn, *args) -> bool:
+    global _upload_executor
+    with _upload_executor_lock:
+        if _upload_executor is None:
+            _upload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="feature-store")
+    try:
+        _upload_executor.submit(fn, *args)
+        return True
+    except RuntimeError:
+        return False
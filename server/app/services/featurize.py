@@ -0,0 +1,115 @@
+# app/services/featurize.py
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from app.utils.images import DECODE_FULL, load_gray
+
+# Un HOGDescriptor por hilo / proceso worker (no se crea uno por imagen)
+_local = threading.local()
+
+
+def decode_mode(hog_params: dict) -> str:
+    """Modo de decode de la configuración de features (sin el campo: el original)."""
+    return hog_params.get("decode") or DECODE_FULL
+
+
+def build_hog(hog_params: dict) -> cv2.HOGDescriptor:
+    return cv2.HOGDescriptor(
+        _winSize=tuple(hog_params["win_size"]),
+        _blockSize=tuple(hog_params["block_size"]),
+        _blockStride=tuple(hog_params["block_stride"]),
+        _cellSize=tuple(hog_params["cell_size"]),
+        _nbins=int(hog_params["bins"]),
+    )
+
+
+def _hog_for(hog_params: dict) -> cv2.HOGDescriptor:
+    key = tuple(tuple(v) if isinstance(v, (list, tuple)) else v for _k, v in sorted(hog_params.items()))
+    if getattr(_local, "key", None) != key:
+        _local.hog = build_hog(hog_params)
+        _local.key = key
+    return _local.hog
+
+
+def hog_feature(img_path: str, hog_params: dict, out: np.ndarray | None = None) -> np.ndarray | None:
+    """Imagen -> gris (según hog_params['decode']) -> ventana HOG -> descriptor float32 (D,)."""
+    hog = _hog_for(hog_params)
+    win = tuple(hog_params["win_size"])
+    gray = load_gray(img_path, win, decode_mode(hog_params))
+    if gray is None:
+        return None
+    resized = cv2.resize(gray, win, interpolation=cv2.INTER_AREA)
+    feat = hog.compute(resized).reshape(-1)
+    if out is None:
+        return feat.astype(np.float32)
+    out[:] = feat
+    return out
+
+
+def available_cpus() -> int:
+    """CPUs utilizables por este proceso (respeta la afinidad del proceso de entrenamiento)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def _init_worker(hog_params: dict):
+    # Un hilo de OpenCV por proceso: el paralelismo lo da el pool
+    cv2.setNumThreads(1)
+    _hog_for(hog_params)
+
+
+def _featurize_chunk(start: int, paths: list[str], hog_params: dict, dim: int):
+    feats = np.empty((len(paths), dim), dtype=np.float32)
+    ok = np.zeros(len(paths), dtype=bool)
+    for i, p in enumerate(paths):
+        ok[i] = hog_feature(p, hog_params, feats[i]) is not None
+    return start, ok, feats
+
+
+def featurize_paths(paths: list[str], hog_params: dict, out: np.ndarray,
+                    rows: np.ndarray | None = None, max_workers: int | None = None,
+                    chunk_size: int = 256) -> np.ndarray:
+    """
+    Calcula el HOG de cada ruta directamente en out[rows[i]] (matriz
+    preasignada; sin 'rows' la fila i).
+    Con más de un worker y suficientes imágenes reparte trozos entre procesos
+    (spawn: sin heredar hilos ni conexiones del proceso Flask).
+    Devuelve la máscara de imágenes leídas correctamente.
+    """
+    n = len(paths)
+    ok = np.zeros(n, dtype=bool)
+    if n == 0:
+        return ok
+    dim = out.shape[1]
+    rows = np.arange(n) if rows is None else np.asarray(rows, dtype=np.int64)
+    if max_workers is None:
+        max_workers = int(os.getenv('TRAINING_FEATURIZE_WORKERS', 0)) or available_cpus()
+    chunk_size = max(1, int(chunk_size))
+    workers = min(max(1, int(max_workers)), (n + chunk_size - 1) // chunk_size)
+
+    if workers <= 1:
+        for i, p in enumerate(paths):
+            ok[i] = hog_feature(p, hog_params, out[rows[i]]) is not None
+        return ok
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(hog_params,)) as pool:
+        futures = {
+            pool.submit(_featurize_chunk, start, paths[start:start + chunk_size], hog_params, dim)
+            for start in range(0, n, chunk_size)
+        }
+        for fut in as_completed(futures):
+            start, chunk_ok, feats = fut.result()
+            end = start + len(chunk_ok)
+            out[rows[start:end]] = feats
+            ok[start:end] = chunk_ok
+            # Suelta el resultado: memoria acotada aunque 'out' sea un memmap en disco
+            futures.discard(fut)
+    return ok
@@ -2,13 +2,20 @@
 import os
 import json
 import math
-from typing import Tuple, Dict, Any
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Union
 
 import cv2
 import numpy as np
 
-from app.db.models import SessionLocal, Model
+from app.services.model_cache import ArtifactCache, ModelMeta, model_meta_cache
+from app.services.artifacts import LINEAR_ARTIFACT_FILE, load_linear_artifact
+from app.utils.images import DECODE_FULL, load_gray
 
+# Ruta en storage o buffer en memoria (bytes / memoryview del upload)
+ImageSource = Union[str, bytes, bytearray, memoryview]
 
 # ---------------------- UTIL RUTAS (Windows-friendly) ---------------------- #
 def resolve_storage_path(storage_root: str, path_str: str) -> str:
@@ -34,13 +41,67 @@ def resolve_storage_path(storage_root: str, path_str: str) -> str:
 # -------------------------------------------------------------------------- #
 
 
+class ModelNotLinearError(Exception):
+    """El modo requerido necesita un modelo lineal (vector w explícito)."""
+
+
+class LinearScorer:
+    """
+    Función de decisión de un SVM lineal: score = X @ w + b.
+    Orientado para que score > 0 sea la clase positiva (label 1).
+    """
+    __slots__ = ("w", "b", "_svm")
+
+    def __init__(self, w: np.ndarray | None, b: float, svm: cv2.ml_SVM | None = None):
+        self.w = None if w is None else np.ascontiguousarray(w, dtype=np.float32).ravel()
+        self.b = float(b)
+        # Solo se conserva el SVM si NO es lineal (fallback a svm.predict)
+        self._svm = svm
+
+    @classmethod
+    def from_svm(cls, svm: cv2.ml_SVM) -> "LinearScorer":
+        """
+        OpenCV comprime los vectores soporte de un SVM lineal en uno solo, y su
+        salida RAW es  sum(alpha_i * sv_i) . x - rho,  positiva para la clase 0.
+        Invertimos el signo para que positivo = clase 1.
+        """
+        if svm.getKernelType() != cv2.ml.SVM_LINEAR:
+            return cls(None, 0.0, svm)
+        sv = svm.getSupportVectors().astype(np.float64)
+        rho, alpha, svidx = svm.getDecisionFunction(0)
+        w_raw = (alpha.reshape(-1, 1).astype(np.float64) * sv[svidx.ravel()]).sum(axis=0)
+        return cls(-w_raw, float(rho))
+
+    def decision(self, feats: np.ndarray) -> np.ndarray:
+        """(N, D) float32 -> (N,) float64 distancias al hiperplano."""
+        feats = np.asarray(feats, dtype=np.float32)
+        if feats.ndim == 1:
+            feats = feats.reshape(1, -1)
+        if self.w is not None:
+            return (feats @ self.w).astype(np.float64) + self.b
+        RAW = getattr(cv2.ml, "STAT_MODEL_RAW_OUTPUT", 1)
+        _ret, raw = self._svm.predict(feats, flags=RAW)
+        return -raw.ravel().astype(np.float64)
+
+    @property
+    def dim(self) -> int | None:
+        return None if self.w is None else int(self.w.shape[0])
+
+
 class InferenceService:
     """
     Usa el SVM lineal entrenado con HOG (64x64).
     Cachea el modelo por UUID.
+
+    Como el kernel es lineal, al cargar se extraen (w, b) del SVM una sola vez;
+    cada predicción es un producto punto NumPy: score = X @ w + b.
+    score > 0  <=>  clase positiva (label 1), igual que svm.predict.
     """
-    # Guardamos (svm, hog, decision_threshold, calibration_dict)
-    _cache: dict[str, Tuple[cv2.ml_SVM, cv2.HOGDescriptor, float, Dict[str, Any]]] = {}
+    # LRU por (model_uuid, version) -> (LinearScorer, hog, decision_threshold, calibration_dict, decode)
+    _cache = ArtifactCache(
+        max_entries=int(os.getenv("MODEL_CACHE_MAX_ENTRIES", 256)),
+        max_bytes=int(float(os.getenv("MODEL_CACHE_MAX_MB", 256)) * 1024 * 1024),
+    )
 
     DEFAULT_HOG = {
         "win_size": (64, 64),
@@ -50,6 +111,23 @@ class InferenceService:
         "bins": 9,
     }
 
+    # (model_uuid, version, sha256) -> P(clase positiva) calibrada
+    # PREDICTION_CACHE_MAX_ENTRIES=0 lo desactiva
+    PREDICTION_CACHE_ENABLED = int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", 10000)) > 0
+    _prediction_cache = ArtifactCache(
+        max_entries=max(1, int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", 10000))),
+        max_bytes=1 << 62,  # acotado por entradas; cada una ocupa ~PREDICTION_ENTRY_NBYTES
+        ttl_seconds=float(os.getenv("PREDICTION_CACHE_TTL", 300)),
+    )
+    # tupla clave + sha256 hex + float
+    PREDICTION_ENTRY_NBYTES = 256
+
+    # Pesos apilados (K, D) por combinación de modelos para scoring multi-modelo
+    _stack_cache = ArtifactCache(max_entries=64, max_bytes=64 * 1024 * 1024)
+
+    # HOGDescriptor con setSVMDetector por (uuid, version) para el modo detección
+    _detector_cache = ArtifactCache(max_entries=64, max_bytes=64 * 1024 * 1024)
+
     # Mejor default para binario balanceado
     DEFAULT_DECISION_THRESHOLD = 0.5
     # Fallback de "calibración suave" si no hay parámetros
@@ -66,136 +144,555 @@ class InferenceService:
         return cv2.HOGDescriptor(ws, bs, bstr, cs, nb)
 
     @staticmethod
-    def _load_artifacts(model_uuid: str):
+    def _entry_nbytes(scorer: LinearScorer, hog: cv2.HOGDescriptor) -> int:
+        """Tamaño aproximado en memoria de una entrada del cache."""
+        n = 1024  # objetos Python, dicts de meta/calibración
+        if scorer.w is not None:
+            n += scorer.w.nbytes
+        else:
+            # Fallback no lineal: los vectores soporte dominan
+            n += scorer._svm.getSupportVectors().nbytes
+        # Buffers internos del HOGDescriptor (aprox. un descriptor float32)
+        n += hog.getDescriptorSize() * 4
+        return n
+
+    @staticmethod
+    def cache_stats() -> dict:
+        return InferenceService._cache.stats()
+
+    @staticmethod
+    def invalidate(model_uuid: str):
+        """Descarta todas las versiones cacheadas de un modelo (artefactos y predicciones)."""
+        InferenceService._cache.discard(lambda k: k[0] == model_uuid)
+        InferenceService._prediction_cache.discard(lambda k: k[0] == model_uuid)
+        InferenceService._stack_cache.discard(lambda k: any(u == model_uuid for u, _v in k))
+        InferenceService._detector_cache.discard(lambda k: k[0] == model_uuid)
+
+    @staticmethod
+    def _read_model_files(artifact_path_abs: str) -> tuple[LinearScorer, dict | None]:
         """
-        Carga (y cachea) SVM + HOG para el modelo.
-        Devuelve (svm, hog, decision_threshold, calibration_dict).
+        Lee los archivos de una versión del modelo.
+        Prefiere model.npz (pesos + bias + HOG + calibración en un solo archivo,
+        sin parser XML); si no existe (modelos antiguos) usa svm_hog.xml + meta.json.
+        Devuelve (scorer, meta) donde meta trae los parámetros HOG y calibración.
         """
-        if model_uuid in InferenceService._cache:
-            return InferenceService._cache[model_uuid]
+        artifacts_dir = os.path.dirname(artifact_path_abs)
+        npz_path_abs = (
+            artifact_path_abs if artifact_path_abs.endswith(".npz")
+            else os.path.join(artifacts_dir, LINEAR_ARTIFACT_FILE)
+        )
+        if os.path.isfile(npz_path_abs):
+            info = load_linear_artifact(npz_path_abs)
+            meta = dict(info["hog"])
+            meta["calibration"] = info.get("calibration") or {}
+            if info.get("decision_threshold") is not None:
+                meta["decision_threshold"] = info["decision_threshold"]
+            w, b = info["w"], info["b"]
+            projection = info.get("projection")
+            if projection is not None:
+                # Proyección PCA del entrenamiento: se pliega en (w, b) una vez al
+                # cargar, así el scoring (apilado, detector) sigue
+                # siendo un solo producto sobre el HOG completo
+                w, b = projection.fold(w, b)
+                meta["projection"] = projection.info()
+            return LinearScorer(w, b), meta
+
+        meta_path_abs = os.path.join(artifacts_dir, "meta.json")
+        meta = None
+        if os.path.isfile(meta_path_abs):
+            with open(meta_path_abs, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+        if not os.path.isfile(artifact_path_abs):
+            raise FileNotFoundError(f"Artifact not found: {artifact_path_abs}")
+        if isinstance(meta, dict) and meta.get("projection"):
+            # El XML de un modelo proyectado espera features reducidas
+            raise FileNotFoundError(f"Projected model requires {npz_path_abs}")
+
+        svm = cv2.ml.SVM_load(artifact_path_abs)
+        return LinearScorer.from_svm(svm), meta
 
-        session = SessionLocal()
-        try:
-            model: Model | None = session.get(Model, model_uuid)
-            if not model:
-                raise FileNotFoundError(f"Model {model_uuid} not found")
+    @staticmethod
+    def _load_artifacts(model_uuid: str, version: int | None = None):
+        """
+        Carga (y cachea) SVM + HOG para el modelo.
+        Si se pasa 'version' (la que el API ya leyó de la BD) el hit no toca MySQL;
+        un /train que incrementa Model.version invalida la entrada de forma natural.
+        Devuelve (scorer, hog, decision_threshold, calibration_dict, decode); 'decode'
+        es el modo de lectura de imágenes con que se entrenó (DECODE_FULL si la
+        versión es anterior al decode reducido).
+        """
+        if version is not None:
+            entry = InferenceService._cache.get((model_uuid, int(version)))
+            if entry is not None:
+                return entry
+
+        # Metadatos desde el cache compartido con el API (sin sesión propia a MySQL)
+        model = model_meta_cache.get(model_uuid)
+        if not model:
+            raise FileNotFoundError(f"Model {model_uuid} not found")
+
+        key = (model_uuid, model.version)
+        if version is None:
+            entry = InferenceService._cache.get(key)
+            if entry is not None:
+                return entry
 
-            storage_root = os.getenv("STORAGE_ROOT", "./storage")
+        storage_root = os.getenv("STORAGE_ROOT", "./storage")
 
-            # Resolver ruta del XML (desde artifact_path relativo)
-            if model.artifact_path:
-                xml_path_abs = resolve_storage_path(storage_root, model.artifact_path)
-            else:
-                xml_path_abs = resolve_storage_path(
-                    storage_root, f"models/{model_uuid}/artifacts/svm_hog.xml"
-                )
+        # Resolver ruta del artefacto (desde artifact_path relativo)
+        if model.artifact_path:
+            artifact_path_abs = resolve_storage_path(storage_root, model.artifact_path)
+        else:
+            artifact_path_abs = resolve_storage_path(
+                storage_root, f"models/{model_uuid}/artifacts/svm_hog.xml"
+            )
+
+        scorer, meta = InferenceService._read_model_files(artifact_path_abs)
+        hog = InferenceService._build_hog(meta)
+
+        # 1) Threshold de decisión:
+        #    prioridad: meta.decision_threshold -> model.threshold -> default
+        decision_threshold = None
+        if isinstance(meta, dict):
+            decision_threshold = meta.get("decision_threshold")
+        if decision_threshold is None:
+            decision_threshold = (
+                model.threshold
+                if model.threshold is not None
+                else InferenceService.DEFAULT_DECISION_THRESHOLD
+            )
+        else:
+            decision_threshold = float(decision_threshold)
+
+        # 2) Parámetros de calibración (opcional)
+        #    ejemplo en meta.json:
+        #    "calibration": {"type":"platt","A":-1.23,"B":0.45}
+        #    o "calibration": {"type":"temperature","t":1.5}
+        calibration: Dict[str, Any] = {}
+        if isinstance(meta, dict):
+            cal = meta.get("calibration")
+            if isinstance(cal, dict):
+                calibration = cal
+
+        decode = (meta.get("decode") if isinstance(meta, dict) else None) or DECODE_FULL
+
+        entry = (scorer, hog, decision_threshold, calibration, decode)
+        # Versiones anteriores del mismo modelo ya no se sirven
+        InferenceService._cache.discard(lambda k: k[0] == model_uuid and k != key)
+        InferenceService._cache.put(key, entry, InferenceService._entry_nbytes(scorer, hog))
+        return entry
 
-            meta_path_abs = os.path.join(os.path.dirname(xml_path_abs), "meta.json")
-            meta = None
-            if os.path.isfile(meta_path_abs):
-                with open(meta_path_abs, "r", encoding="utf-8") as f:
-                    meta = json.load(f)
-
-            if not os.path.isfile(xml_path_abs):
-                raise FileNotFoundError(f"Artifact not found: {xml_path_abs}")
-
-            svm = cv2.ml.SVM_load(xml_path_abs)
-            hog = InferenceService._build_hog(meta)
-
-            # 1) Threshold de decisión:
-            #    prioridad: meta.decision_threshold -> model.threshold -> default
-            decision_threshold = None
-            if isinstance(meta, dict):
-                decision_threshold = meta.get("decision_threshold")
-            if decision_threshold is None:
-                decision_threshold = (
-                    float(model.threshold)
-                    if model.threshold is not None
-                    else InferenceService.DEFAULT_DECISION_THRESHOLD
-                )
-            else:
-                decision_threshold = float(decision_threshold)
-
-            # 2) Parámetros de calibración (opcional)
-            #    ejemplo en meta.json:
-            #    "calibration": {"type":"platt","A":-1.23,"B":0.45}
-            #    o "calibration": {"type":"temperature","t":1.5}
-            calibration: Dict[str, Any] = {}
-            if isinstance(meta, dict):
-                cal = meta.get("calibration")
-                if isinstance(cal, dict):
-                    calibration = cal
-
-            InferenceService._cache[model_uuid] = (svm, hog, decision_threshold, calibration)
-            return svm, hog, decision_threshold, calibration
-        finally:
-            session.close()
-
-    @staticmethod
-    def _featurize(hog: cv2.HOGDescriptor, image_path: str) -> np.ndarray:
-        img = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    @staticmethod
+    def _read_gray(image: ImageSource, target: tuple[int, int] | None = None,
+                   decode: str = DECODE_FULL) -> np.ndarray:
+        """
+        Ruta -> cv2.imread; bytes/buffer del request -> cv2.imdecode (sin tocar disco).
+        'decode' es el del modelo: con DECODE_REDUCED y 'target' se usa el decode
+        reducido en gris según la cabecera.
+        """
+        img = load_gray(image, target, decode)
         if img is None:
-            raise FileNotFoundError(f"Image not found or unreadable: {image_path}")
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                raise ValueError("Image buffer could not be decoded")
+            raise FileNotFoundError(f"Image not found or unreadable: {image}")
+        return img
+
+    @staticmethod
+    def _resolve_image(image: ImageSource) -> ImageSource:
+        if isinstance(image, str):
+            return resolve_storage_path(os.getenv("STORAGE_ROOT", "./storage"), image)
+        return image
 
+    @staticmethod
+    def _featurize(hog: cv2.HOGDescriptor, image: ImageSource, decode: str = DECODE_FULL) -> np.ndarray:
         win_w, win_h = hog.winSize
+        gray = InferenceService._read_gray(image, (win_w, win_h), decode)
         resized = cv2.resize(gray, (win_w, win_h), interpolation=cv2.INTER_AREA)
 
         feat = hog.compute(resized).reshape(1, -1).astype(np.float32)
         return feat
 
     @staticmethod
-    def _sigmoid(x: float, temperature: float) -> float:
-        t = max(1e-6, float(temperature))
-        return 1.0 / (1.0 + math.exp(-x / t))
+    def _featurize_batch(hog: cv2.HOGDescriptor, images: List[ImageSource],
+                         decode: str = DECODE_FULL) -> np.ndarray:
+        """
+        Construye la matriz (N, D) de HOG para varias imágenes.
+        Se preasigna con la dimensión del descriptor para evitar listas + vstack.
+        """
+        feats = np.empty((len(images), hog.getDescriptorSize()), dtype=np.float32)
+        for i, image in enumerate(images):
+            feats[i] = InferenceService._featurize(hog, image, decode).ravel()
+        return feats
+
+    @staticmethod
+    def _calibrate(dist: np.ndarray, calibration: Dict[str, Any]) -> np.ndarray:
+        """Distancias al hiperplano -> P(clase positiva), vectorizado."""
+        dist = np.asarray(dist, dtype=np.float64)
+        ctype = (calibration.get("type") if isinstance(calibration, dict) else None)
+        if ctype == "platt":
+            # 1) Platt: p = 1 / (1 + exp(A*dist + B))
+            A = float(calibration.get("A", 0.0))
+            B = float(calibration.get("B", 0.0))
+            z = -(A * dist + B)
+        elif ctype == "temperature":
+            # 2) Temperature scaling: p = sigmoid(dist / t)
+            t = float(calibration.get("t", InferenceService.DEFAULT_TEMPERATURE))
+            z = dist / max(1e-6, t)
+        else:
+            # Fallback histórico (sigmoide con temperature por defecto)
+            z = dist / InferenceService.DEFAULT_TEMPERATURE
+        return 1.0 / (1.0 + np.exp(-np.clip(z, -500.0, 500.0)))
+
+    @staticmethod
+    def _decide(p_pos: np.ndarray, thr: float) -> List[dict]:
+        approved = p_pos >= thr
+        confidence = np.where(approved, p_pos, 1.0 - p_pos)
+        return [
+            {"approved": bool(a), "confidence": round(float(c), 4)}
+            for a, c in zip(approved, confidence)
+        ]
+
+    @staticmethod
+    def prediction_cache_stats() -> dict:
+        return InferenceService._prediction_cache.stats()
 
     @staticmethod
-    def predict(model_uuid: str, image_path: str, threshold: float | None = None) -> dict:
+    def predict(model_uuid: str, image: ImageSource, threshold: float | None = None,
+                version: int | None = None, sha256: str | None = None) -> dict:
         """
         Inferencia binaria (approved/rejected).
+        'image' puede ser una ruta de storage o los bytes del upload.
         'threshold' compara contra P(clase positiva).
+        'version' (Model.version) selecciona la entrada del cache sin ir a la BD.
+        'sha256' del contenido habilita el cache de predicciones.
         """
-        storage_root = os.getenv("STORAGE_ROOT", "./storage")
-        image_abs = resolve_storage_path(storage_root, image_path)
+        return InferenceService.predict_batch(
+            model_uuid, [image], threshold, version, [sha256]
+        )[0]
+
+    @staticmethod
+    def predict_batch(model_uuid: str, images: List[ImageSource], threshold: float | None = None,
+                      version: int | None = None, sha256s: List[str | None] | None = None) -> List[dict]:
+        """
+        Inferencia binaria para N imágenes del mismo modelo (rutas o bytes).
+        Un solo HOG por imagen y UN producto matriz-vector para todo el lote.
+        Con version + sha256 se reutiliza P(positiva) ya calculada: un hit evita
+        decode, HOG y SVM; el umbral se aplica después, así que sirve para cualquiera.
+        """
+        if not images:
+            return []
 
-        svm, hog, default_thr, calibration = InferenceService._load_artifacts(model_uuid)
+        p_pos, default_thr = InferenceService.probabilities(model_uuid, images, version, sha256s)
         thr = float(threshold if threshold is not None else default_thr)
+        return InferenceService._decide(p_pos, thr)
+
+    @staticmethod
+    def probabilities(model_uuid: str, images: List[ImageSource], version: int | None = None,
+                      sha256s: List[str | None] | None = None) -> tuple[np.ndarray, float]:
+        """
+        P(clase positiva) calibrada para N imágenes + umbral por defecto del modelo.
+        Base de predict/predict_batch y de los modos que deciden con su propia
+        lógica (p. ej. suavizado temporal en streaming).
+        """
+        scorer, hog, default_thr, calibration, decode = InferenceService._load_artifacts(model_uuid, version)
+
+        pcache = InferenceService._prediction_cache
+        keys = [
+            (model_uuid, int(version), sha)
+            if (InferenceService.PREDICTION_CACHE_ENABLED and version is not None and sha) else None
+            for sha in (sha256s or [None] * len(images))
+        ]
+
+        p_pos = np.empty(len(images), dtype=np.float64)
+        missing = []
+        for i, key in enumerate(keys):
+            cached = pcache.get(key) if key is not None else None
+            if cached is None:
+                missing.append(i)
+            else:
+                p_pos[i] = cached
 
-        feat = InferenceService._featurize(hog, image_abs)
+        if missing:
+            feats = InferenceService._featurize_batch(
+                hog, [InferenceService._resolve_image(images[i]) for i in missing], decode
+            )
+            # Distancias al hiperplano (un producto matriz-vector) -> probabilidad calibrada
+            p_new = InferenceService._calibrate(scorer.decision(feats), calibration)
+            p_pos[missing] = p_new
+            for i, p in zip(missing, p_new):
+                if keys[i] is not None:
+                    pcache.put(keys[i], float(p), InferenceService.PREDICTION_ENTRY_NBYTES)
 
-        # Etiqueta 0/1 (por compatibilidad y fallback)
-        _ret, labels = svm.predict(feat)
-        label = int(labels.ravel()[0])
+        return p_pos, default_thr
 
-        # Distancia al hiperplano (raw score). Si no está disponible, fallback con el label.
-        RAW = getattr(cv2.ml, "STAT_MODEL_RAW_OUTPUT", 1)
-        try:
-            _ret2, raw = svm.predict(feat, flags=RAW)
-            dist = float(raw.ravel()[0])
-        except Exception:
-            dist = 1.0 if label == 1 else -1.0
-
-        # --- Calibración a probabilidad de clase positiva ---
-        # 1) Platt: p = 1 / (1 + exp(A*dist + B))
+    @staticmethod
+    def _hog_key(hog: cv2.HOGDescriptor) -> tuple:
+        return (tuple(hog.winSize), tuple(hog.blockSize), tuple(hog.blockStride),
+                tuple(hog.cellSize), int(hog.nbins))
+
+    @staticmethod
+    def _stacked_weights(keys: tuple, scorers: List[LinearScorer]) -> tuple[np.ndarray, np.ndarray]:
+        """(K, D) pesos + (K,) bias de varios modelos lineales; cacheado por combinación."""
+        entry = InferenceService._stack_cache.get(keys)
+        if entry is None:
+            W = np.ascontiguousarray(np.stack([sc.w for sc in scorers]), dtype=np.float32)
+            b = np.array([sc.b for sc in scorers], dtype=np.float64)
+            entry = (W, b)
+            InferenceService._stack_cache.put(keys, entry, W.nbytes + b.nbytes)
+        return entry
+
+    @staticmethod
+    def predict_models(models: List[tuple], image: ImageSource, sha256: str | None = None) -> List[dict]:
+        """
+        Una imagen contra varios modelos.
+        models: [(model_uuid, version, threshold), ...]
+        El HOG se calcula una vez por configuración HOG distinta (normalmente una)
+        y los modelos lineales se puntúan con un solo GEMM contra sus pesos apilados.
+        """
+        if not models:
+            return []
+
+        loaded = [
+            InferenceService._load_artifacts(model_uuid, version)
+            for model_uuid, version, _thr in models
+        ]
+
+        p_pos = np.empty(len(models), dtype=np.float64)
+        pcache = InferenceService._prediction_cache
+        cache_keys: List[tuple | None] = []
+        groups: Dict[tuple, List[int]] = {}
+        for i, ((model_uuid, version, _thr), (scorer, hog, _dthr, _cal, decode)) in enumerate(zip(models, loaded)):
+            key = (
+                (model_uuid, int(version), sha256)
+                if (InferenceService.PREDICTION_CACHE_ENABLED and version is not None and sha256) else None
+            )
+            cache_keys.append(key)
+            cached = pcache.get(key) if key is not None else None
+            if cached is None:
+                groups.setdefault((InferenceService._hog_key(hog), decode), []).append(i)
+            else:
+                p_pos[i] = cached
+
+        image = InferenceService._resolve_image(image) if groups else image
+        for idxs in groups.values():
+            hog, decode = loaded[idxs[0]][1], loaded[idxs[0]][4]
+            feat = InferenceService._featurize(hog, image, decode)
+
+            linear = [i for i in idxs if loaded[i][0].w is not None]
+            dist = np.empty(len(models), dtype=np.float64)
+            if linear:
+                W, b = InferenceService._stacked_weights(
+                    tuple((models[i][0], models[i][1]) for i in linear),
+                    [loaded[i][0] for i in linear],
+                )
+                # (1, D) @ (D, K): todas las distancias en una sola multiplicación
+                dist[linear] = (feat @ W.T).astype(np.float64).ravel() + b
+            for i in idxs:
+                if loaded[i][0].w is None:
+                    dist[i] = loaded[i][0].decision(feat)[0]
+
+            for i in idxs:
+                p = float(InferenceService._calibrate(dist[i:i + 1], loaded[i][3])[0])
+                p_pos[i] = p
+                if cache_keys[i] is not None:
+                    pcache.put(cache_keys[i], p, InferenceService.PREDICTION_ENTRY_NBYTES)
+
+        results = []
+        for i, (model_uuid, _version, thr) in enumerate(models):
+            thr = float(thr if thr is not None else loaded[i][2])
+            r = InferenceService._decide(p_pos[i:i + 1], thr)[0]
+            r["uuid"] = model_uuid
+            r["threshold"] = thr
+            results.append(r)
+        return results
+
+    # Progreso del precalentamiento (lo lee /readiness)
+    _warmup_lock = threading.Lock()
+    _warmup: Dict[str, Any] = {"state": "disabled", "total": 0, "loaded": 0, "failed": 0, "errors": {}}
+
+    @staticmethod
+    def warmup_status() -> Dict[str, Any]:
+        with InferenceService._warmup_lock:
+            status = dict(InferenceService._warmup)
+            status["errors"] = dict(status["errors"])
+            return status
+
+    @staticmethod
+    def warmup(models: List[ModelMeta], max_workers: int = 4):
+        """
+        Carga en paralelo los artefactos de los modelos dados (típicamente todos
+        los 'ready') en el cache, para que el primer /validate no pague SVM_load,
+        lectura de meta ni consulta a BD.
+        """
+        with InferenceService._warmup_lock:
+            InferenceService._warmup = {
+                "state": "running",
+                "total": len(models),
+                "loaded": 0,
+                "failed": 0,
+                "errors": {},
+                "started_at": time.time(),
+            }
+
+        for meta in models:
+            model_meta_cache.put(meta)
+
+        def _load(meta: ModelMeta):
+            try:
+                InferenceService._load_artifacts(meta.uuid, meta.version)
+                with InferenceService._warmup_lock:
+                    InferenceService._warmup["loaded"] += 1
+            except Exception as e:
+                with InferenceService._warmup_lock:
+                    InferenceService._warmup["failed"] += 1
+                    InferenceService._warmup["errors"][meta.uuid] = str(e)
+
+        with ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="warmup") as pool:
+            list(pool.map(_load, models))
+
+        with InferenceService._warmup_lock:
+            InferenceService._warmup["state"] = "done"
+            InferenceService._warmup["finished_at"] = time.time()
+
+    @staticmethod
+    def start_warmup(max_workers: int = 4) -> threading.Thread:
+        """Lanza warmup() en segundo plano con todos los modelos 'ready'."""
+        from app.db import models as db_models
+        from app.db.repositories import ModelRepository
+
+        with InferenceService._warmup_lock:
+            InferenceService._warmup = {"state": "pending", "total": 0, "loaded": 0, "failed": 0, "errors": {}}
+
+        def _run():
+            try:
+                db = db_models.SessionLocal()
+                try:
+                    models = [ModelMeta.from_model(m) for m in ModelRepository.get_all_ready(db)]
+                finally:
+                    db.close()
+                InferenceService.warmup(models, max_workers)
+            except Exception as e:
+                with InferenceService._warmup_lock:
+                    InferenceService._warmup["state"] = "failed"
+                    InferenceService._warmup["errors"]["_"] = str(e)
+                print(f"[WARMUP] ERROR: {e}")
+
+        t = threading.Thread(target=_run, name="inference-warmup", daemon=True)
+        t.start()
+        return t
+
+    @staticmethod
+    def _probability_to_decision(p: float, calibration: Dict[str, Any]) -> float:
+        """Inversa de _calibrate: umbral en probabilidad -> umbral en distancia."""
+        p = min(max(float(p), 1e-6), 1.0 - 1e-6)
+        logit = math.log(p / (1.0 - p))
         ctype = (calibration.get("type") if isinstance(calibration, dict) else None)
         if ctype == "platt":
             A = float(calibration.get("A", 0.0))
             B = float(calibration.get("B", 0.0))
-            p_pos = 1.0 / (1.0 + math.exp(A * dist + B))
-        elif ctype == "temperature":
-            # 2) Temperature scaling: p = sigmoid(dist / t)
-            t = float(calibration.get("t", InferenceService.DEFAULT_TEMPERATURE))
-            t = max(1e-6, t)
-            p_pos = 1.0 / (1.0 + math.exp(-dist / t))
-        else:
-            # Fallback histórico (sigmoide con temperature por defecto)
-            t = InferenceService.DEFAULT_TEMPERATURE
-            p_pos = 1.0 / (1.0 + math.exp(-dist / t))
+            if A == 0.0:
+                return 0.0
+            return (-logit - B) / A
+        if ctype == "temperature":
+            t = max(1e-6, float(calibration.get("t", InferenceService.DEFAULT_TEMPERATURE)))
+            return logit * t
+        return logit * InferenceService.DEFAULT_TEMPERATURE
 
-        approved = p_pos >= thr
-        confidence = p_pos if approved else (1.0 - p_pos)
+    @staticmethod
+    def _detector(model_uuid: str, version: int | None) -> tuple[cv2.HOGDescriptor, Dict[str, Any], float, str]:
+        """
+        HOGDescriptor con el vector (w, b) del modelo cargado como detector
+        SVM (setSVMDetector), cacheado por (uuid, version).
+        """
+        scorer, hog, default_thr, calibration, decode = InferenceService._load_artifacts(model_uuid, version)
+        if scorer.w is None:
+            raise ModelNotLinearError(f"Model {model_uuid} is not a linear SVM")
+
+        key = (model_uuid, version if version is not None else model_meta_cache.get(model_uuid).version)
+        det = InferenceService._detector_cache.get(key)
+        if det is None:
+            det = cv2.HOGDescriptor(
+                tuple(hog.winSize), tuple(hog.blockSize), tuple(hog.blockStride),
+                tuple(hog.cellSize), int(hog.nbins)
+            )
+            # detectMultiScale puntúa cada ventana como  svmDetector[:-1] . x + svmDetector[-1]
+            det.setSVMDetector(np.append(scorer.w, np.float32(scorer.b)).astype(np.float32))
+            InferenceService._detector_cache.put(key, det, InferenceService._entry_nbytes(scorer, hog))
+        return det, calibration, default_thr, decode
 
+    @staticmethod
+    def detect(model_uuid: str, image: ImageSource, threshold: float | None = None,
+               version: int | None = None, scale: float = 1.05, win_stride: int = 8,
+               max_side: int = 1600, group_threshold: int = 0, nms_iou: float = 0.3) -> dict:
+        """
+        Detección por ventana deslizante: el modelo lineal HOG se usa como
+        detector nativo de OpenCV (detectMultiScale, multi-escala en C++).
+        Devuelve cajas en coordenadas de la imagen original con su score.
+
+        group_threshold=0 (default): sin agrupado de OpenCV, las ventanas
+        solapadas se reducen con NMS (nms_iou) sobre la probabilidad, así un
+        único acierto no se pierde. >0: groupRectangles de OpenCV, que exige
+        group_threshold+1 ventanas solapadas (el default de OpenCV es 2).
+        Sin detecciones, 'confidence' es la del rechazo: 1 - la mejor
+        probabilidad de ventana (1.0 si ninguna superó el umbral de hit).
+        """
+        det, calibration, default_thr, decode = InferenceService._detector(model_uuid, version)
+        thr = float(threshold if threshold is not None else default_thr)
+
+        # Sin 'target': la imagen entera, convertida a gris como en el entrenamiento
+        gray = InferenceService._read_gray(InferenceService._resolve_image(image), decode=decode)
+        h, w = gray.shape[:2]
+
+        # Acota la resolución de trabajo; las cajas se reescalan al final
+        factor = 1.0
+        if max_side and max(h, w) > max_side:
+            factor = max_side / float(max(h, w))
+            gray = cv2.resize(gray, (int(round(w * factor)), int(round(h * factor))), interpolation=cv2.INTER_AREA)
+        win_w, win_h = det.winSize
+        if gray.shape[1] < win_w or gray.shape[0] < win_h:
+            up = max(win_w / gray.shape[1], win_h / gray.shape[0])
+            factor *= up
+            gray = cv2.resize(gray, (int(np.ceil(gray.shape[1] * up)), int(np.ceil(gray.shape[0] * up))))
+
+        stride = max(1, int(win_stride))
+        rects, weights = det.detectMultiScale(
+            gray,
+            hitThreshold=InferenceService._probability_to_decision(thr, calibration),
+            winStride=(stride, stride),
+            padding=(0, 0),
+            scale=max(1.01, float(scale)),
+            groupThreshold=max(0.0, float(group_threshold)),
+        )
+
+        rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4) / factor
+        scores = np.asarray(weights, dtype=np.float64).ravel()
+        probs = InferenceService._calibrate(scores, calibration) if len(scores) else scores
+        if group_threshold <= 0 and len(rects) > 1:
+            keep = np.asarray(cv2.dnn.NMSBoxes(
+                rects.tolist(), probs.astype(np.float32).tolist(), 0.0, float(nms_iou)
+            ), dtype=np.int64).reshape(-1)
+            rects, scores, probs = rects[keep], scores[keep], probs[keep]
+
+        detections = [
+            {
+                "x": int(round(x)), "y": int(round(y)),
+                "w": int(round(bw)), "h": int(round(bh)),
+                "score": round(float(sc), 4),
+                "confidence": round(float(p), 4),
+            }
+            for (x, y, bw, bh), sc, p in zip(rects, scores, probs)
+            if p >= thr
+        ]
+        detections.sort(key=lambda d: d["confidence"], reverse=True)
+
+        if detections:
+            confidence = detections[0]["confidence"]
+        else:
+            confidence = round(1.0 - float(probs.max()), 4) if len(probs) else 1.0
         return {
-            "approved": bool(approved),
-            "confidence": round(float(confidence), 4)
+            "approved": bool(detections),
+            "confidence": confidence,
+            "detections": detections,
+            "image_size": {"w": int(w), "h": int(h)},
         }
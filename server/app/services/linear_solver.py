@@ -0,0 +1,87 @@
+# app/services/linear_solver.py
+import numpy as np
+
+
+class LinearSGD:
+    """
+    SVM lineal (hinge + L2) entrenado por SGD en mini-lotes, estilo Pegasos.
+    Misma orientación que LinearScorer: score = x @ w + b, positivo = clase 1.
+
+    Arranque en caliente: se parte de (w, b) de una versión anterior y, con
+    'anchor', la regularización tira hacia esos pesos en vez de hacia 0, así
+    unos pocos samples nuevos ajustan el modelo sin olvidar lo aprendido.
+    Como solo consume lotes (partial_fit), sirve igual sobre matrices en
+    memoria que sobre trozos leídos de un memmap.
+    """
+
+    def __init__(self, dim: int, alpha: float = 1e-4, lr0: float = 0.05,
+                 w: np.ndarray | None = None, b: float = 0.0, anchor: bool = False,
+                 class_weight: dict | None = None):
+        self.dim = int(dim)
+        self.alpha = float(alpha)
+        self.lr0 = float(lr0)
+        self.w = np.zeros(self.dim, dtype=np.float64) if w is None else np.array(w, dtype=np.float64).ravel()
+        self.b = float(b)
+        self._anchor = self.w.copy() if anchor else None
+        self.class_weight = class_weight or {0: 1.0, 1: 1.0}
+        self.t = 0
+
+    @staticmethod
+    def balanced_weights(y: np.ndarray) -> dict:
+        """Pesos por clase inversos a su frecuencia (equivale al balanceo 1:1)."""
+        y = np.asarray(y)
+        n, n_pos = len(y), int(np.sum(y == 1))
+        n_neg = n - n_pos
+        if not n_pos or not n_neg:
+            return {0: 1.0, 1: 1.0}
+        return {0: n / (2.0 * n_neg), 1: n / (2.0 * n_pos)}
+
+    def partial_fit(self, X: np.ndarray, y: np.ndarray):
+        """Un paso de SGD sobre el lote (X (n, D), y en {0, 1})."""
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y)
+        n = len(y)
+        if n == 0:
+            return self
+        ys = np.where(y == 1, 1.0, -1.0)
+        cw = np.where(y == 1, self.class_weight.get(1, 1.0), self.class_weight.get(0, 1.0))
+        margin = ys * ((X @ self.w.astype(np.float32)).astype(np.float64) + self.b)
+        coef = np.where(margin < 1.0, cw * ys, 0.0)  # subgradiente del hinge
+
+        eta = self.lr0 / (1.0 + self.lr0 * self.alpha * self.t)
+        reg = self.w if self._anchor is None else self.w - self._anchor
+        grad_w = self.alpha * reg - (coef.astype(np.float32) @ X).astype(np.float64) / n
+        grad_b = -coef.sum() / n
+        self.w -= eta * grad_w
+        self.b -= eta * grad_b
+        self.t += 1
+        return self
+
+    def fit(self, X: np.ndarray, y: np.ndarray, epochs: int = 5, batch_size: int = 256,
+            rng: np.random.Generator | None = None, index: np.ndarray | None = None,
+            rows: np.ndarray | None = None):
+        """
+        Varias pasadas barajadas sobre los samples 'index' (por defecto todos).
+        'rows' mapea sample -> fila de X (p. ej. filas del almacén de features);
+        sin él, el sample i es la fila i.
+        Solo se copia un mini-lote a la vez: X puede ser un memmap.
+        """
+        rng = rng or np.random.default_rng(0)
+        index = np.arange(len(y)) if index is None else np.asarray(index)
+        batch_size = max(1, int(batch_size))
+        for _epoch in range(max(1, int(epochs))):
+            order = rng.permutation(index)
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                x_rows = batch if rows is None else rows[batch]
+                # Filas ordenadas dentro del lote: lectura secuencial si X es un memmap
+                o = np.argsort(x_rows, kind="stable")
+                self.partial_fit(X[x_rows[o]], y[batch[o]])
+        return self
+
+    def decision(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        return (X @ self.w.astype(np.float32)).astype(np.float64) + self.b
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return (self.decision(X) > 0).astype(np.int32)
@@ -0,0 +1,176 @@
+# app/services/model_cache.py
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class ArtifactCache:
+    """
+    Cache LRU acotado por número de entradas y por bytes, con TTL opcional.
+    Clave típica: (model_uuid, version). Cada entrada declara su tamaño
+    al insertarse para poder dimensionar los workers de forma predecible.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 256 * 1024 * 1024,
+                 ttl_seconds: float | None = None):
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self.ttl_seconds = float(ttl_seconds) if ttl_seconds else None
+        # key -> (value, nbytes, expires_at | None)
+        self._data: "OrderedDict[Hashable, tuple[Any, int, float | None]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            if item[2] is not None and item[2] <= time.monotonic():
+                del self._data[key]
+                self._bytes -= item[1]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: Any, nbytes: int):
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, int(nbytes), expires_at)
+            self._bytes += int(nbytes)
+            # Siempre se conserva la entrada recién insertada
+            while len(self._data) > 1 and (
+                len(self._data) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                _k, (_v, n, _exp) = self._data.popitem(last=False)
+                self._bytes -= n
+                self.evictions += 1
+
+    def discard(self, predicate) -> int:
+        """Elimina las claves que cumplan predicate(key). Devuelve cuántas."""
+        with self._lock:
+            keys = [k for k in self._data if predicate(k)]
+            for k in keys:
+                self._bytes -= self._data.pop(k)[1]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'ttl_seconds': self.ttl_seconds,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class ModelMeta:
+    """Copia inmutable (sin sesión ORM) de los campos de Model que usa el hot path."""
+    __slots__ = ("uuid", "status", "threshold", "version", "artifact_path")
+
+    def __init__(self, uuid: str, status: str, threshold: float | None, version: int, artifact_path: str | None):
+        self.uuid = uuid
+        self.status = status
+        self.threshold = threshold
+        self.version = version
+        self.artifact_path = artifact_path
+
+    @classmethod
+    def from_model(cls, model) -> "ModelMeta":
+        return cls(
+            model.uuid,
+            model.status,
+            float(model.threshold) if model.threshold is not None else None,
+            int(model.version or 0),
+            model.artifact_path,
+        )
+
+
+class ModelMetadataCache:
+    """
+    Metadatos de modelos en memoria, compartidos por el API y la inferencia.
+    Un hit no toca MySQL. Se invalida por TTL (cambios hechos por otros
+    procesos) y explícitamente cuando este proceso publica una versión.
+    Los UUID inexistentes no se cachean (un /register recién hecho se ve al instante).
+    """
+
+    def __init__(self, loader, ttl_seconds: float = 5.0, max_entries: int = 4096):
+        # loader(list[str]) -> dict[uuid, ModelMeta]
+        self._loader = loader
+        self._cache = ArtifactCache(max_entries=max_entries, max_bytes=1 << 62, ttl_seconds=ttl_seconds)
+
+    def get(self, model_uuid: str) -> ModelMeta | None:
+        return self.get_many([model_uuid]).get(model_uuid)
+
+    def get_many(self, uuids: list[str]) -> dict[str, ModelMeta]:
+        found, missing = {}, []
+        for u in uuids:
+            meta = self._cache.get(u)
+            if meta is None:
+                missing.append(u)
+            else:
+                found[u] = meta
+        if missing:
+            for u, meta in self._loader(missing).items():
+                self._cache.put(u, meta, 512)
+                found[u] = meta
+        return found
+
+    def put(self, meta: ModelMeta):
+        self._cache.put(meta.uuid, meta, 512)
+
+    def invalidate(self, model_uuid: str):
+        self._cache.discard(lambda k: k == model_uuid)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+def _load_model_meta(uuids: list[str]) -> dict[str, ModelMeta]:
+    # SessionLocal se asigna en init_db(): se resuelve al llamar, no al importar
+    from app.db import models as db_models
+    from app.db.repositories import ModelRepository
+
+    db = db_models.SessionLocal()
+    try:
+        return {
+            u: ModelMeta.from_model(m)
+            for u, m in ModelRepository.get_many_by_uuid(db, uuids).items()
+        }
+    finally:
+        db.close()
+
+
+model_meta_cache = ModelMetadataCache(
+    _load_model_meta,
+    ttl_seconds=float(os.getenv("MODEL_META_TTL", 5)),
+)
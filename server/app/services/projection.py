@@ -0,0 +1,82 @@
+# app/services/projection.py
+import numpy as np
+
+
+class FeatureProjection:
+    """
+    Proyección lineal de features HOG ajustada en entrenamiento (PCA, con
+    whitening opcional):  z = (x - mean) @ components.T   ->  (N, k)
+    'components' ya incluye la escala de whitening si se pidió.
+    """
+    __slots__ = ("mean", "components", "whiten", "explained_variance")
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, whiten: bool = False,
+                 explained_variance: float | None = None):
+        self.mean = np.ascontiguousarray(mean, dtype=np.float32).ravel()
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+        self.whiten = bool(whiten)
+        self.explained_variance = explained_variance
+
+    @property
+    def dim_in(self) -> int:
+        return int(self.components.shape[1])
+
+    @property
+    def dim_out(self) -> int:
+        return int(self.components.shape[0])
+
+    @classmethod
+    def fit(cls, X: np.ndarray, n_components: int, whiten: bool = True,
+            eps: float = 1e-6) -> "FeatureProjection":
+        """
+        PCA sobre X (N, D). Con N < D se descompone la matriz de Gram (N, N)
+        en vez de la covarianza (D, D); el resultado es el mismo subespacio.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        n, d = X.shape
+        k = max(1, min(int(n_components), d, max(1, n - 1)))
+        mean = X.mean(axis=0, dtype=np.float64)
+        Xc = X.astype(np.float64) - mean
+
+        if n < d:
+            evals, evecs = np.linalg.eigh(Xc @ Xc.T)
+            order = np.argsort(evals)[::-1]
+            evals = np.clip(evals[order], 0.0, None)
+            # Vectores propios de Xc^T Xc a partir de los de Xc Xc^T
+            comps = (Xc.T @ evecs[:, order[:k]]).T
+            comps /= np.maximum(np.linalg.norm(comps, axis=1, keepdims=True), eps)
+        else:
+            evals, evecs = np.linalg.eigh(Xc.T @ Xc)
+            order = np.argsort(evals)[::-1]
+            evals = np.clip(evals[order], 0.0, None)
+            comps = evecs[:, order[:k]].T
+
+        var = evals / max(1, n - 1)
+        total = float(var.sum())
+        explained = float(var[:k].sum() / total) if total > 0 else 1.0
+        if whiten:
+            comps = comps / np.sqrt(var[:k] + eps).reshape(-1, 1)
+        return cls(mean, comps, whiten, round(explained, 6))
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        return (X - self.mean) @ self.components.T
+
+    def fold(self, w: np.ndarray, b: float) -> tuple[np.ndarray, float]:
+        """
+        Un modelo lineal sobre z es lineal sobre x:
+          z @ w + b = x @ (components.T @ w) + (b - mean . components.T @ w)
+        Devuelve (w_x (D,), b_x); puntuar cuesta lo mismo que sin proyección.
+        """
+        w_x = self.components.T.astype(np.float64) @ np.asarray(w, dtype=np.float64).ravel()
+        b_x = float(b) - float(self.mean.astype(np.float64) @ w_x)
+        return w_x.astype(np.float32), b_x
+
+    def info(self) -> dict:
+        return {
+            "type": "pca",
+            "dim_in": self.dim_in,
+            "dim_out": self.dim_out,
+            "whiten": self.whiten,
+            "explained_variance": self.explained_variance,
+        }
@@ -0,0 +1,328 @@
+# app/services/scheduler.py
+import os
+import uuid
+import socket
+import threading
+from collections import deque
+
+from app.db import models as db_models
+from app.db.repositories import ModelRepository, TrainingJobRepository
+from app.services.model_cache import model_meta_cache
+
+
+class TrainingQueueFullError(Exception):
+    """La cola de entrenamiento alcanzó TRAINING_MAX_QUEUE."""
+
+
+def merge_params(queued: dict | None, new: dict | None) -> dict | None:
+    """
+    Parámetros de un job coalescido: ganan los últimos, salvo que un
+    incremental no rebaja a un completo que ya estaba en cola.
+    """
+    queued, new = queued or {}, dict(new or {})
+    if new.get('mode') == 'incremental' and queued.get('mode') != 'incremental':
+        new.pop('mode')
+        if queued.get('mode'):
+            new['mode'] = queued['mode']
+    return new or None
+
+
+class TrainingScheduler:
+    """
+    Cola acotada de jobs de entrenamiento con un pool fijo de hilos worker.
+      - coalescing: mientras un modelo tenga un job en cola (sin empezar),
+        nuevos /train del mismo modelo devuelven ese job (ver merge_params)
+      - nunca corren dos jobs del mismo modelo a la vez; un /train durante un
+        entrenamiento queda en cola y corre al terminar (ve los samples nuevos)
+      - al arrancar, recover() reencola los jobs 'queued'/'running' que quedaron
+        en training_jobs de un proceso anterior
+    El paso queued -> running es un UPDATE condicionado en la BD, así que un
+    job no lo ejecutan dos procesos aunque ambos lo tengan en cola. El job
+    reclamado lleva worker_id y lease como en los workers remotos; un hilo lo
+    renueva mientras corre, así recover() de otro proceso (otro worker de
+    gunicorn, el reloader) no lo toma mientras siga vivo.
+
+    executor='remote' (TRAINING_EXECUTOR): el API solo inserta la fila 'queued'
+    (coalescing por modelo en la BD) y la reclaman los workers de server/worker.py.
+    """
+
+    def __init__(self, runner, max_workers: int = 1, max_queue: int = 64, executor: str = 'local',
+                 lease_seconds: float = 60.0, heartbeat_seconds: float = 10.0):
+        self._runner = runner  # runner(job_id, model_uuid, params, worker_id)
+        self.executor = 'remote' if executor == 'remote' else 'local'
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(1, int(max_queue))
+        self.lease_seconds = float(lease_seconds)
+        self.heartbeat_seconds = min(float(heartbeat_seconds), self.lease_seconds / 2.0)
+        self._cond = threading.Condition()
+        self._queue: deque = deque()            # job_ids listos para correr, en orden
+        self._jobs: dict[str, tuple[str, dict | None]] = {}  # job_id -> (model_uuid, params)
+        self._queued_by_model: dict[str, str] = {}          # model_uuid -> job_id en cola
+        self._running_models: set[str] = set()
+        self._threads: list[threading.Thread] = []
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.recovered = 0
+
+    @property
+    def worker_id(self) -> str:
+        # Se calcula en cada llamada: con --preload el singleton se crea en el
+        # master de gunicorn y cada worker forkeado tiene otro pid
+        return f"api@{socket.gethostname()}:{os.getpid()}"
+
+    # ---------------------- ciclo de vida ---------------------- #
+    def start(self):
+        if self.executor == 'remote':
+            return
+        with self._cond:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.max_workers):
+                t = threading.Thread(target=self._loop, name=f"train-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def recover(self) -> int:
+        """
+        Reencola los jobs que un proceso anterior dejó 'queued'/'running'.
+        Por modelo se conserva uno; el resto se marca fallido como duplicado.
+        Solo un 'running' con el lease vencido se considera huérfano; los que
+        renueva otro proceso (del API o un worker remoto) no se tocan. En modo
+        remoto no hace nada: los workers reclaman solos los jobs con lease vencido.
+        """
+        if self.executor == 'remote':
+            return 0
+        db = db_models.SessionLocal()
+        try:
+            keep: dict[str, object] = {}
+            for job in TrainingJobRepository.get_unfinished(db):
+                if job.model_uuid in keep:
+                    TrainingJobRepository.update_status(
+                        db, job.id, 'failed',
+                        f"Coalesced into job {keep[job.model_uuid].id} on restart"
+                    )
+                    continue
+                keep[job.model_uuid] = job
+                if job.status == 'running':
+                    job.status = 'queued'
+                    job.started_at = None
+                    job.worker_id = None
+                    job.heartbeat_at = None
+                    job.lease_expires_at = None
+                    db.add(job)
+            db.commit()
+            jobs = [(job.id, job.model_uuid, _job_params(job)) for job in keep.values()]
+            for _job_id, model_uuid, _params in jobs:
+                ModelRepository.update_status(db, model_uuid, 'training')
+        finally:
+            db.close()
+
+        with self._cond:
+            for job_id, model_uuid, params in jobs:
+                if job_id in self._jobs:
+                    continue
+                self._jobs[job_id] = (model_uuid, params)
+                self._queued_by_model[model_uuid] = job_id
+                self._queue.append(job_id)
+            self.recovered += len(jobs)
+            self._cond.notify_all()
+        if jobs:
+            print(f"[TRAIN] recovered {len(jobs)} unfinished job(s)")
+        return len(jobs)
+
+    # ---------------------- encolado ---------------------- #
+    def submit(self, model_uuid: str, params: dict | None = None) -> tuple[str, bool]:
+        """Encola un entrenamiento. Devuelve (job_id, coalesced)."""
+        if self.executor == 'remote':
+            return self._submit_remote(model_uuid, params)
+        with self._cond:
+            job_id = self._queued_by_model.get(model_uuid)
+            if job_id is None and len(self._jobs) - len(self._running_models) >= self.max_queue:
+                raise TrainingQueueFullError(f"Training queue is full ({self.max_queue} jobs)")
+            if job_id is None:
+                # Reserva el lugar antes de crear la fila: un duplicado concurrente coalesce aquí
+                job_id = str(uuid.uuid4())
+                self._queued_by_model[model_uuid] = job_id
+                self._jobs[job_id] = (model_uuid, params)
+                coalesced = False
+            else:
+                params = merge_params(self._jobs[job_id][1], params)
+                self._jobs[job_id] = (model_uuid, params)
+                coalesced = True
+
+        db = db_models.SessionLocal()
+        try:
+            if coalesced:
+                TrainingJobRepository.set_params(db, job_id, params)
+                with self._cond:
+                    self.coalesced += 1
+                return job_id, True
+
+            # Otro proceso del API pudo dejar ya un job en cola para este modelo
+            other = TrainingJobRepository.get_queued_for_model(db, model_uuid)
+            if other is not None:
+                TrainingJobRepository.set_params(db, other.id, merge_params(_job_params(other), params))
+                with self._cond:
+                    self._forget(job_id, model_uuid)
+                    self.coalesced += 1
+                return other.id, True
+
+            TrainingJobRepository.create(db, job_id, model_uuid, params)
+            ModelRepository.update_status(db, model_uuid, 'training')
+            db.commit()
+        except Exception:
+            with self._cond:
+                self._forget(job_id, model_uuid)
+            raise
+        finally:
+            db.close()
+
+        self.start()
+        with self._cond:
+            self._queue.append(job_id)
+            self.submitted += 1
+            self._cond.notify_all()
+        return job_id, False
+
+    def _submit_remote(self, model_uuid: str, params: dict | None) -> tuple[str, bool]:
+        """Solo la fila en training_jobs; un worker remoto la reclamará."""
+        db = db_models.SessionLocal()
+        try:
+            queued = TrainingJobRepository.get_queued_for_model(db, model_uuid)
+            if queued is not None:
+                TrainingJobRepository.set_params(db, queued.id, merge_params(_job_params(queued), params))
+                with self._cond:
+                    self.coalesced += 1
+                return queued.id, True
+            if TrainingJobRepository.count_queued(db) >= self.max_queue:
+                raise TrainingQueueFullError(f"Training queue is full ({self.max_queue} jobs)")
+            job_id = str(uuid.uuid4())
+            TrainingJobRepository.create(db, job_id, model_uuid, params)
+            ModelRepository.update_status(db, model_uuid, 'training')
+            db.commit()
+        finally:
+            db.close()
+        with self._cond:
+            self.submitted += 1
+        return job_id, False
+
+    def _forget(self, job_id: str, model_uuid: str):
+        self._jobs.pop(job_id, None)
+        if self._queued_by_model.get(model_uuid) == job_id:
+            del self._queued_by_model[model_uuid]
+
+    # ---------------------- workers ---------------------- #
+    def _keep_lease(self, job_id: str, worker_id: str, done: threading.Event):
+        """Renueva el lease del job cada heartbeat_seconds hasta que termine."""
+        while not done.wait(self.heartbeat_seconds):
+            db = db_models.SessionLocal()
+            try:
+                if not TrainingJobRepository.heartbeat(db, job_id, worker_id, self.lease_seconds):
+                    # Terminó o lo reclamó otro proceso: run_job no escribirá el resultado
+                    return
+            except Exception as e:
+                # Error transitorio de BD: se reintenta en el próximo tick
+                print(f"[TRAIN][{job_id}] heartbeat error: {e}")
+            finally:
+                db.close()
+
+    def _next_job(self):
+        """Primer job en cola cuyo modelo no se esté entrenando ya (bajo el lock)."""
+        for job_id in self._queue:
+            model_uuid, params = self._jobs[job_id]
+            if model_uuid not in self._running_models:
+                self._queue.remove(job_id)
+                return job_id, model_uuid, params
+        return None
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                picked = self._next_job()
+                while picked is None:
+                    self._cond.wait()
+                    picked = self._next_job()
+                job_id, model_uuid, params = picked
+                # Desde aquí un /train nuevo del modelo abre otro job
+                if self._queued_by_model.get(model_uuid) == job_id:
+                    del self._queued_by_model[model_uuid]
+                self._running_models.add(model_uuid)
+
+            outcome = 'failed'
+            done = threading.Event()
+            try:
+                worker_id = self.worker_id
+                db = db_models.SessionLocal()
+                try:
+                    claimed = TrainingJobRepository.claim(db, job_id, worker_id, self.lease_seconds)
+                finally:
+                    db.close()
+                if not claimed:
+                    outcome = 'skipped'
+                else:
+                    threading.Thread(
+                        target=self._keep_lease, args=(job_id, worker_id, done),
+                        name=f"train-lease-{job_id[:8]}", daemon=True
+                    ).start()
+                    if self._runner(job_id, model_uuid, params, worker_id):
+                        outcome = 'completed'
+            except Exception as e:
+                print(f"[TRAIN][{job_id}] scheduler error: {e}")
+            finally:
+                done.set()
+                with self._cond:
+                    self._jobs.pop(job_id, None)
+                    self._running_models.discard(model_uuid)
+                    setattr(self, outcome, getattr(self, outcome) + 1)
+                    self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'executor': self.executor,
+                'workers': self.max_workers if self.executor == 'local' else 0,
+                'max_queue': self.max_queue,
+                'queued': len(self._queue),
+                'running': len(self._running_models),
+                'submitted': self.submitted,
+                'coalesced': self.coalesced,
+                'recovered': self.recovered,
+                'completed': self.completed,
+                'failed': self.failed,
+                'skipped': self.skipped,
+            }
+
+
+def _job_params(job) -> dict | None:
+    return job.metrics.get('params') if isinstance(job.metrics, dict) else None
+
+
+def _run_training(job_id: str, model_uuid: str, params: dict | None, worker_id: str) -> bool:
+    """
+    TRAINING_ISOLATION=process (default): el job corre en un proceso hijo con
+    presupuesto de CPU propio, fuera del GIL y del pool de OpenCV del API.
+    TRAINING_ISOLATION=thread: en el hilo worker (comportamiento anterior).
+    """
+    if os.getenv('TRAINING_ISOLATION', 'process').lower() == 'process':
+        from app.services.training_process import run_training_process
+
+        timeout_s = float(os.getenv('TRAINING_JOB_TIMEOUT', 0)) or None
+        ok = run_training_process(job_id, model_uuid, params, timeout_s=timeout_s, worker_id=worker_id)
+        # El hijo publicó la versión en su proceso: este la ve sin esperar el TTL
+        model_meta_cache.invalidate(model_uuid)
+        return ok
+
+    from app.services.training import TrainingService
+    return TrainingService.run_job(job_id, model_uuid, params, worker_id=worker_id)
+
+
+training_scheduler = TrainingScheduler(
+    _run_training,
+    max_workers=int(os.getenv('TRAINING_MAX_CONCURRENT', 1)),
+    max_queue=int(os.getenv('TRAINING_MAX_QUEUE', 64)),
+    executor=os.getenv('TRAINING_EXECUTOR', 'local').lower(),
+    lease_seconds=float(os.getenv('TRAINING_LEASE_SECONDS', 60)),
+    heartbeat_seconds=float(os.getenv('TRAINING_HEARTBEAT_SECONDS', 10)),
+)
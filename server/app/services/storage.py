@@ -1,7 +1,88 @@
 import os
+import io
+import queue
+import atexit
+import random
 import hashlib
+import threading
 from werkzeug.utils import secure_filename
 
+EXT_MAP = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp'
+}
+
+
+class ValidationImageWriter:
+    """
+    Write-behind de imágenes de validación.
+    El request encola (path, bytes) y responde; un hilo de fondo escribe a disco.
+    Si la cola está llena se descarta la escritura (la predicción ya se respondió).
+    """
+
+    def __init__(self, max_queue: int = 256):
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="validation-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, file_path: str, data) -> bool:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((file_path, data))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            file_path, data = self._queue.get()
+            try:
+                # Mismo sha256 => mismo contenido, no reescribimos
+                if not os.path.exists(file_path):
+                    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                    tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+                    with open(tmp_path, 'wb') as f:
+                        f.write(data)
+                    os.replace(tmp_path, file_path)
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"[STORAGE] write-behind failed for {file_path}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Bloquea hasta vaciar la cola (tests / apagado ordenado)."""
+        if self._thread and self._thread.is_alive():
+            self._queue.join()
+
+    def stats(self) -> dict:
+        return {
+            'pending': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
+
+
+validation_writer = ValidationImageWriter(int(os.getenv('VALIDATION_PERSIST_QUEUE', 256)))
+atexit.register(validation_writer.flush)
+
+
 class StorageService:
     @staticmethod
     def save_sample(storage_root: str, model_uuid: str, label: str, file, mime_type: str):
@@ -74,3 +155,38 @@ class StorageService:
         size_bytes = len(file_content)
         
         return file_path, size_bytes
+
+    @staticmethod
+    def read_upload(file):
+        """
+        Lee el upload una sola vez y calcula su SHA256.
+        Si Werkzeug lo tiene en memoria (BytesIO) se usa su buffer sin copiar.
+        Returns: (data, sha256, size_bytes)
+        """
+        stream = getattr(file, 'stream', None)
+        if isinstance(stream, io.BytesIO):
+            data = stream.getbuffer()
+        else:
+            data = file.read()
+            file.seek(0)
+        sha256_hash = hashlib.sha256(data).hexdigest()
+        return data, sha256_hash, len(data)
+
+    @staticmethod
+    def persist_validation_image(storage_root: str, model_uuid: str, data, sha256_hash: str,
+                                 mime_type: str, rate: float = 1.0):
+        """
+        Agenda la escritura (write-behind) de una imagen de validación.
+        rate: 1.0 = todas, 0.0 = ninguna, intermedio = muestreo.
+        Returns: file_path si se agendó, None si se omitió por muestreo o cola llena.
+        """
+        if rate <= 0.0 or (rate < 1.0 and random.random() >= rate):
+            return None
+
+        ext = EXT_MAP.get(mime_type, 'jpg')
+        file_path = os.path.join(storage_root, 'validations', model_uuid, f"{sha256_hash}.{ext}")
+
+        # El buffer del request se libera al terminar; el hilo necesita su propia copia
+        if validation_writer.submit(file_path, bytes(data)):
+            return file_path
+        return None
@@ -0,0 +1,179 @@
+# app/services/streaming.py
+import json
+import time
+import threading
+from collections import deque
+
+from app.services.admission import OverloadedError
+from app.services.inference import InferenceService
+from app.utils.images import JpegFrameSplitter
+
+
+class FrameStreamValidator:
+    """
+    Valida un flujo continuo de frames JPEG contra un modelo.
+
+    Un hilo lector consume el cuerpo del request y deja los frames completos
+    en una cola acotada; si el scoring se atrasa, los frames más viejos se
+    descartan (frame skipping) y siempre se puntúa lo más reciente.
+    Cada resultado se emite como una línea NDJSON en cuanto está listo.
+    Suavizado temporal opcional: media exponencial de P(positiva).
+    Con 'admission' cada lote puntuado pasa por el controlador de admisión
+    (un lugar por frame); si no hay capacidad el lote se descarta
+    (frames_shed) y se emite una línea con 'retry_after'.
+    """
+
+    READ_CHUNK = 64 * 1024
+
+    def __init__(self, model_uuid: str, version: int, threshold: float, stream,
+                 smoothing: float = 0.0, max_pending: int = 2,
+                 max_frame_bytes: int = 10 * 1024 * 1024, max_batch: int = 8,
+                 admission=None):
+        self.model_uuid = model_uuid
+        self.version = version
+        self.threshold = float(threshold)
+        self.smoothing = min(max(float(smoothing), 0.0), 0.99)
+        self.max_batch = max(1, int(max_batch))
+        self._stream = stream
+        self._admission = admission
+        self._splitter = JpegFrameSplitter(max_frame_bytes)
+        self._pending: deque = deque(maxlen=max(1, int(max_pending)))
+        self._cond = threading.Condition()
+        self._eof = False
+        self._stop = False
+        self._error = None
+
+        self.received = 0
+        self.scored = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.shed = 0
+        self.approved_frames = 0
+        self.smoothed_p = None
+
+    # ---------------------- lector ---------------------- #
+    def _reader(self):
+        try:
+            while not self._stop:
+                chunk = self._stream.read(self.READ_CHUNK)
+                if not chunk:
+                    break
+                try:
+                    frames = self._splitter.feed(chunk)
+                except ValueError as e:
+                    self._error = str(e)
+                    frames = []
+                if not frames:
+                    continue
+                with self._cond:
+                    for frame in frames:
+                        if len(self._pending) == self._pending.maxlen:
+                            # La cola llena descarta el frame más viejo
+                            self.skipped += 1
+                        self._pending.append((self.received, frame))
+                        self.received += 1
+                    self._cond.notify()
+        except Exception as e:
+            self._error = str(e)
+        finally:
+            with self._cond:
+                self._eof = True
+                self._cond.notify()
+
+    def _take(self) -> list:
+        with self._cond:
+            while not self._pending and not self._eof:
+                self._cond.wait()
+            batch = []
+            while self._pending and len(batch) < self.max_batch:
+                batch.append(self._pending.popleft())
+            return batch
+
+    # ---------------------- scoring ---------------------- #
+    def _admitted_score(self, batch: list) -> list[dict]:
+        if self._admission is None:
+            return self._score(batch)
+        try:
+            with self._admission.slot(self.model_uuid, cost=len(batch)):
+                return self._score(batch)
+        except OverloadedError as e:
+            # Sin capacidad: el lote se descarta y el stream sigue con lo próximo
+            self.shed += len(batch)
+            return [{'frame': idx, 'error': 'overloaded', 'retry_after': e.retry_after}
+                    for idx, _f in batch]
+
+    def _score(self, batch: list) -> list[dict]:
+        t0 = time.perf_counter()
+        results = []
+        # Los frames pendientes se puntúan juntos (una matriz); si alguno no
+        # decodifica se cae a frame por frame para aislarlo
+        good = list(batch)
+        try:
+            p_pos, _thr = InferenceService.probabilities(
+                self.model_uuid, [f for _i, f in good], self.version
+            )
+        except ValueError:
+            good, probs = [], []
+            for idx, frame in batch:
+                try:
+                    probs.append(InferenceService.probabilities(self.model_uuid, [frame], self.version)[0][0])
+                    good.append((idx, frame))
+                except ValueError:
+                    self.invalid += 1
+                    results.append({'frame': idx, 'error': 'undecodable frame'})
+            p_pos = probs
+        if good:
+            latency_ms = round((time.perf_counter() - t0) * 1000.0, 2)
+            for (idx, _f), p in zip(good, p_pos):
+                p = float(p)
+                if self.smoothed_p is None or self.smoothing == 0.0:
+                    self.smoothed_p = p
+                else:
+                    self.smoothed_p = self.smoothing * self.smoothed_p + (1.0 - self.smoothing) * p
+                approved = self.smoothed_p >= self.threshold
+                confidence = self.smoothed_p if approved else 1.0 - self.smoothed_p
+                self.scored += 1
+                self.approved_frames += int(approved)
+                results.append({
+                    'frame': idx,
+                    'approved': bool(approved),
+                    'confidence': round(float(confidence), 4),
+                    'p_frame': round(p, 4),
+                    'skipped': self.skipped,
+                    'latency_ms': latency_ms,
+                })
+        results.sort(key=lambda r: r['frame'])
+        return results
+
+    def events(self):
+        """Generador de líneas NDJSON, una por frame puntuado (o inválido)."""
+        reader = threading.Thread(target=self._reader, name=f"stream-{self.model_uuid[:8]}", daemon=True)
+        reader.start()
+        try:
+            while True:
+                batch = self._take()
+                if not batch:
+                    break
+                for r in self._admitted_score(batch):
+                    yield json.dumps(r) + "\n"
+        finally:
+            self._stop = True
+
+    def summary(self) -> dict:
+        final = self.smoothed_p
+        approved = final is not None and final >= self.threshold
+        return {
+            'done': True,
+            'frames_received': self.received,
+            'frames_scored': self.scored,
+            'frames_skipped': self.skipped,
+            'frames_invalid': self.invalid,
+            'frames_shed': self.shed,
+            'frames_approved': self.approved_frames,
+            'approved': bool(approved),
+            'confidence': (
+                round(float(final if approved else 1.0 - final), 4) if final is not None else None
+            ),
+            'threshold': self.threshold,
+            'error': self._error,
+        }
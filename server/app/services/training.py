@@ -1,16 +1,26 @@
 # app/services/training_service.py
 import os
 import json
-import uuid
 import time
-import threading
+import shutil
 from datetime import datetime
 
 import cv2
 import numpy as np
+from sqlalchemy import func
 
-from app.db.models import SessionLocal, Model, Sample, TrainingJob
+from app.db.models import SessionLocal, Model, Sample
 from app.db.repositories import ModelRepository, TrainingJobRepository
+from app.services.inference import LinearScorer
+from app.services.model_cache import model_meta_cache
+from app.services.artifacts import LINEAR_ARTIFACT_FILE, save_linear_artifact, load_linear_artifact
+from app.services.linear_solver import LinearSGD
+from app.services.projection import FeatureProjection
+from app.services.feature_store import FeatureStore, feature_store_enabled, get_feature_store
+from app.services.featurize import build_hog, decode_mode, featurize_paths, hog_feature
+from app.services import tuning
+from app.services.scheduler import training_scheduler
+from app.utils.images import DECODE_REDUCED
 
 
 # ---------------------- UTIL RUTAS (Windows-friendly) ---------------------- #
@@ -62,78 +72,241 @@ def to_rel_storage_path(storage_root: str, abs_path: str) -> str:
 # -------------------------------------------------------------------------- #
 
 
+class LeaseLostError(RuntimeError):
+    """El job lo reclamó otro worker (lease vencido): su resultado no se escribe."""
+
+
 class TrainingService:
     """
     Entrena un modelo binario (positive/negative) con OpenCV:
       - HOG 64x64 gris
       - SVM lineal
-    Artefactos:
-      - <STORAGE_ROOT>/models/<uuid>/artifacts/svm_hog.xml
-      - <STORAGE_ROOT>/models/<uuid>/artifacts/meta.json
+    Artefactos (versionados, nunca se sobrescriben en sitio):
+      - <STORAGE_ROOT>/models/<uuid>/artifacts/v<N>/svm_hog.xml
+      - <STORAGE_ROOT>/models/<uuid>/artifacts/v<N>/meta.json
+      - <STORAGE_ROOT>/models/<uuid>/artifacts/v<N>/model.npz  (w, b, HOG; carga rápida)
+      - <STORAGE_ROOT>/models/<uuid>/artifacts/CURRENT   (sello "v<N>")
+
+    Proyección opcional (TRAINING_PCA_DIM o 'pca_dim' en /train): PCA con
+    whitening ajustado sobre el split de train; el SVM se entrena en k dims y
+    la proyección se guarda en model.npz junto a (w, b).
     """
 
+    ARTIFACT_FILE = "svm_hog.xml"
+
     HOG_WIN_SIZE = (64, 64)
     HOG_BLOCK_SIZE = (16, 16)
     HOG_BLOCK_STRIDE = (8, 8)
     HOG_CELL_SIZE = (8, 8)
     HOG_BINS = 9
+    # Modelos nuevos se entrenan sobre el decode reducido; queda en model.npz /
+    # meta.json para que inferencia lea las imágenes igual
+    HOG_DECODE = DECODE_REDUCED
 
     @staticmethod
     def _hog_descriptor():
-        return cv2.HOGDescriptor(
-            _winSize=TrainingService.HOG_WIN_SIZE,
-            _blockSize=TrainingService.HOG_BLOCK_SIZE,
-            _blockStride=TrainingService.HOG_BLOCK_STRIDE,
-            _cellSize=TrainingService.HOG_CELL_SIZE,
-            _nbins=TrainingService.HOG_BINS,
-        )
+        return build_hog(TrainingService._hog_params())
+
+    @staticmethod
+    def _hog_params() -> dict:
+        return {
+            "win_size": TrainingService.HOG_WIN_SIZE,
+            "block_size": TrainingService.HOG_BLOCK_SIZE,
+            "block_stride": TrainingService.HOG_BLOCK_STRIDE,
+            "cell_size": TrainingService.HOG_CELL_SIZE,
+            "bins": TrainingService.HOG_BINS,
+            "decode": TrainingService.HOG_DECODE,
+        }
 
     @staticmethod
     def _extract_feature(img_path: str) -> np.ndarray | None:
         """Carga imagen, la lleva a 64x64 gris y devuelve HOG (float32)."""
-        img = cv2.imread(img_path, cv2.IMREAD_COLOR)
-        if img is None:
+        # Decode de HOG_DECODE + un HOGDescriptor reutilizado por hilo
+        return hog_feature(img_path, TrainingService._hog_params())
+
+    @staticmethod
+    def _feature_store(storage_root: str) -> FeatureStore | None:
+        """Almacén de HOG por sha256 para la configuración HOG actual (FEATURE_STORE=0 lo apaga)."""
+        if not feature_store_enabled():
             return None
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        resized = cv2.resize(gray, TrainingService.HOG_WIN_SIZE, interpolation=cv2.INTER_AREA)
-        hog = TrainingService._hog_descriptor()
-        feat = hog.compute(resized)  # (N,1)
-        return feat.reshape(-1).astype(np.float32)
+        return get_feature_store(
+            storage_root,
+            TrainingService._hog_params(),
+            TrainingService._hog_descriptor().getDescriptorSize(),
+        )
 
     @staticmethod
-    def _load_dataset(db, model_uuid: str, storage_root: str):
-        """Lee samples de la BD y construye X, y con rutas normalizadas."""
-        samples = (
-            db.query(Sample)
+    def store_sample_features(storage_root: str, sha256: str, img_path: str) -> bool:
+        """Calcula y guarda el HOG de un sample recién subido (si no estaba ya)."""
+        store = TrainingService._feature_store(storage_root)
+        if store is None or not sha256:
+            return False
+        if store.lookup([sha256])[0] >= 0:
+            return True
+        feat = TrainingService._extract_feature(resolve_storage_path(storage_root, img_path))
+        if feat is None:
+            return False
+        store.append([sha256], feat.reshape(1, -1))
+        return True
+
+    @staticmethod
+    def _query_samples(db, model_uuid: str):
+        """
+        Solo las columnas necesarias, en streaming (sin objetos ORM).
+        Devuelve (ids, y, paths, shas) en orden de id.
+        """
+        ids, labels, paths, shas = [], [], [], []
+        query = (
+            db.query(Sample.id, Sample.label, Sample.file_path, Sample.sha256)
             .filter(Sample.model_uuid == model_uuid)
             .order_by(Sample.id.asc())
-            .all()
+            .yield_per(int(os.getenv('TRAINING_QUERY_CHUNK', 5000)))
         )
+        for sample_id, label, file_path, sha256 in query:
+            ids.append(sample_id)
+            labels.append(1 if label == 'positive' else 0)
+            paths.append(file_path)
+            shas.append(sha256)
+        return np.array(ids, dtype=np.int64), np.array(labels, dtype=np.int32), paths, shas
 
-        X, y = [], []
-        n_pos, n_neg = 0, 0
+    @staticmethod
+    def _featurize_samples(storage_root: str, paths: list[str], shas: list[str | None]):
+        """
+        HOG de los samples dados en una matriz preasignada (N, D).
+        Los samples son inmutables y traen sha256: su HOG se toma del almacén
+        de features y solo se decodifican/featurizan los que no estén, en un
+        pool de procesos (TRAINING_FEATURIZE_WORKERS) que escribe directo en
+        la matriz. Devuelve (X, keep) con keep=False para archivos ilegibles.
+        """
+        n = len(paths)
+        dim = TrainingService._hog_descriptor().getDescriptorSize()
+        X = np.empty((n, dim), dtype=np.float32)
+        keep = np.ones(n, dtype=bool)
 
-        for s in samples:
-            abs_path = resolve_storage_path(storage_root, s.file_path)
-            feat = TrainingService._extract_feature(abs_path)
-            if feat is None:
-                # archivo faltante o ilegible
-                continue
-            X.append(feat)
-            if s.label == 'positive':
-                y.append(1)
-                n_pos += 1
-            else:
-                y.append(0)
-                n_neg += 1
-
-        if len(X) and isinstance(X[0], np.ndarray):
-            X = np.vstack(X).astype(np.float32)
-        else:
+        store = TrainingService._feature_store(storage_root)
+        rows = store.lookup(shas) if store is not None else np.full(n, -1, dtype=np.int64)
+
+        missing = np.flatnonzero(rows < 0)
+        if len(missing):
+            ok = featurize_paths(
+                [resolve_storage_path(storage_root, paths[i]) for i in missing],
+                TrainingService._hog_params(),
+                X,
+                rows=missing,
+            )
+            # archivo faltante o ilegible
+            keep[missing[~ok]] = False
+            if store is not None:
+                new_idx = [i for i in missing[ok] if shas[i]]
+                if new_idx:
+                    store.append([shas[i] for i in new_idx], X[new_idx])
+
+        if store is not None:
+            cached = np.flatnonzero(rows >= 0)
+            if len(cached):
+                X[cached] = store.read(rows[cached])
+        return X, keep
+
+    @staticmethod
+    def _load_dataset(db, model_uuid: str, storage_root: str):
+        """
+        Lee samples de la BD y construye X, y con rutas normalizadas.
+        Devuelve (X, y, n_pos, n_neg, max_sample_id).
+        """
+        ids, y, paths, shas = TrainingService._query_samples(db, model_uuid)
+        X, keep = TrainingService._featurize_samples(storage_root, paths, shas)
+        max_sample_id = int(ids.max()) if len(ids) else 0
+
+        if not keep.all():
+            X, y = X[keep], y[keep]
+        n_pos = int(np.sum(y == 1))
+        n_neg = int(len(y) - n_pos)
+        if not len(X):
             X = np.array([], dtype=np.float32)
+        return X, y, n_pos, n_neg, max_sample_id
 
-        y = np.array(y, dtype=np.int32)
-        return X, y, n_pos, n_neg
+    @staticmethod
+    def _pca_settings(pca_dim: int | None = None) -> tuple[int, bool, bool]:
+        """(dimensión destino (0 = sin proyección), whitening, comparar contra HOG completo)."""
+        if pca_dim is None:
+            pca_dim = int(os.getenv('TRAINING_PCA_DIM', 0))
+        whiten = os.getenv('TRAINING_PCA_WHITEN', '1').lower() in ('1', 'true', 'yes')
+        compare = os.getenv('TRAINING_PCA_COMPARE', '1').lower() in ('1', 'true', 'yes')
+        return max(0, int(pca_dim)), whiten, compare
+
+    @staticmethod
+    def _fit_linear_svm(Xtr: np.ndarray, ytr: np.ndarray, Xte: np.ndarray, yte: np.ndarray,
+                        C: float = 1.0, class_weights: np.ndarray | None = None):
+        """Entrena el SVM lineal y evalúa en test. Devuelve (svm, evaluación, segundos de train)."""
+        t0 = time.perf_counter()
+        svm = tuning.fit_svm(Xtr, ytr, C, class_weights)
+        train_s = time.perf_counter() - t0
+
+        pred = None
+        if len(yte):
+            _, pred = svm.predict(np.ascontiguousarray(Xte, dtype=np.float32))
+            pred = pred.reshape(-1).astype(np.int32)
+        return svm, TrainingService._evaluate(pred, yte), train_s
+
+    @staticmethod
+    def _evaluate(pred: np.ndarray | None, yte: np.ndarray) -> dict:
+        """Métricas de test (clase positiva = 1) a partir de las predicciones."""
+        if len(yte):
+            acc = float((pred == yte).mean())
+            tp = int(np.sum((pred == 1) & (yte == 1)))
+            tn = int(np.sum((pred == 0) & (yte == 0)))
+            fp = int(np.sum((pred == 1) & (yte == 0)))
+            fn = int(np.sum((pred == 0) & (yte == 1)))
+
+            prec = float(tp / (tp + fp)) if (tp + fp) else 0.0
+            rec  = float(tp / (tp + fn)) if (tp + fn) else 0.0
+            f1   = float(2 * prec * rec / (prec + rec)) if (prec + rec) else 0.0
+        else:
+            acc = 1.0
+            tp = tn = fp = fn = 0
+            prec = rec = f1 = 1.0
+
+        return {
+            "accuracy": acc, "precision_pos": prec, "recall_pos": rec, "f1_pos": f1,
+            "confusion_matrix": {"tp": tp, "tn": tn, "fp": fp, "fn": fn},
+        }
+
+    @staticmethod
+    def _stratified_split(y: np.ndarray, rng: np.random.Generator, train_ratio: float = 0.8,
+                          balance_train: bool = True) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Split estratificado por clase, solo con índices (no copia features).
+        Con balance_train hace downsampling de la clase mayoritaria en TRAIN.
+        Devuelve (train_idx, test_idx) barajados.
+        """
+        # --- índices por clase ---
+        pos_idx = np.where(y == 1)[0]
+        neg_idx = np.where(y == 0)[0]
+        rng.shuffle(pos_idx)
+        rng.shuffle(neg_idx)
+
+        # --- split estratificado 80/20 ---
+        sp_pos = int(train_ratio * len(pos_idx))
+        sp_neg = int(train_ratio * len(neg_idx))
+
+        train_pos = pos_idx[:sp_pos]
+        train_neg = neg_idx[:sp_neg]
+        test_pos  = pos_idx[sp_pos:]
+        test_neg  = neg_idx[sp_neg:]
+
+        # --- balanceo 1:1 en TRAIN (downsample de la mayoritaria) ---
+        if balance_train:
+            n_min = min(len(train_pos), len(train_neg))
+            if len(train_pos) > n_min:
+                train_pos = rng.choice(train_pos, size=n_min, replace=False)
+            if len(train_neg) > n_min:
+                train_neg = rng.choice(train_neg, size=n_min, replace=False)
+
+        train_idx = np.concatenate([train_pos, train_neg])
+        test_idx  = np.concatenate([test_pos, test_neg])
+        rng.shuffle(train_idx)
+        rng.shuffle(test_idx)
+        return train_idx, test_idx
 
     @staticmethod
     def _train_svm(
@@ -142,11 +315,24 @@ class TrainingService:
         rng_seed: int = 42,
         train_ratio: float = 0.8,
         balance_train: bool = True,
+        pca_dim: int = 0,
+        pca_whiten: bool = True,
+        pca_compare: bool = True,
+        tune: bool = False,
     ):
         """
         - Split 80/20 ESTRATIFICADO por clase.
         - Opcional: balancea el TRAIN a 1:1 (downsampling de la mayoritaria).
+        - Opcional (tune): k-fold CV en paralelo sobre el TRAIN para elegir C y
+          el manejo del desbalance (downsampling / pesos por clase); el test
+          queda fuera de la búsqueda. Con PCA cada fold ajusta su propia
+          proyección y la CV se hace en el espacio proyectado (el del modelo
+          final). Resultados por fold en metrics["tuning"].
+        - Opcional: PCA a 'pca_dim' dimensiones ajustado SOLO con el train
+          (con pca_compare se entrena también sobre HOG completo para reportar
+          el trade-off precisión/tiempo en metrics["projection"]).
         - Métricas: accuracy, precision/recall/F1 (clase positiva=1), matriz de confusión.
+        Devuelve (svm, metrics, projection | None).
         """
         n = len(X)
         # Fallback por dataset minúsculo o 1 sola clase (no debería suceder por checks previos)
@@ -173,183 +359,712 @@ class TrainingService:
                 "train_ratio": float(train_ratio),
                 "rng_seed": int(rng_seed),
             }
-            return svm, metrics
+            return svm, metrics, None
 
         rng = np.random.default_rng(rng_seed)
-
-        # --- índices por clase ---
-        pos_idx = np.where(y == 1)[0]
-        neg_idx = np.where(y == 0)[0]
-        rng.shuffle(pos_idx)
-        rng.shuffle(neg_idx)
-
-        # --- split estratificado 80/20 ---
-        sp_pos = int(train_ratio * len(pos_idx))
-        sp_neg = int(train_ratio * len(neg_idx))
-
-        train_pos = pos_idx[:sp_pos]
-        train_neg = neg_idx[:sp_neg]
-        test_pos  = pos_idx[sp_pos:]
-        test_neg  = neg_idx[sp_neg:]
-
-        # --- balanceo 1:1 en TRAIN (downsample de la mayoritaria) ---
-        if balance_train:
-            n_min = min(len(train_pos), len(train_neg))
-            if len(train_pos) > n_min:
-                train_pos = rng.choice(train_pos, size=n_min, replace=False)
-            if len(train_neg) > n_min:
-                train_neg = rng.choice(train_neg, size=n_min, replace=False)
-
-        train_idx = np.concatenate([train_pos, train_neg])
-        test_idx  = np.concatenate([test_pos, test_neg])
-        rng.shuffle(train_idx)
-        rng.shuffle(test_idx)
+        C, class_weight, tuning_metrics = 1.0, ("downsample" if balance_train else "none"), None
+        if tune:
+            train_idx, test_idx = TrainingService._stratified_split(y, rng, train_ratio, balance_train=False)
+            pca = None
+            if pca_dim and pca_dim < X.shape[1]:
+                pca = {"dim": int(pca_dim), "whiten": bool(pca_whiten)}
+            tuning_metrics = tuning.cross_validate(
+                X, y, train_idx, TrainingService._evaluate, rng_seed=rng_seed, pca=pca
+            )
+            if "best" in tuning_metrics:
+                C = tuning_metrics["best"]["C"]
+                class_weight = tuning_metrics["best"]["class_weight"]
+            if class_weight == "downsample":
+                train_idx = tuning.downsample(train_idx, y, rng)
+        else:
+            train_idx, test_idx = TrainingService._stratified_split(y, rng, train_ratio, balance_train)
 
         Xtr, ytr = X[train_idx], y[train_idx]
         Xte, yte = X[test_idx], y[test_idx]
 
-        # --- SVM lineal ---
-        svm = cv2.ml.SVM_create()
-        svm.setType(cv2.ml.SVM_C_SVC)
-        svm.setKernel(cv2.ml.SVM_LINEAR)
-        svm.setC(1.0)
-        svm.train(Xtr, cv2.ml.ROW_SAMPLE, ytr)
-
-        # --- Métricas ---
-        if len(yte):
-            _, pred = svm.predict(Xte)
-            pred = pred.reshape(-1).astype(np.int32)
+        # --- Proyección PCA opcional (ajustada sin ver el test) ---
+        projection = None
+        projection_metrics = None
+        if pca_dim and pca_dim < X.shape[1]:
+            t0 = time.perf_counter()
+            projection = FeatureProjection.fit(Xtr, pca_dim, whiten=pca_whiten)
+            fit_s = time.perf_counter() - t0
+            Xtr_model, Xte_model = projection.transform(Xtr), projection.transform(Xte)
+            projection_metrics = {**projection.info(), "fit_seconds": round(fit_s, 4)}
+        else:
+            Xtr_model, Xte_model = Xtr, Xte
 
-            acc = float((pred == yte).mean())
-            tp = int(np.sum((pred == 1) & (yte == 1)))
-            tn = int(np.sum((pred == 0) & (yte == 0)))
-            fp = int(np.sum((pred == 1) & (yte == 0)))
-            fn = int(np.sum((pred == 0) & (yte == 1)))
+        # --- SVM lineal + métricas ---
+        class_weights = tuning.class_weight_values(class_weight, ytr)
+        svm, ev, train_s = TrainingService._fit_linear_svm(Xtr_model, ytr, Xte_model, yte, C, class_weights)
 
-            prec = float(tp / (tp + fp)) if (tp + fp) else 0.0
-            rec  = float(tp / (tp + fn)) if (tp + fn) else 0.0
-            f1   = float(2 * prec * rec / (prec + rec)) if (prec + rec) else 0.0
-        else:
-            acc = 1.0
-            tp = tn = fp = fn = 0
-            prec = rec = f1 = 1.0
+        if projection_metrics is not None and pca_compare:
+            # Mismo split sobre HOG completo: referencia para el trade-off
+            _svm_full, ev_full, train_full_s = TrainingService._fit_linear_svm(
+                Xtr, ytr, Xte, yte, C, class_weights
+            )
+            projection_metrics["baseline"] = {
+                "n_features": int(X.shape[1]),
+                "accuracy": round(ev_full["accuracy"], 4),
+                "f1_pos": round(ev_full["f1_pos"], 4),
+                "train_seconds": round(train_full_s, 4),
+            }
+            projection_metrics["accuracy_delta"] = round(ev["accuracy"] - ev_full["accuracy"], 4)
+            projection_metrics["train_speedup"] = (
+                round(train_full_s / train_s, 2) if train_s > 0 else None
+            )
 
+        tp, tn, fp, fn = (ev["confusion_matrix"][k] for k in ("tp", "tn", "fp", "fn"))
         metrics = {
-            "algo": "opencv_svm_linear_hog64",
-            "accuracy": round(acc, 4),
-            "precision_pos": round(prec, 4),
-            "recall_pos": round(rec, 4),
-            "f1_pos": round(f1, 4),
+            "algo": "opencv_svm_linear_hog64" if projection is None else "opencv_svm_linear_hog64_pca",
+            "accuracy": round(ev["accuracy"], 4),
+            "precision_pos": round(ev["precision_pos"], 4),
+            "recall_pos": round(ev["recall_pos"], 4),
+            "f1_pos": round(ev["f1_pos"], 4),
             "n_train": int(len(ytr)),
             "n_test": int(len(yte)),
             "n_features": int(X.shape[1]) if X.ndim == 2 else 0,
+            "n_features_model": int(Xtr_model.shape[1]) if Xtr_model.ndim == 2 else 0,
+            "train_seconds": round(train_s, 4),
             "class_dist": {
                 "train": {"pos": int(np.sum(ytr == 1)), "neg": int(np.sum(ytr == 0))},
                 "test":  {"pos": int(np.sum(yte == 1)), "neg": int(np.sum(yte == 0))},
             },
             "confusion_matrix": {"tp": tp, "tn": tn, "fp": fp, "fn": fn},
             "stratified_split": True,
-            "balanced_train": bool(balance_train),
+            "balanced_train": class_weight == "downsample",
+            "class_weight": class_weight,
+            "C": float(C),
             "train_ratio": float(train_ratio),
             "rng_seed": int(rng_seed),
         }
-        return svm, metrics
+        if projection_metrics is not None:
+            metrics["projection"] = projection_metrics
+        if tuning_metrics is not None:
+            metrics["tuning"] = tuning_metrics
+        return svm, metrics, projection
 
 
     @staticmethod
-    def start_training(model_uuid: str):
+    def _artifacts_root(storage_root: str, model_uuid: str) -> str:
+        return os.path.normpath(os.path.join(storage_root, "models", model_uuid, "artifacts"))
+
+    @staticmethod
+    def _write_artifacts(storage_root: str, model_uuid: str, job_id: str, svm, metrics: dict,
+                         projection: FeatureProjection | None = None) -> str:
         """
-        Ejecuta entrenamiento real con OpenCV en un hilo de fondo.
+        Escribe svm_hog.xml + meta.json en artifacts/.staging-<job_id>/.
+        Devuelve la ruta absoluta del directorio de staging.
         """
-        job_id = str(uuid.uuid4())
+        staging_dir_abs = os.path.join(
+            TrainingService._artifacts_root(storage_root, model_uuid), f".staging-{job_id}"
+        )
+        os.makedirs(staging_dir_abs, exist_ok=True)
 
-        # Crear job y pasar modelo a "training"
-        db = SessionLocal()
+        svm.save(os.path.join(staging_dir_abs, TrainingService.ARTIFACT_FILE))
+
+        # Artefacto binario compacto (w, b, HOG) que el servicio de inferencia
+        # prefiere sobre el XML: se carga sin parser y sin meta.json
+        scorer = LinearScorer.from_svm(svm)
+        if scorer.w is not None:
+            save_linear_artifact(
+                os.path.join(staging_dir_abs, LINEAR_ARTIFACT_FILE),
+                scorer.w,
+                scorer.b,
+                TrainingService._hog_params(),
+                extra=TrainingService._artifact_extra(metrics),
+                projection=projection,
+            )
+        elif projection is not None:
+            # Sin (w, b) no hay dónde guardar un modelo proyectado servible
+            raise RuntimeError("Projected training requires a linear SVM")
+        TrainingService._write_meta(staging_dir_abs, metrics, projection)
+        return staging_dir_abs
+
+    @staticmethod
+    def _artifact_extra(metrics: dict) -> dict:
+        """Datos que una actualización incremental necesita leer de la versión base."""
+        return {
+            "algo": metrics["algo"],
+            "max_sample_id": metrics.get("max_sample_id"),
+            "updates_since_full": (metrics.get("incremental") or {}).get("updates_since_full", 0),
+        }
+
+    @staticmethod
+    def _write_meta(staging_dir_abs: str, metrics: dict, projection: FeatureProjection | None = None):
+        meta = {
+            "algo": metrics["algo"],
+            **TrainingService._hog_params(),
+            "trained_at": datetime.utcnow().isoformat() + "Z",
+            "metrics": metrics,
+        }
+        if projection is not None:
+            meta["projection"] = projection.info()
+        with open(os.path.join(staging_dir_abs, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                meta,
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+    @staticmethod
+    def _write_linear_artifacts(storage_root: str, model_uuid: str, job_id: str,
+                                w: np.ndarray, b: float, metrics: dict) -> str:
+        """
+        Staging de un modelo lineal que no viene de cv2.ml (p. ej. SGD):
+        solo model.npz + meta.json; no hay svm_hog.xml equivalente.
+        """
+        staging_dir_abs = os.path.join(
+            TrainingService._artifacts_root(storage_root, model_uuid), f".staging-{job_id}"
+        )
+        os.makedirs(staging_dir_abs, exist_ok=True)
+        save_linear_artifact(
+            os.path.join(staging_dir_abs, LINEAR_ARTIFACT_FILE),
+            w,
+            b,
+            TrainingService._hog_params(),
+            extra=TrainingService._artifact_extra(metrics),
+        )
+        TrainingService._write_meta(staging_dir_abs, metrics)
+        return staging_dir_abs
+
+    @staticmethod
+    def _publish_version(db, job_id: str, model_uuid: str, storage_root: str,
+                         staging_dir_abs: str, metrics: dict, artifact_file: str | None = None,
+                         worker_id: str | None = None) -> int:
+        """
+        Activa una versión nueva sin sobrescribir archivos en uso:
+          1) bloquea la fila del modelo (serializa publicaciones concurrentes)
+          2) cierra el job solo si sigue siendo de 'worker_id'; si no, LeaseLostError
+          3) renombra staging -> artifacts/v<N>/ (atómico en el mismo FS)
+          4) commit de version + artifact_path (el "puntero" activo)
+          5) actualiza artifacts/CURRENT (sello barato para otros procesos)
+        Los procesos que sirven detectan el cambio por Model.version y cargan
+        v<N> mientras las predicciones en curso terminan con la versión anterior.
+        """
+        artifacts_root = TrainingService._artifacts_root(storage_root, model_uuid)
+
+        mdl = db.query(Model).filter(Model.uuid == model_uuid).with_for_update().first()
+        if not mdl:
+            shutil.rmtree(staging_dir_abs, ignore_errors=True)
+            raise RuntimeError(f"Model {model_uuid} not found")
+
+        if not TrainingJobRepository.finish(db, job_id, worker_id, 'succeeded', metrics=metrics):
+            db.rollback()
+            shutil.rmtree(staging_dir_abs, ignore_errors=True)
+            raise LeaseLostError(f"Job {job_id} is no longer owned by {worker_id}")
+
+        new_version = (mdl.version or 0) + 1
+        version_dir_abs = os.path.join(artifacts_root, f"v{new_version}")
+        if os.path.isdir(version_dir_abs):
+            # Restos de una publicación que no llegó al commit
+            shutil.rmtree(version_dir_abs, ignore_errors=True)
+        os.replace(staging_dir_abs, version_dir_abs)
+
+        model_file_abs = os.path.join(version_dir_abs, artifact_file or TrainingService.ARTIFACT_FILE)
+
+        mdl.status = 'ready'
+        mdl.version = new_version
+        mdl.last_trained_at = datetime.utcnow()
+        # Guardar artifact_path RELATIVO POSIX en DB
+        mdl.artifact_path = to_rel_storage_path(storage_root, model_file_abs)
+        db.add(mdl)
+        db.commit()
+
+        # Este proceso ve la versión nueva al instante; los demás al vencer el TTL
+        model_meta_cache.invalidate(model_uuid)
+        TrainingService._write_current_stamp(artifacts_root, new_version)
+        TrainingService._prune_versions(artifacts_root, new_version)
+        return new_version
+
+    @staticmethod
+    def _write_current_stamp(artifacts_root: str, version: int):
+        tmp_path = os.path.join(artifacts_root, f".CURRENT.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(f"v{version}\n")
+        os.replace(tmp_path, os.path.join(artifacts_root, "CURRENT"))
+
+    @staticmethod
+    def _prune_versions(artifacts_root: str, active_version: int):
+        """Conserva las últimas ARTIFACT_KEEP_VERSIONS versiones (lectores en vuelo)."""
+        keep = max(1, int(os.getenv('ARTIFACT_KEEP_VERSIONS', 3)))
+        for name in os.listdir(artifacts_root):
+            if not (name.startswith("v") and name[1:].isdigit()):
+                continue
+            if int(name[1:]) <= active_version - keep:
+                shutil.rmtree(os.path.join(artifacts_root, name), ignore_errors=True)
+
+    # ---------------------- out-of-core ---------------------- #
+    OUT_OF_CORE_ALGO = "sgd_hinge_hog64"
+
+    @staticmethod
+    def _out_of_core_settings() -> dict:
+        return {
+            # Por encima de este tamaño de matriz (N x D float32) se entrena out-of-core (0 = nunca)
+            'max_in_memory_mb': float(os.getenv('TRAINING_IN_MEMORY_MAX_MB', 2048)),
+            # Filas que se featurizan/leen por tanda: acota la memoria pico
+            'chunk_rows': int(os.getenv('TRAINING_CHUNK_ROWS', 8192)),
+            'batch_size': int(os.getenv('TRAINING_SGD_BATCH', 256)),
+            'epochs': int(os.getenv('TRAINING_SGD_EPOCHS', 5)),
+            'alpha': float(os.getenv('TRAINING_SGD_ALPHA', 1e-4)),
+            'lr0': float(os.getenv('TRAINING_SGD_LR', 0.05)),
+        }
+
+    @staticmethod
+    def _use_out_of_core(db, model_uuid: str, params: dict, settings: dict) -> bool:
+        if params.get('mode') == 'out_of_core':
+            return True
+        if settings['max_in_memory_mb'] <= 0:
+            return False
+        n = db.query(func.count(Sample.id)).filter(Sample.model_uuid == model_uuid).scalar() or 0
+        dim = TrainingService._hog_descriptor().getDescriptorSize()
+        return n * dim * 4 > settings['max_in_memory_mb'] * 1024 * 1024
+
+    @staticmethod
+    def _feature_matrix(storage_root: str, scratch_dir: str, paths: list[str],
+                        shas: list[str | None], chunk_rows: int):
+        """
+        Matriz de features en disco para entrenar sin cargarla en RAM.
+        Con el almacén de features es su propio memmap (se le añaden los
+        faltantes por tandas); sin él, un memmap temporal en scratch_dir.
+        Devuelve (M, rows, keep): el sample i es la fila M[rows[i]].
+        """
+        n = len(paths)
+        dim = TrainingService._hog_descriptor().getDescriptorSize()
+        hog_params = TrainingService._hog_params()
+        keep = np.ones(n, dtype=bool)
+        chunk_rows = max(1, int(chunk_rows))
+
+        store = TrainingService._feature_store(storage_root)
+        if store is not None and all(shas):
+            rows = store.lookup(shas)
+            missing = np.flatnonzero(rows < 0)
+            buf = np.empty((min(chunk_rows, len(missing)), dim), dtype=np.float32)
+            for start in range(0, len(missing), chunk_rows):
+                part = missing[start:start + chunk_rows]
+                ok = featurize_paths(
+                    [resolve_storage_path(storage_root, paths[i]) for i in part], hog_params, buf
+                )
+                keep[part[~ok]] = False
+                good = part[ok]
+                if len(good):
+                    rows[good] = store.append([shas[i] for i in good], buf[:len(part)][ok])
+            return store.matrix(), rows, keep
+
+        os.makedirs(scratch_dir, exist_ok=True)
+        M = np.memmap(os.path.join(scratch_dir, "features.f32"), dtype=np.float32, mode="w+",
+                      shape=(max(1, n), dim))
+        for start in range(0, n, chunk_rows):
+            part = np.arange(start, min(n, start + chunk_rows))
+            ok = featurize_paths(
+                [resolve_storage_path(storage_root, paths[i]) for i in part], hog_params, M, rows=part
+            )
+            keep[part[~ok]] = False
+        M.flush()
+        return M, np.arange(n, dtype=np.int64), keep
+
+    @staticmethod
+    def _predict_rows(solver: LinearSGD, M: np.ndarray, rows: np.ndarray, chunk_rows: int) -> np.ndarray:
+        """Predicciones sobre M[rows] leyendo por tandas ordenadas."""
+        pred = np.empty(len(rows), dtype=np.int32)
+        for start in range(0, len(rows), chunk_rows):
+            part = rows[start:start + chunk_rows]
+            o = np.argsort(part, kind="stable")
+            pred[start + o] = solver.predict(M[part[o]])
+        return pred
+
+    @staticmethod
+    def _train_out_of_core(db, model_uuid: str, storage_root: str, job_id: str,
+                           settings: dict, rng_seed: int = 42, train_ratio: float = 0.8):
+        """
+        Entrenamiento para datasets que no caben en RAM: features en un memmap,
+        split estratificado por índices y SVM lineal por SGD en mini-lotes
+        (clases balanceadas con pesos en vez de downsampling). La memoria pico
+        es una tanda de featurizado + un mini-lote, sin importar N.
+        Devuelve (w, b, metrics).
+        """
+        ids, y, paths, shas = TrainingService._query_samples(db, model_uuid)
+        scratch_dir = os.path.join(TrainingService._artifacts_root(storage_root, model_uuid), f".scratch-{job_id}")
         try:
-            TrainingJobRepository.create(db, job_id, model_uuid)
-            ModelRepository.update_status(db, model_uuid, 'training')
-            db.commit()
+            t0 = time.perf_counter()
+            M, rows, keep = TrainingService._feature_matrix(
+                storage_root, scratch_dir, paths, shas, settings['chunk_rows']
+            )
+            featurize_s = time.perf_counter() - t0
+            del paths, shas
+
+            samples = np.flatnonzero(keep)
+            n_pos = int(np.sum(y[samples] == 1))
+            n_neg = int(len(samples) - n_pos)
+            if n_pos == 0 or n_neg == 0:
+                raise RuntimeError(
+                    f"Dataset insuficiente: total={len(samples)}, pos={n_pos}, neg={n_neg}"
+                )
+
+            rng = np.random.default_rng(rng_seed)
+            train_idx, test_idx = TrainingService._stratified_split(y[samples], rng, train_ratio, balance_train=False)
+            train_idx, test_idx = samples[train_idx], samples[test_idx]
+            ytr, yte = y[train_idx], y[test_idx]
+
+            solver = LinearSGD(
+                M.shape[1], alpha=settings['alpha'], lr0=settings['lr0'],
+                class_weight=LinearSGD.balanced_weights(ytr),
+            )
+            t0 = time.perf_counter()
+            solver.fit(M, y, epochs=settings['epochs'], batch_size=settings['batch_size'],
+                       rng=rng, index=train_idx, rows=rows)
+            train_s = time.perf_counter() - t0
+
+            pred = TrainingService._predict_rows(solver, M, rows[test_idx], settings['chunk_rows'])
+            ev = TrainingService._evaluate(pred if len(yte) else None, yte)
+            feature_source = "scratch" if os.path.isdir(scratch_dir) else "feature_store"
         finally:
-            db.close()
+            shutil.rmtree(scratch_dir, ignore_errors=True)
 
-        storage_root = os.getenv('STORAGE_ROOT', './storage')
+        metrics = {
+            "algo": TrainingService.OUT_OF_CORE_ALGO,
+            "accuracy": round(ev["accuracy"], 4),
+            "precision_pos": round(ev["precision_pos"], 4),
+            "recall_pos": round(ev["recall_pos"], 4),
+            "f1_pos": round(ev["f1_pos"], 4),
+            "n_train": int(len(ytr)),
+            "n_test": int(len(yte)),
+            "n_features": int(M.shape[1]),
+            "featurize_seconds": round(featurize_s, 4),
+            "train_seconds": round(train_s, 4),
+            "class_dist": {
+                "train": {"pos": int(np.sum(ytr == 1)), "neg": int(np.sum(ytr == 0))},
+                "test":  {"pos": int(np.sum(yte == 1)), "neg": int(np.sum(yte == 0))},
+            },
+            "confusion_matrix": ev["confusion_matrix"],
+            "stratified_split": True,
+            "balanced_train": "class_weight",
+            "train_ratio": float(train_ratio),
+            "rng_seed": int(rng_seed),
+            "max_sample_id": int(ids.max()) if len(ids) else 0,
+            "out_of_core": {
+                "feature_source": feature_source,
+                "chunk_rows": settings['chunk_rows'],
+                "batch_size": settings['batch_size'],
+                "epochs": settings['epochs'],
+                "alpha": settings['alpha'],
+            },
+        }
+        return solver.w, solver.b, metrics
 
-        def _worker():
-            db = SessionLocal()
-            try:
-                TrainingJobRepository.update_status(db, job_id, 'running')
-                db.commit()
+    # ---------------------- incremental ---------------------- #
+    INCREMENTAL_ALGO = "sgd_hinge_incremental_hog64"
+
+    @staticmethod
+    def _incremental_settings() -> dict:
+        return {
+            # Cada cuántas actualizaciones se fuerza un reentrenamiento completo
+            'full_every': int(os.getenv('INCREMENTAL_FULL_EVERY', 20)),
+            # Si los nuevos superan esta fracción de los ya vistos, reentrenamiento completo
+            'max_new_fraction': float(os.getenv('INCREMENTAL_MAX_NEW_FRACTION', 0.5)),
+            # Samples viejos (del almacén de features) que se repasan por cada nuevo
+            'replay_ratio': float(os.getenv('INCREMENTAL_REPLAY_RATIO', 4)),
+            'min_replay': int(os.getenv('INCREMENTAL_MIN_REPLAY', 64)),
+            'epochs': int(os.getenv('INCREMENTAL_EPOCHS', 10)),
+            'alpha': float(os.getenv('INCREMENTAL_ALPHA', 1e-3)),
+            'lr0': float(os.getenv('INCREMENTAL_LR', 0.01)),
+            # Fracción de nuevos y de repaso (estratificada) que no se entrena y mide 'accuracy'
+            'holdout': float(os.getenv('INCREMENTAL_HOLDOUT', 0.2)),
+        }
+
+    @staticmethod
+    def _incremental_base(db, model_uuid: str, storage_root: str) -> dict | None:
+        """
+        (w, b) de la versión activa y hasta qué sample se entrenó, si admite
+        actualización incremental (modelo lineal con model.npz). None si no.
+        """
+        mdl = db.query(Model).filter(Model.uuid == model_uuid).first()
+        if not mdl or not mdl.artifact_path:
+            return None
+        artifact_abs = resolve_storage_path(storage_root, mdl.artifact_path)
+        npz_abs = (
+            artifact_abs if artifact_abs.endswith(".npz")
+            else os.path.join(os.path.dirname(artifact_abs), LINEAR_ARTIFACT_FILE)
+        )
+        if not os.path.isfile(npz_abs):
+            return None
+        info = load_linear_artifact(npz_abs)
+        if info.get("max_sample_id") is None:
+            return None
+        w, b = info["w"], info["b"]
+        if info.get("projection") is not None:
+            # El modelo proyectado es lineal sobre el HOG completo: se sigue desde ahí
+            w, b = info["projection"].fold(w, b)
+        return {
+            "w": w,
+            "b": b,
+            "decode": decode_mode(info.get("hog") or {}),
+            "version": int(mdl.version or 0),
+            "max_sample_id": int(info["max_sample_id"]),
+            "updates_since_full": int(info.get("updates_since_full") or 0),
+        }
+
+    @staticmethod
+    def _train_incremental(db, model_uuid: str, storage_root: str, base: dict,
+                           settings: dict, rng_seed: int = 42):
+        """
+        Actualiza (w, b) de la versión base con SGD hinge en caliente:
+        samples nuevos (id > max_sample_id de la base) + una muestra de los
+        viejos como repaso, con la regularización anclada a los pesos base.
+        Los HOG salen del almacén de features (solo los nuevos se decodifican).
+        Como en el entrenamiento completo, 'accuracy' (y precision/recall/F1)
+        es de test: una porción estratificada por (nuevo/repaso, clase) que no
+        se entrena; un grupo con menos de 1/holdout filas no aporta al test,
+        así un puñado de samples nuevos se aprende entero. Sin test no hay
+        'accuracy'; la de las filas entrenadas queda en 'train_accuracy'.
+        Devuelve (w, b, metrics), o (None, None, motivo) si corresponde un
+        reentrenamiento completo.
+        """
+        ids, y, paths, shas = TrainingService._query_samples(db, model_uuid)
+        is_new = ids > base["max_sample_id"]
+        new_idx = np.flatnonzero(is_new)
+        old_idx = np.flatnonzero(~is_new)
+        updates = base["updates_since_full"] + 1
+
+        if len(new_idx) and not len(old_idx):
+            return None, None, "base version has no samples left"
+        if len(new_idx) > settings['max_new_fraction'] * len(old_idx):
+            return None, None, f"{len(new_idx)} new samples exceed {settings['max_new_fraction']:.0%} of {len(old_idx)}"
+        if updates > settings['full_every']:
+            return None, None, f"{base['updates_since_full']} incremental updates since last full training"
+        if base["decode"] != TrainingService.HOG_DECODE:
+            # Los pesos base esperan features de otro decode: no se pueden seguir
+            return None, None, f"base version uses '{base['decode']}' decode features"
+
+        metrics = {
+            "algo": TrainingService.INCREMENTAL_ALGO,
+            "n_features": int(len(base["w"])),
+            "max_sample_id": int(ids.max()) if len(ids) else base["max_sample_id"],
+            "incremental": {
+                "base_version": base["version"],
+                "n_new": int(len(new_idx)),
+                "n_total": int(len(ids)),
+                "updates_since_full": updates,
+            },
+        }
+        if not len(new_idx):
+            return None, None, metrics
+
+        rng = np.random.default_rng(rng_seed)
+        n_replay = min(len(old_idx), max(settings['min_replay'], int(np.ceil(settings['replay_ratio'] * len(new_idx)))))
+        replay_idx = rng.choice(old_idx, size=n_replay, replace=False)
+        sel = np.concatenate([new_idx, np.sort(replay_idx)])
+
+        X, keep = TrainingService._featurize_samples(
+            storage_root, [paths[i] for i in sel], [shas[i] for i in sel]
+        )
+        ysel = y[sel]
+        sel_new = np.arange(len(sel)) < len(new_idx)
+        if not keep.all():
+            X, ysel, sel_new = X[keep], ysel[keep], sel_new[keep]
+        if not sel_new.any():
+            raise RuntimeError("None of the new samples could be read")
+
+        # Test estratificado por (nuevo/repaso, clase); floor: grupos chicos no aportan
+        is_test = np.zeros(len(ysel), dtype=bool)
+        for group_new in (True, False):
+            for label in (0, 1):
+                members = np.flatnonzero((sel_new == group_new) & (ysel == label))
+                n_test = int(settings['holdout'] * len(members))
+                if n_test:
+                    is_test[rng.choice(members, size=n_test, replace=False)] = True
+        fit_idx = np.flatnonzero(~is_test)
+
+        solver = LinearSGD(
+            X.shape[1], alpha=settings['alpha'], lr0=settings['lr0'],
+            w=base["w"], b=base["b"], anchor=True,
+            class_weight=LinearSGD.balanced_weights(ysel),
+        )
+
+        def _acc(mask):
+            return round(float((solver.predict(X[mask]) == ysel[mask]).mean()), 4) if mask.any() else None
+
+        # Antes/después sobre las filas que se entrenan (diagnóstico del repaso)
+        train_new, train_replay = sel_new & ~is_test, ~sel_new & ~is_test
+        before_new, before_replay = _acc(train_new), _acc(train_replay)
+        t0 = time.perf_counter()
+        solver.fit(X, ysel, epochs=settings['epochs'], batch_size=64, rng=rng, index=fit_idx)
+        train_s = time.perf_counter() - t0
+
+        metrics["incremental"].update({
+            "n_replay": int((~sel_new).sum()),
+            "epochs": settings['epochs'],
+            "new_accuracy_before": before_new,
+            "new_accuracy_after": _acc(train_new),
+            "replay_accuracy_before": before_replay,
+            "replay_accuracy_after": _acc(train_replay),
+            "n_test_new": int((sel_new & is_test).sum()),
+        })
+        metrics["train_accuracy"] = _acc(~is_test)
+        if is_test.any():
+            ev = TrainingService._evaluate(solver.predict(X[is_test]), ysel[is_test])
+            metrics.update({
+                "accuracy": round(ev["accuracy"], 4),
+                "precision_pos": round(ev["precision_pos"], 4),
+                "recall_pos": round(ev["recall_pos"], 4),
+                "f1_pos": round(ev["f1_pos"], 4),
+                "confusion_matrix": ev["confusion_matrix"],
+            })
+        metrics["n_train"] = int(len(fit_idx))
+        metrics["n_test"] = int(is_test.sum())
+        metrics["train_seconds"] = round(train_s, 4)
+        return solver.w, solver.b, metrics
+
+    @staticmethod
+    def start_training(model_uuid: str, pca_dim: int | None = None,
+                       mode: str | None = None, tune: bool | None = None) -> tuple[str, bool]:
+        """
+        Encola un entrenamiento en el scheduler (pool acotado de workers).
+        pca_dim: dimensión de la proyección PCA (0 = HOG completo; None = TRAINING_PCA_DIM).
+        mode: 'full' (default), 'incremental' (actualiza la versión activa con
+        los samples nuevos; cae a completo si no es posible) u 'out_of_core'
+        (SGD sobre features en disco; 'full' pasa a este modo solo si la
+        matriz supera TRAINING_IN_MEMORY_MAX_MB).
+        tune: búsqueda de C / pesos de clase por k-fold CV (None = TRAINING_TUNE).
+        Devuelve (job_id, coalesced): coalesced=True si el modelo ya tenía un
+        job en cola y se reutilizó.
+        """
+        params = {}
+        if pca_dim is not None:
+            params['pca_dim'] = int(pca_dim)
+        if mode in ('incremental', 'out_of_core'):
+            params['mode'] = mode
+        if tune is not None:
+            params['tune'] = bool(tune)
+        return training_scheduler.submit(model_uuid, params or None)
+
+    @staticmethod
+    def run_job(job_id: str, model_uuid: str, params: dict | None = None,
+                worker_id: str | None = None) -> bool:
+        """
+        Ejecuta un job ya reclamado (status 'running') de principio a fin:
+        dataset -> SVM -> staging -> publicación. Devuelve True si terminó bien.
+        'worker_id' es quien lo reclamó: el resultado (éxito o fallo) solo se
+        escribe si el job sigue siendo suyo, igual que heartbeat().
+        """
+        params = params or {}
+        storage_root = os.getenv('STORAGE_ROOT', './storage')
+        pca_dim, pca_whiten, pca_compare = TrainingService._pca_settings(params.get('pca_dim'))
 
-                # Cargar dataset
-                X, y, n_pos, n_neg = TrainingService._load_dataset(db, model_uuid, storage_root)
-                if len(X) == 0 or n_pos == 0 or n_neg == 0:
-                    raise RuntimeError(
-                        f"Dataset insuficiente: total={len(X)}, pos={n_pos}, neg={n_neg}"
+        db = SessionLocal()
+        base = None
+        try:
+            fallback = None
+            if params.get('mode') == 'incremental':
+                base = TrainingService._incremental_base(db, model_uuid, storage_root)
+                if base is None:
+                    fallback = "no linear base version to update"
+                else:
+                    w, b, result = TrainingService._train_incremental(
+                        db, model_uuid, storage_root, base, TrainingService._incremental_settings()
                     )
+                    if w is not None:
+                        result["params"] = params
+                        staging_dir_abs = TrainingService._write_linear_artifacts(
+                            storage_root, model_uuid, job_id, w, b, result
+                        )
+                        TrainingService._publish_version(
+                            db, job_id, model_uuid, storage_root, staging_dir_abs, result,
+                            artifact_file=LINEAR_ARTIFACT_FILE, worker_id=worker_id,
+                        )
+                        return True
+                    if isinstance(result, dict):
+                        # Sin samples nuevos: la versión activa sigue vigente
+                        result["params"] = params
+                        TrainingService._finish_without_version(db, job_id, model_uuid, result, worker_id)
+                        return True
+                    fallback = result
 
-                # Entrenar
-                svm, metrics = TrainingService._train_svm(X, y)
+            ooc_settings = TrainingService._out_of_core_settings()
+            if TrainingService._use_out_of_core(db, model_uuid, params, ooc_settings):
+                w, b, metrics = TrainingService._train_out_of_core(
+                    db, model_uuid, storage_root, job_id, ooc_settings
+                )
+                if pca_dim:
+                    metrics["pca_ignored"] = pca_dim
+                if params:
+                    metrics["params"] = params
+                if fallback:
+                    metrics["incremental_fallback"] = fallback
+                staging_dir_abs = TrainingService._write_linear_artifacts(
+                    storage_root, model_uuid, job_id, w, b, metrics
+                )
+                TrainingService._publish_version(
+                    db, job_id, model_uuid, storage_root, staging_dir_abs, metrics,
+                    artifact_file=LINEAR_ARTIFACT_FILE, worker_id=worker_id,
+                )
+                return True
 
-                # Guardar artefactos (RUTAS WINDOWS-FRIENDLY)
-                artifacts_dir_abs = os.path.normpath(
-                    os.path.join(storage_root, "models", model_uuid, "artifacts")
+            # Cargar dataset
+            X, y, n_pos, n_neg, max_sample_id = TrainingService._load_dataset(db, model_uuid, storage_root)
+            if len(X) == 0 or n_pos == 0 or n_neg == 0:
+                raise RuntimeError(
+                    f"Dataset insuficiente: total={len(X)}, pos={n_pos}, neg={n_neg}"
                 )
-                os.makedirs(artifacts_dir_abs, exist_ok=True)
-
-                model_file_abs = os.path.join(artifacts_dir_abs, "svm_hog.xml")
-                meta_file_abs = os.path.join(artifacts_dir_abs, "meta.json")
-
-                svm.save(model_file_abs)
-                with open(meta_file_abs, "w", encoding="utf-8") as f:
-                    json.dump(
-                        {
-                            "algo": metrics["algo"],
-                            "win_size": TrainingService.HOG_WIN_SIZE,
-                            "block_size": TrainingService.HOG_BLOCK_SIZE,
-                            "block_stride": TrainingService.HOG_BLOCK_STRIDE,
-                            "cell_size": TrainingService.HOG_CELL_SIZE,
-                            "bins": TrainingService.HOG_BINS,
-                            "trained_at": datetime.utcnow().isoformat() + "Z",
-                            "metrics": metrics,
-                        },
-                        f,
-                        ensure_ascii=False,
-                        indent=2,
-                    )
 
-                # Actualizar job y modelo
-                tj = db.query(TrainingJob).get(job_id)
-                if tj:
-                    tj.status = 'succeeded'
-                    tj.finished_at = datetime.utcnow()
-                    tj.metrics = metrics
-                    db.add(tj)
-
-                mdl = db.query(Model).get(model_uuid)
-                if mdl:
-                    mdl.status = 'ready'
-                    mdl.version = (mdl.version or 0) + 1
-                    mdl.last_trained_at = datetime.utcnow()
-                    # Guardar artifact_path RELATIVO POSIX en DB
-                    mdl.artifact_path = to_rel_storage_path(storage_root, model_file_abs)
-                    db.add(mdl)
+            # Entrenar
+            tune = params.get('tune')
+            if tune is None:
+                tune = os.getenv('TRAINING_TUNE', '0').lower() in ('1', 'true', 'yes')
+            svm, metrics, projection = TrainingService._train_svm(
+                X, y, pca_dim=pca_dim, pca_whiten=pca_whiten, pca_compare=pca_compare, tune=bool(tune)
+            )
+            metrics["max_sample_id"] = max_sample_id
+            if params:
+                metrics["params"] = params
+            if fallback:
+                metrics["incremental_fallback"] = fallback
 
-                db.commit()
+            # Escribir artefactos en un directorio de staging (nadie lo lee aún)
+            staging_dir_abs = TrainingService._write_artifacts(
+                storage_root, model_uuid, job_id, svm, metrics, projection
+            )
 
-            except Exception as e:
-                try:
-                    TrainingJobRepository.update_status(db, job_id, 'failed', str(e))
-                    ModelRepository.update_status(db, model_uuid, 'failed')
-                    db.commit()
-                except Exception:
-                    db.rollback()
-                finally:
-                    print(f"[TRAIN][{job_id}] ERROR: {e}")
-            finally:
-                db.close()
+            # Publicar: rename atómico a artifacts/v<N>/ + flip del puntero en BD
+            TrainingService._publish_version(
+                db, job_id, model_uuid, storage_root, staging_dir_abs, metrics, worker_id=worker_id
+            )
+            return True
 
-        t = threading.Thread(target=_worker, name=f"train-{model_uuid[:8]}")
-        t.daemon = True
-        t.start()
+        except LeaseLostError as e:
+            # Otro worker tiene el job: ni el job ni el modelo son nuestros
+            print(f"[TRAIN][{job_id}] {e}; result discarded")
+            return False
+        except Exception as e:
+            shutil.rmtree(
+                os.path.join(TrainingService._artifacts_root(storage_root, model_uuid), f".staging-{job_id}"),
+                ignore_errors=True,
+            )
+            try:
+                db.rollback()
+                if TrainingJobRepository.finish(db, job_id, worker_id, 'failed', error_message=str(e)):
+                    # Una actualización incremental fallida deja servir la versión base
+                    ModelRepository.update_status(db, model_uuid, 'ready' if base is not None else 'failed')
+                db.commit()
+            except Exception:
+                db.rollback()
+            finally:
+                print(f"[TRAIN][{job_id}] ERROR: {e}")
+            return False
+        finally:
+            db.close()
 
-        return job_id
+    @staticmethod
+    def _finish_without_version(db, job_id: str, model_uuid: str, metrics: dict,
+                                worker_id: str | None = None):
+        """Cierra el job como exitoso sin publicar versión (nada que actualizar)."""
+        if not TrainingJobRepository.finish(db, job_id, worker_id, 'succeeded', metrics=metrics):
+            db.rollback()
+            raise LeaseLostError(f"Job {job_id} is no longer owned by {worker_id}")
+        mdl = db.query(Model).filter(Model.uuid == model_uuid).first()
+        if mdl:
+            mdl.status = 'ready'
+            db.add(mdl)
+        db.commit()
+        model_meta_cache.invalidate(model_uuid)
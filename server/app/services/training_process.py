@@ -0,0 +1,150 @@
+# app/services/training_process.py
+import os
+import sys
+import time
+import multiprocessing
+from datetime import datetime
+from typing import Callable
+
+from app.db import models as db_models
+from app.db.repositories import TrainingJobRepository
+
+
+def _parse_cpu_list(spec: str) -> set[int] | None:
+    """'0,2-3' -> {0, 2, 3}. Vacío -> None (sin restricción)."""
+    cpus: set[int] = set()
+    for part in (spec or "").replace(" ", "").split(","):
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-", 1)
+            cpus.update(range(int(lo), int(hi) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus or None
+
+
+def cpu_limits_from_env() -> dict:
+    """
+    Presupuesto de CPU del proceso de entrenamiento:
+      TRAINING_CV_THREADS    hilos internos de OpenCV (cv2.setNumThreads)
+      TRAINING_NICE          incremento de niceness (prioridad menor que el API)
+      TRAINING_CPU_AFFINITY  CPUs permitidas, p. ej. "2-3" (solo Linux)
+    """
+    return {
+        'cv_threads': int(os.getenv('TRAINING_CV_THREADS', 1)),
+        'nice': int(os.getenv('TRAINING_NICE', 10)),
+        'affinity': os.getenv('TRAINING_CPU_AFFINITY', ''),
+    }
+
+
+def apply_cpu_limits(limits: dict):
+    """Aplica el presupuesto al proceso actual (lo heredan sus hijos)."""
+    import cv2
+
+    affinity = _parse_cpu_list(limits.get('affinity', ''))
+    if affinity and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, affinity)
+        except OSError as e:
+            print(f"[TRAIN] affinity {sorted(affinity)} not applied: {e}")
+    nice = int(limits.get('nice', 0))
+    if nice > 0 and hasattr(os, 'nice'):
+        try:
+            os.nice(nice)
+        except OSError as e:
+            print(f"[TRAIN] nice {nice} not applied: {e}")
+    cv2.setNumThreads(max(0, int(limits.get('cv_threads', 1))))
+
+
+def _child_main(job_id: str, model_uuid: str, params: dict | None, limits: dict,
+                worker_id: str | None = None):
+    """Punto de entrada del proceso hijo: BD propia, límites de CPU y run_job."""
+    apply_cpu_limits(limits)
+    db_models.init_db()
+    # Se importa después de init_db: training enlaza SessionLocal al importarse
+    from app.services.training import TrainingService
+
+    ok = TrainingService.run_job(job_id, model_uuid, params, worker_id=worker_id)
+    sys.exit(0 if ok else 1)
+
+
+def _stop(proc):
+    proc.terminate()
+    proc.join(10)
+    if proc.is_alive():
+        proc.kill()
+        proc.join()
+
+
+def run_training_process(job_id: str, model_uuid: str, params: dict | None = None,
+                         limits: dict | None = None, timeout_s: float | None = None,
+                         heartbeat: Callable[[], bool] | None = None,
+                         heartbeat_interval: float = 10.0, lease_seconds: float | None = None,
+                         worker_id: str | None = None) -> bool:
+    """
+    Ejecuta un job (ya reclamado) en un proceso aparte y espera a que termine.
+    El hijo escribe métricas/estado en training_jobs y publica la versión; si
+    muere sin hacerlo (OOM, señal, timeout) el job se marca fallido aquí; el
+    modelo también, salvo que tenga una versión publicada (sigue 'ready').
+    'heartbeat' se llama cada 'heartbeat_interval' s mientras el hijo corre; si
+    devuelve False (el lease lo tiene otro worker) el hijo se detiene sin tocar el job.
+    Si falla (BD caída) se reintenta, pero pasados 'lease_seconds' desde la
+    última renovación el lease ya venció y otro worker puede tenerlo: el hijo
+    también se detiene.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    proc = ctx.Process(
+        target=_child_main,
+        args=(job_id, model_uuid, params, limits or cpu_limits_from_env(), worker_id),
+        name=f"train-{job_id[:8]}",
+    )
+    proc.start()
+    deadline = time.monotonic() + timeout_s if timeout_s else None
+    last_ok = time.monotonic()
+    reason = None
+    while True:
+        wait_s = heartbeat_interval if heartbeat is not None else None
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.monotonic())
+            wait_s = remaining if wait_s is None else min(wait_s, remaining)
+        proc.join(wait_s)
+        if not proc.is_alive():
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            _stop(proc)
+            reason = f"Training timed out after {int(timeout_s)}s"
+            break
+        if heartbeat is not None:
+            try:
+                alive = heartbeat()
+                if alive:
+                    last_ok = time.monotonic()
+            except Exception as e:
+                # Error transitorio de BD: se reintenta en el próximo tick mientras
+                # el último lease renovado siga vigente
+                print(f"[TRAIN][{job_id}] heartbeat error: {e}")
+                alive = not lease_seconds or time.monotonic() - last_ok < lease_seconds
+            if not alive:
+                _stop(proc)
+                print(f"[TRAIN][{job_id}] lease lost, training process stopped")
+                return False
+
+    if reason is None:
+        reason = f"Training process exited with code {proc.exitcode}"
+
+    ok = proc.exitcode == 0
+    db = db_models.SessionLocal()
+    try:
+        # Solo si sigue siendo nuestro (otro worker pudo reclamarlo tras vencer el lease)
+        if not ok and TrainingJobRepository.finish(db, job_id, worker_id, 'failed', error_message=reason):
+            model = db.get(db_models.Model, model_uuid)
+            if model is not None:
+                # Con una versión publicada el modelo la sigue sirviendo
+                model.status = 'ready' if model.artifact_path else 'failed'
+                model.updated_at = datetime.utcnow()
+            db.commit()
+            print(f"[TRAIN][{job_id}] ERROR: {reason}")
+    finally:
+        db.close()
+    return ok
@@ -0,0 +1,109 @@
+# app/services/training_worker.py
+import os
+import socket
+import threading
+
+from app.db import models as db_models
+from app.db.repositories import TrainingJobRepository
+from app.services.training_process import run_training_process
+
+
+class TrainingWorker:
+    """
+    Worker de entrenamiento independiente del API (ver server/worker.py).
+    Reclama jobs 'queued' de training_jobs con FOR UPDATE SKIP LOCKED, los
+    ejecuta en un proceso hijo con presupuesto de CPU y renueva su lease con
+    heartbeats. Si un worker muere, su lease vence y otro reclama el job.
+
+    Los artefactos se publican en STORAGE_ROOT (debe ser el mismo montaje
+    compartido que usa el API): staging -> rename atómico a v<N> -> flip de
+    Model.version en la BD. El API ve la versión nueva al vencer su cache de metadatos.
+    """
+
+    def __init__(self, worker_id: str | None = None, concurrency: int = 1,
+                 lease_seconds: float | None = None, heartbeat_seconds: float | None = None,
+                 poll_seconds: float | None = None, max_attempts: int | None = None):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.concurrency = max(1, int(concurrency))
+        self.lease_seconds = float(lease_seconds or os.getenv('TRAINING_LEASE_SECONDS', 60))
+        self.heartbeat_seconds = float(heartbeat_seconds or os.getenv('TRAINING_HEARTBEAT_SECONDS', 10))
+        self.poll_seconds = float(poll_seconds or os.getenv('TRAINING_POLL_SECONDS', 2))
+        self.max_attempts = int(max_attempts or os.getenv('TRAINING_MAX_ATTEMPTS', 3))
+        self.timeout_s = float(os.getenv('TRAINING_JOB_TIMEOUT', 0)) or None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    def stop(self):
+        """Deja de reclamar jobs; los que están corriendo terminan."""
+        self._stop.set()
+
+    def claim(self):
+        db = db_models.SessionLocal()
+        try:
+            job = TrainingJobRepository.claim_next(
+                db, self.worker_id, self.lease_seconds, self.max_attempts
+            )
+            if job is None:
+                return None
+            params = job.metrics.get('params') if isinstance(job.metrics, dict) else None
+            return job.id, job.model_uuid, params
+        finally:
+            db.close()
+
+    def _heartbeat(self, job_id: str) -> bool:
+        db = db_models.SessionLocal()
+        try:
+            return TrainingJobRepository.heartbeat(db, job_id, self.worker_id, self.lease_seconds)
+        finally:
+            db.close()
+
+    def run_one(self) -> bool | None:
+        """Reclama y ejecuta un job. None si no había ninguno disponible."""
+        claimed = self.claim()
+        if claimed is None:
+            return None
+        job_id, model_uuid, params = claimed
+        print(f"[WORKER {self.worker_id}] job {job_id} (model {model_uuid})")
+        ok = run_training_process(
+            job_id, model_uuid, params,
+            timeout_s=self.timeout_s,
+            heartbeat=lambda: self._heartbeat(job_id),
+            heartbeat_interval=self.heartbeat_seconds,
+            lease_seconds=self.lease_seconds,
+            worker_id=self.worker_id,
+        )
+        with self._lock:
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+        return ok
+
+    def _loop(self, once: bool):
+        while not self._stop.is_set():
+            try:
+                result = self.run_one()
+            except Exception as e:
+                # BD caída u otro error transitorio: no matar el worker
+                print(f"[WORKER {self.worker_id}] error: {e}")
+                result = None
+            if result is None:
+                if once:
+                    return
+                self._stop.wait(self.poll_seconds)
+
+    def run(self, once: bool = False):
+        """
+        Corre 'concurrency' bucles de reclamo/ejecución hasta stop().
+        once=True: procesa lo que haya en cola y termina.
+        """
+        threads = [
+            threading.Thread(target=self._loop, args=(once,), name=f"worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
@@ -0,0 +1,213 @@
+# app/services/tuning.py
+import os
+import shutil
+import tempfile
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from app.services.featurize import available_cpus
+from app.services.projection import FeatureProjection
+
+# Matriz compartida por los procesos worker (memmap de solo lectura)
+_shared: dict = {}
+
+CLASS_WEIGHT_MODES = ("downsample", "balanced", "none")
+
+
+def tuning_settings() -> dict:
+    """
+    Grilla y paralelismo de la búsqueda de hiperparámetros:
+      TRAINING_TUNE_C              valores de C, p. ej. "0.01,0.1,1,10"
+      TRAINING_TUNE_CLASS_WEIGHTS  downsample (1:1 como hoy), balanced (pesos por clase), none
+      TRAINING_TUNE_FOLDS          k del k-fold estratificado
+      TRAINING_TUNE_WORKERS        procesos (0 = CPUs disponibles)
+    """
+    c_grid = [float(c) for c in os.getenv('TRAINING_TUNE_C', '0.01,0.1,1,10').split(',') if c.strip()]
+    weights = [
+        w.strip() for w in os.getenv('TRAINING_TUNE_CLASS_WEIGHTS', 'downsample,balanced').split(',')
+        if w.strip() in CLASS_WEIGHT_MODES
+    ]
+    return {
+        'c_grid': c_grid or [1.0],
+        'class_weights': weights or ['downsample'],
+        'folds': int(os.getenv('TRAINING_TUNE_FOLDS', 5)),
+        'workers': int(os.getenv('TRAINING_TUNE_WORKERS', 0)),
+    }
+
+
+def class_weight_values(mode: str, y: np.ndarray) -> np.ndarray | None:
+    """Pesos [clase 0, clase 1] para SVM::setClassWeights (None = sin pesos)."""
+    if mode != "balanced":
+        return None
+    n_pos = int(np.sum(y == 1))
+    n_neg = int(len(y) - n_pos)
+    if not n_pos or not n_neg:
+        return None
+    return np.array([len(y) / (2.0 * n_neg), len(y) / (2.0 * n_pos)], dtype=np.float64)
+
+
+def downsample(idx: np.ndarray, y: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Subconjunto de 'idx' con las clases 1:1 (downsampling de la mayoritaria)."""
+    pos = idx[y[idx] == 1]
+    neg = idx[y[idx] == 0]
+    n_min = min(len(pos), len(neg))
+    if len(pos) > n_min:
+        pos = rng.choice(pos, size=n_min, replace=False)
+    if len(neg) > n_min:
+        neg = rng.choice(neg, size=n_min, replace=False)
+    out = np.concatenate([pos, neg])
+    rng.shuffle(out)
+    return out
+
+
+def fit_svm(X: np.ndarray, y: np.ndarray, C: float = 1.0, class_weights: np.ndarray | None = None):
+    """SVM lineal C-SVC de OpenCV (mismo setup que el entrenamiento)."""
+    svm = cv2.ml.SVM_create()
+    svm.setType(cv2.ml.SVM_C_SVC)
+    svm.setKernel(cv2.ml.SVM_LINEAR)
+    svm.setC(float(C))
+    if class_weights is not None:
+        svm.setClassWeights(class_weights)
+    svm.train(np.ascontiguousarray(X, dtype=np.float32), cv2.ml.ROW_SAMPLE, np.asarray(y, dtype=np.int32))
+    return svm
+
+
+def stratified_folds(idx: np.ndarray, y: np.ndarray, k: int, rng: np.random.Generator) -> list[np.ndarray]:
+    """Reparte 'idx' en k folds con la misma proporción de clases."""
+    folds: list[list[np.ndarray]] = [[] for _ in range(k)]
+    for label in (0, 1):
+        members = idx[y[idx] == label]
+        rng.shuffle(members)
+        for f, part in enumerate(np.array_split(members, k)):
+            folds[f].append(part)
+    return [np.concatenate(parts) for parts in folds]
+
+
+def _init_worker(matrix_path: str, y: np.ndarray):
+    # Un hilo de OpenCV por proceso: el paralelismo lo da el pool
+    cv2.setNumThreads(1)
+    _shared["X"] = np.load(matrix_path, mmap_mode="r")
+    _shared["y"] = y
+
+
+def _fit_fold(X: np.ndarray, y: np.ndarray, train_idx: np.ndarray, val_idx: np.ndarray,
+              C: float, class_weights: np.ndarray | None, pca: dict | None = None):
+    rows = np.sort(train_idx)
+    Xtr, Xva = X[rows], X[val_idx]
+    t0 = time.perf_counter()
+    if pca:
+        # PCA ajustado solo con el train del fold, como en el entrenamiento final
+        projection = FeatureProjection.fit(Xtr, pca['dim'], whiten=pca['whiten'])
+        Xtr, Xva = projection.transform(Xtr), projection.transform(Xva)
+    svm = fit_svm(Xtr, y[rows], C, class_weights)
+    train_s = time.perf_counter() - t0
+    _, pred = svm.predict(np.ascontiguousarray(Xva, dtype=np.float32))
+    return pred.reshape(-1).astype(np.int32), train_s
+
+
+def _run_fold(task_id: int, train_idx: np.ndarray, val_idx: np.ndarray, C: float,
+              class_weights: np.ndarray | None, pca: dict | None = None):
+    return (task_id, *_fit_fold(_shared["X"], _shared["y"], train_idx, val_idx, C, class_weights, pca))
+
+
+def cross_validate(X: np.ndarray, y: np.ndarray, idx: np.ndarray, evaluate,
+                   settings: dict | None = None, rng_seed: int = 42,
+                   pca: dict | None = None) -> dict:
+    """
+    k-fold estratificado sobre las filas 'idx' de X para cada (C, class_weight)
+    de la grilla. Todas las combinaciones (config, fold) se reparten en un pool
+    de procesos que lee la misma matriz (un .npy en memmap, sin copiarla por
+    tarea). 'evaluate(pred, y_val)' devuelve las métricas de un fold.
+    Con 'pca' ({'dim', 'whiten'}) cada tarea ajusta la proyección sobre su
+    train y valida en ese espacio: C se elige para el modelo que se publica.
+    Devuelve el resumen con métricas por fold y la mejor configuración
+    (mayor F1 medio; desempata accuracy y luego el C más chico).
+    """
+    settings = settings or tuning_settings()
+    rng = np.random.default_rng(rng_seed)
+    idx = np.asarray(idx, dtype=np.int64)
+    n_min = min(int(np.sum(y[idx] == 1)), int(np.sum(y[idx] == 0)))
+    k = min(int(settings['folds']), n_min)
+    if k < 2:
+        return {"skipped": f"not enough samples per class for {settings['folds']}-fold CV"}
+
+    folds = stratified_folds(idx, y, k, rng)
+    configs = [(C, cw) for cw in settings['class_weights'] for C in settings['c_grid']]
+    tasks = []
+    for ci, (C, cw) in enumerate(configs):
+        for f in range(k):
+            train_idx = np.concatenate([folds[j] for j in range(k) if j != f])
+            if cw == "downsample":
+                train_idx = downsample(train_idx, y, rng)
+            tasks.append((len(tasks), ci, f, train_idx, folds[f], C, class_weight_values(cw, y[train_idx])))
+
+    workers = settings['workers'] or available_cpus()
+    workers = max(1, min(int(workers), len(tasks)))
+    t0 = time.perf_counter()
+    results = {}
+    if workers == 1:
+        for task_id, _ci, _f, tr, va, C, w in tasks:
+            results[task_id] = _fit_fold(X, y, tr, va, C, w, pca)
+    else:
+        tmp_dir = tempfile.mkdtemp(prefix="svm-cv-")
+        try:
+            matrix_path = os.path.join(tmp_dir, "X.npy")
+            np.save(matrix_path, np.ascontiguousarray(X, dtype=np.float32))
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                     initializer=_init_worker, initargs=(matrix_path, y)) as pool:
+                futures = [
+                    pool.submit(_run_fold, task_id, tr, va, C, w, pca)
+                    for task_id, _ci, _f, tr, va, C, w in tasks
+                ]
+                for fut in as_completed(futures):
+                    task_id, pred, train_s = fut.result()
+                    results[task_id] = (pred, train_s)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    wall_s = time.perf_counter() - t0
+
+    summary = []
+    for ci, (C, cw) in enumerate(configs):
+        fold_metrics = []
+        for task_id, t_ci, f, tr, va, _C, _w in tasks:
+            if t_ci != ci:
+                continue
+            pred, train_s = results[task_id]
+            ev = evaluate(pred, y[va])
+            fold_metrics.append({
+                "fold": f,
+                "accuracy": round(ev["accuracy"], 4),
+                "f1_pos": round(ev["f1_pos"], 4),
+                "n_train": int(len(tr)),
+                "n_val": int(len(va)),
+                "train_seconds": round(train_s, 4),
+            })
+        f1s = np.array([m["f1_pos"] for m in fold_metrics])
+        accs = np.array([m["accuracy"] for m in fold_metrics])
+        summary.append({
+            "C": C,
+            "class_weight": cw,
+            "mean_f1": round(float(f1s.mean()), 4),
+            "std_f1": round(float(f1s.std()), 4),
+            "mean_accuracy": round(float(accs.mean()), 4),
+            "folds": fold_metrics,
+        })
+
+    best = max(summary, key=lambda r: (r["mean_f1"], r["mean_accuracy"], -r["C"]))
+    cpu_s = sum(train_s for _pred, train_s in results.values())
+    return {
+        "k": k,
+        "grid": {"C": settings['c_grid'], "class_weight": settings['class_weights']},
+        "feature_space": f"pca{pca['dim']}" if pca else "hog",
+        "workers": workers,
+        "wall_seconds": round(wall_s, 4),
+        "fit_seconds_total": round(cpu_s, 4),
+        "results": summary,
+        "best": {"C": best["C"], "class_weight": best["class_weight"],
+                 "mean_f1": best["mean_f1"], "mean_accuracy": best["mean_accuracy"]},
+    }
@@ -1,10 +1,11 @@
 from flask import jsonify
 
 class APIError(Exception):
-    def __init__(self, message, code=400, details=None):
+    def __init__(self, message, code=400, details=None, headers=None):
         self.message = message
         self.code = code
         self.details = details or {}
+        self.headers = headers or {}
         super().__init__(self.message)
 
 def register_error_handlers(app):
@@ -15,7 +16,7 @@ def register_error_handlers(app):
             'message': error.message,
             'details': error.details
         }
-        return jsonify(response), error.code
+        return jsonify(response), error.code, error.headers
     
     @app.errorhandler(404)
     def handle_not_found(error):
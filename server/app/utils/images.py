@@ -0,0 +1,243 @@
+import struct
+
+import cv2
+import numpy as np
+
+# Bytes leídos de disco para buscar dimensiones (APP1/EXIF de JPEG cabe en 64 KB)
+HEADER_PROBE_BYTES = 64 * 1024
+
+# Factores de decode reducido de OpenCV (libjpeg escala en el IDCT: no decodifica full-res)
+_REDUCED_MODES = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+# Cómo se decodifica una imagen antes del HOG. Es parte de la definición de
+# las features: un modelo se sirve con el mismo modo con que se entrenó
+# ('decode' en model.npz / meta.json; sin el campo = DECODE_FULL).
+DECODE_FULL = "full"             # color a resolución completa + cvtColor (modelos previos)
+DECODE_REDUCED = "reduced_gray"  # gris con IMREAD_REDUCED_GRAYSCALE_{2,4,8} según la cabecera
+
+# Marcadores SOF de JPEG (baseline, progresivo, etc.; excluye DHT/JPG/DAC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_size(buf) -> tuple[int, int] | None:
+    i, n = 2, len(buf)
+    while i + 9 <= n:
+        if buf[i] != 0xFF:
+            return None
+        marker = buf[i + 1]
+        if marker == 0xFF:  # relleno
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        seg_len = struct.unpack(">H", bytes(buf[i + 2:i + 4]))[0]
+        if marker in _JPEG_SOF:
+            h, w = struct.unpack(">HH", bytes(buf[i + 5:i + 9]))
+            return w, h
+        i += 2 + seg_len
+    return None
+
+
+def sniff_dimensions(buf) -> tuple[int, int] | None:
+    """
+    (ancho, alto) leyendo solo la cabecera de JPEG / PNG / WebP.
+    Devuelve None si el formato no se reconoce o la cabecera está incompleta.
+    """
+    head = bytes(buf[:32])
+    if head[:8] == b"\x89PNG\r\n\x1a\n" and len(head) >= 24:
+        w, h = struct.unpack(">II", head[16:24])
+        return w, h
+    if head[:2] == b"\xff\xd8":
+        return _jpeg_size(buf)
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP" and len(head) >= 30:
+        chunk = head[12:16]
+        if chunk == b"VP8 ":
+            w, h = struct.unpack("<HH", head[26:30])
+            return w & 0x3FFF, h & 0x3FFF
+        if chunk == b"VP8L":
+            b0, b1, b2, b3 = head[21:25]
+            w = 1 + (((b1 & 0x3F) << 8) | b0)
+            h = 1 + (((b3 & 0x0F) << 10) | (b2 << 2) | ((b1 & 0xC0) >> 6))
+            return w, h
+        if chunk == b"VP8X":
+            w = 1 + int.from_bytes(head[24:27], "little")
+            h = 1 + int.from_bytes(head[27:30], "little")
+            return w, h
+    return None
+
+
+def reduced_gray_mode(size: tuple[int, int] | None, target: tuple[int, int]) -> int:
+    """
+    Modo de lectura gris más reducido que siga siendo >= target en ambos ejes.
+    Sin dimensiones conocidas se decodifica gris a resolución completa.
+    """
+    if size:
+        w, h = size
+        tw, th = target
+        for factor, mode in _REDUCED_MODES:
+            if w // factor >= tw and h // factor >= th:
+                return mode
+    return cv2.IMREAD_GRAYSCALE
+
+
+def load_gray(image, target: tuple[int, int] | None = None,
+              decode: str = DECODE_REDUCED) -> np.ndarray | None:
+    """
+    Carga una imagen en gris desde una ruta o un buffer en memoria.
+    Con DECODE_REDUCED y 'target' (p. ej. la ventana HOG) se elige el decode
+    reducido adecuado a partir de la cabecera, para no materializar el bitmap
+    completo. DECODE_FULL reproduce la lectura original (color a resolución
+    completa + cvtColor): el HOG resultante difiere ~3% del reducido.
+    Devuelve None si no se puede leer/decodificar.
+    """
+    if decode == DECODE_FULL:
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            img = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+        else:
+            img = cv2.imread(image, cv2.IMREAD_COLOR)
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img is not None else None
+
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        mode = reduced_gray_mode(sniff_dimensions(image), target) if target else cv2.IMREAD_GRAYSCALE
+        return cv2.imdecode(np.frombuffer(image, dtype=np.uint8), mode)
+
+    mode = cv2.IMREAD_GRAYSCALE
+    if target:
+        try:
+            with open(image, "rb") as f:
+                head = f.read(HEADER_PROBE_BYTES)
+        except OSError:
+            return None
+        mode = reduced_gray_mode(sniff_dimensions(head), target)
+    return cv2.imread(image, mode)
+
+
+class JpegFrameSplitter:
+    """
+    Separa frames JPEG de un flujo de bytes: MJPEG (multipart/x-mixed-replace)
+    o JPEGs concatenados. Sigue la estructura del JPEG en vez de buscar
+    FFD8/FFD9 en crudo (pueden aparecer dentro de APPn/EXIF, COM, DQT, DHT):
+      - tras el SOI cada segmento se salta por su longitud de 2 bytes (la
+        miniatura EXIF queda dentro del APP1 y no se confunde con un frame)
+      - después del SOS se recorren los datos entrópicos hasta el EOI,
+        ignorando FF00 (byte relleno) y RSTn; otro marcador vuelve a
+        segmentos (JPEG progresivo)
+      - un SOI en el límite de un segmento (frame truncado sin EOI) descarta
+        el frame incompleto y se resincroniza en el nuevo
+    """
+
+    _SEEK, _SEGMENTS, _ENTROPY = 0, 1, 2
+
+    def __init__(self, max_frame_bytes: int = 10 * 1024 * 1024):
+        self.max_frame_bytes = int(max_frame_bytes)
+        self._buf = bytearray()
+        self._pos = 0         # siguiente posición a examinar
+        self._start = -1      # inicio (SOI) del frame actual
+        self._state = self._SEEK
+        self.dropped = 0      # frames truncados/corruptos descartados
+
+    def _resync(self, from_pos: int):
+        """Abandona el frame actual y vuelve a buscar un SOI desde from_pos."""
+        self._start = -1
+        self._state = self._SEEK
+        self._pos = from_pos
+        self.dropped += 1
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        """Agrega bytes y devuelve los frames completos encontrados (en orden)."""
+        self._buf += chunk
+        frames = []
+        buf = self._buf
+        n = len(buf)
+        while True:
+            i = self._pos
+            if self._state == self._SEEK:
+                i = buf.find(b"\xff\xd8", i)
+                if i < 0:
+                    # Un 0xFF final puede ser la mitad de un SOI
+                    self._pos = max(self._pos, n - 1)
+                    break
+                self._start = i
+                self._pos = i + 2
+                self._state = self._SEGMENTS
+
+            elif self._state == self._SEGMENTS:
+                # Bytes de relleno 0xFF antes del marcador
+                while i < n and buf[i] == 0xFF and i + 1 < n and buf[i + 1] == 0xFF:
+                    i += 1
+                if i + 1 >= n:
+                    self._pos = i
+                    break
+                if buf[i] != 0xFF:
+                    # No hay marcador donde debía: frame corrupto
+                    self._resync(self._start + 2)
+                    continue
+                m = buf[i + 1]
+                if m == 0xD8:
+                    self._resync(i)
+                    continue
+                if m == 0xD9:
+                    frames.append(bytes(buf[self._start:i + 2]))
+                    self._start = -1
+                    self._state = self._SEEK
+                    self._pos = i + 2
+                    continue
+                if 0xD0 <= m <= 0xD7 or m == 0x01:
+                    self._pos = i + 2  # marcadores sin longitud
+                    continue
+                if i + 3 >= n:
+                    self._pos = i
+                    break
+                length = (buf[i + 2] << 8) | buf[i + 3]
+                if length < 2:
+                    self._resync(self._start + 2)
+                    continue
+                self._pos = i + 2 + length
+                if m == 0xDA:
+                    self._state = self._ENTROPY
+                if self._pos > n:
+                    break
+
+            else:  # _ENTROPY
+                i = buf.find(b"\xff", i)
+                if i < 0 or i + 1 >= n:
+                    self._pos = n - 1 if i >= 0 else n
+                    break
+                m = buf[i + 1]
+                if m == 0x00 or 0xD0 <= m <= 0xD7:
+                    self._pos = i + 2
+                elif m == 0xFF:
+                    self._pos = i + 1
+                elif m == 0xD9:
+                    frames.append(bytes(buf[self._start:i + 2]))
+                    self._start = -1
+                    self._state = self._SEEK
+                    self._pos = i + 2
+                elif m == 0xD8:
+                    # Frame truncado (sin EOI): se descarta y empieza el siguiente
+                    self._resync(i)
+                else:
+                    self._state = self._SEGMENTS
+                    self._pos = i
+
+        # Descarta lo ya consumido (cabeceras multipart, frames emitidos)
+        keep_from = self._start if self._start >= 0 else min(self._pos, n)
+        if keep_from > 0:
+            del buf[:keep_from]
+            self._pos -= keep_from
+            if self._start >= 0:
+                self._start = 0
+
+        if self._start >= 0 and len(buf) > self.max_frame_bytes:
+            # Frame demasiado grande o flujo corrupto: se descarta y se resincroniza
+            buf.clear()
+            self._pos = 0
+            self._start = -1
+            self._state = self._SEEK
+            raise ValueError(f"Frame exceeds {self.max_frame_bytes} bytes")
+        return frames
@@ -1,7 +1,10 @@
 import os
 from app import create_app
 
-app = create_app()
+# Los procesos worker (spawn) reimportan este script como '__mp_main__':
+# no deben levantar otra app (BD, monitores, warm-up)
+if __name__ != '__mp_main__':
+    app = create_app()
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
@@ -0,0 +1,37 @@
+import os
+import signal
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.db.models import init_db
+from app.services.training_worker import TrainingWorker
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker de entrenamiento: reclama jobs de training_jobs')
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('TRAINING_WORKER_CONCURRENCY', 1)),
+                        help='jobs en paralelo en este worker')
+    parser.add_argument('--worker-id', default=os.getenv('TRAINING_WORKER_ID'),
+                        help='identificador (por defecto host:pid)')
+    parser.add_argument('--once', action='store_true',
+                        help='procesa los jobs en cola y termina')
+    args = parser.parse_args()
+
+    init_db()
+    worker = TrainingWorker(worker_id=args.worker_id, concurrency=args.concurrency)
+
+    def _shutdown(signum, _frame):
+        print(f"[WORKER {worker.worker_id}] signal {signum}: finishing running jobs")
+        worker.stop()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    print(f"[WORKER {worker.worker_id}] started (concurrency={worker.concurrency})")
+    worker.run(once=args.once)
+
+
+if __name__ == '__main__':
+    main()